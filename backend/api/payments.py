@@ -7,6 +7,7 @@ from fastapi import APIRouter, Request, HTTPException
 from typing import Dict, Any
 import logging
 from backend.services.supabase_service import supabase_service
+from backend.services.inventory_service import inventory_service
 from backend.services.whatsapp_service import whatsapp_service
 
 logger = logging.getLogger(__name__)
@@ -32,9 +33,21 @@ async def paylink_payment_callback(request: Request):
         if "status" not in body or "transaction_id" not in body:
             raise HTTPException(status_code=400, detail="Invalid payload")
 
+        # Settle the stock hold first: checkouts from the chat hold stock
+        # against the PayLink transaction ID without creating an order row
+        paid = body["status"] == "success"
+        settled = 0
+        try:
+            settled = await inventory_service.settle(body["transaction_id"], paid=paid)
+        except Exception as e:
+            logger.error(f"❌ Stock hold settlement failed for {body['transaction_id']}: {e}")
+
         # Get order by transaction_id
         order = await supabase_service.get_order_by_transaction_id(body["transaction_id"])
         if not order:
+            if settled:
+                logger.info(f"💳 Payment {body['transaction_id']} settled {settled} stock hold(s), no order row")
+                return {"status": "received"}
             raise HTTPException(status_code=404, detail="Order not found")
 
         # Update order status in database
@@ -46,7 +59,7 @@ async def paylink_payment_callback(request: Request):
             raise HTTPException(status_code=404, detail="Customer not found")
 
         # Send WhatsApp confirmation to customer
-        if body["status"] == "success":
+        if paid:
             message = f"Your payment for order {order['id']} was successful. Thank you for your purchase!"
         else:
             message = f"Your payment for order {order['id']} failed. Please try again."
@@ -54,6 +67,8 @@ async def paylink_payment_callback(request: Request):
         
         return {"status": "received"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Payment callback error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
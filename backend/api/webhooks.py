@@ -4,23 +4,34 @@ WhatsApp Webhook Handler - Receives messages from Twilio
 
 from fastapi import APIRouter, Form, Request
 from fastapi.responses import Response
-from typing import Optional
+from typing import Optional, Dict, Any, List
 from backend.models.schemas import WhatsAppMessage
 from backend.services.supabase_service import supabase_service
 from backend.services.whatsapp_service import whatsapp_service
+from backend.orchestrator.dispatcher import webhook_dispatcher
 
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 # Default boutique ID (will be dynamic in production with multi-tenancy)
 DEFAULT_BOUTIQUE_ID = os.getenv("BOUTIQUE_ID", "550e8400-e29b-41d4-a716-446655440000")
 
+# Sent when the queue is full: Twilio does not redeliver inbound messages, so the
+# customer is asked to send theirs again instead of it being silently dropped
+BUSY_REPLY = "Sorry, we're getting a lot of messages right now 🙏 Please send your message again in a minute."
+
 @router.post("/whatsapp")
 async def whatsapp_webhook(request: Request):
     """
     Webhook endpoint for incoming WhatsApp messages from Twilio
     Uses the new deterministic Orchestrator instead of LangGraph
+    
+    In async mode (WEBHOOK_ASYNC_MODE=true) the message is validated, queued and
+    acknowledged immediately; background workers run the orchestrator and reply.
     """
     
     # Debug logging to file
@@ -30,29 +41,23 @@ async def whatsapp_webhook(request: Request):
         f.write(f"{'='*60}\n")
     
     try:
-        # Use new orchestrator handler
-        from backend.orchestrator.message_handler import handle_whatsapp_message
+        form_data = dict(await request.form())
         
-        # Process message
-        result = await handle_whatsapp_message(request)
-        
-        # Log result
-        with open("webhook_debug.log", "a", encoding="utf-8") as f:
-            f.write(f"🤖 Orchestrator Response: {result}\n")
-        
-        # Send response via WhatsApp
-        # The orchestrator returns the response text, we need to send it via Twilio service
-        if result.get('response'):
-            # Extract phone number from request form data again
-            form_data = await request.form()
-            from_number = form_data.get("From")
+        # Ack-first mode: enqueue and answer Twilio right away
+        if webhook_dispatcher.enabled and webhook_dispatcher.running:
+            if not form_data.get("From"):
+                logger.warning("⚠️ Webhook payload without From number, ignoring")
+                return Response(content="", status_code=200)
+            
+            # Messages from the same customer to the same boutique are processed in order
+            from backend.orchestrator.message_handler import get_conversation_key
+            if not webhook_dispatcher.submit(form_data, key=get_conversation_key(form_data)):
+                # Queue is full - shed the work but tell the customer, and still ack Twilio
+                await whatsapp_service.send_message(to_number=form_data["From"], message=BUSY_REPLY)
             
-            # Send message
-            await whatsapp_service.send_message(
-                to_number=from_number,
-                message=result['response'],
-                media_urls=result.get('images', [])[:1] if result.get('images') else None
-            )
+            return Response(content="", status_code=200)
+        
+        await process_and_reply([form_data])
         
         # Twilio expects empty 200 response
         return Response(content="", status_code=200)
@@ -72,6 +77,37 @@ async def whatsapp_webhook(request: Request):
         # Still return 200 to Twilio to avoid retries
         return Response(content="", status_code=200)
 
+async def process_and_reply(batch: List[Dict[str, Any]]):
+    """
+    Run the orchestrator for inbound message(s) and send the reply via Twilio.
+    Called inline by the webhook or by the background dispatcher workers, which
+    may pass several coalesced messages from the same conversation.
+    """
+    # Use new orchestrator handler
+    from backend.orchestrator.message_handler import process_inbound_messages
+    
+    # Process message
+    form_data = batch[-1]
+    
+    async def send_partial_reply(text: str):
+        # Streaming mode: the first sentence goes out while the rest is generated
+        await whatsapp_service.send_message(to_number=form_data.get("From"), message=text)
+    
+    result = await process_inbound_messages(batch, on_partial_reply=send_partial_reply)
+    
+    # Log result
+    with open("webhook_debug.log", "a", encoding="utf-8") as f:
+        f.write(f"🤖 Orchestrator Response: {result}\n")
+    
+    # Send response via WhatsApp
+    # The orchestrator returns the response text, we need to send it via Twilio service
+    if result.get('response'):
+        await whatsapp_service.send_message(
+            to_number=form_data.get("From"),
+            message=result['response'],
+            media_urls=result.get('images', [])[:1] if result.get('images') else None
+        )
+
 @router.get("/whatsapp")
 async def whatsapp_webhook_get():
     """GET endpoint for webhook verification"""
@@ -0,0 +1,36 @@
+"""
+Backfill Product Embeddings
+Computes Gemini embeddings for active products whose embedding column is empty,
+so they become visible to semantic search (match_products).
+
+Usage:
+    python -m backend.backfill_embeddings [boutique_id]
+"""
+
+import asyncio
+import sys
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from backend.services.product_retrieval_service import product_retrieval_service
+from backend.services.supabase_service import supabase_service
+
+async def main(boutique_id: str = None):
+    """Run the backfill for one boutique, or all boutiques"""
+    scope = f"boutique {boutique_id}" if boutique_id else "all boutiques"
+    print(f"🧮 Backfilling product embeddings for {scope}...")
+    
+    try:
+        totals = await product_retrieval_service.backfill_embeddings(boutique_id=boutique_id)
+    finally:
+        await supabase_service.close()
+    
+    print(f"✅ Embedded: {totals['embedded']}")
+    if totals["failed"]:
+        print(f"❌ Failed: {totals['failed']} (re-run to retry)")
+    return totals
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else None))
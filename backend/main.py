@@ -45,10 +45,40 @@ async def lifespan(app: FastAPI):
     print(f"Environment: {settings.environment}")
     print(f"Region: africa-south1 (Johannesburg)")
     
+    # Shared Gemini client
+    from backend.services.llm_gateway import llm_gateway
+    llm_gateway.configure()
+    
+    # Background webhook workers (ack-first mode)
+    from backend.orchestrator.dispatcher import webhook_dispatcher
+    from backend.api.webhooks import process_and_reply
+    if webhook_dispatcher.enabled:
+        await webhook_dispatcher.start(process_and_reply)
+    
+    # Cache invalidation for AI settings edited from the dashboard
+    from backend.services.ai_settings_service import ai_settings_service
+    await ai_settings_service.start_change_listener()
+    
+    # WhatsApp number -> boutique routing table
+    from backend.services.boutique_directory import boutique_directory
+    await boutique_directory.start()
+    
+    # Releases stock held by checkouts that were never paid
+    from backend.services.inventory_service import inventory_service
+    await inventory_service.start()
+    
     yield
     
     # Shutdown
     print("👋 Shutting down gracefully...")
+    await webhook_dispatcher.stop()
+    await ai_settings_service.stop_change_listener()
+    await boutique_directory.stop()
+    await inventory_service.stop()
+    from backend.services.conversation_summary import conversation_summary_service
+    await conversation_summary_service.drain()
+    from backend.services.supabase_service import supabase_service
+    await supabase_service.close()
 
 # Create FastAPI app
 app = FastAPI(
@@ -113,7 +143,8 @@ async def view_all_conversations():
         from backend.services.supabase_service import supabase_service
         
         # Query the checkpoints table directly
-        response = await supabase_service.client.table("checkpoints").select("thread_id, created_at, metadata").execute()
+        query = supabase_service.client.table("checkpoints").select("thread_id, created_at, metadata")
+        response = await supabase_service.execute(query)
         
         # Group by thread_id to get unique conversations
         conversations = {}
@@ -133,6 +164,50 @@ async def view_all_conversations():
     except Exception as e:
         return {"error": str(e)}
 
+# Runtime metrics endpoint
+@app.get("/debug/metrics")
+async def view_metrics():
+    """Debug endpoint exposing in-process queue and cache metrics"""
+    from backend.orchestrator.dispatcher import webhook_dispatcher
+    from backend.services.ai_settings_service import ai_settings_service
+    from backend.services.boutique_directory import boutique_directory
+    from backend.services.catalog_service import catalog_service
+    from backend.services.vector_index import vector_index_service
+    from backend.services.keyword_index import keyword_index_service
+    from backend.services.llm_gateway import llm_gateway
+    from backend.services.response_cache import response_cache
+    from backend.orchestrator.message_handler import reply_stats
+    from backend.orchestrator.structured_output import output_stats
+    from backend.services.model_router import model_router
+    from backend.orchestrator.fast_path import fast_path
+    from backend.orchestrator.context_builder import prompt_stats
+    from backend.orchestrator.prompt_prefix import prompt_prefix_cache
+    from backend.orchestrator.tool_executor import tool_executor
+    from backend.orchestrator.agent_loop import agent_loop
+    from backend.services.conversation_summary import conversation_summary_service
+    from backend.services.inventory_service import inventory_service
+    
+    return {
+        "webhook_queue": webhook_dispatcher.stats(),
+        "ai_settings_cache": ai_settings_service.stats(),
+        "boutique_directory": boutique_directory.stats(),
+        "catalog": catalog_service.stats(),
+        "vector_index": vector_index_service.stats(),
+        "keyword_index": keyword_index_service.stats(),
+        "llm": llm_gateway.stats(),
+        "response_cache": response_cache.stats(),
+        "replies": reply_stats(),
+        "llm_output": output_stats(),
+        "model_router": model_router.stats(),
+        "fast_path": fast_path.stats(),
+        "prompt": prompt_stats(),
+        "prompt_prefix": prompt_prefix_cache.stats(),
+        "tools": tool_executor.stats(),
+        "agent_loop": agent_loop.stats(),
+        "conversation_summary": conversation_summary_service.stats(),
+        "inventory": inventory_service.stats()
+    }
+
 # Temporary test route for the AI agent
 from backend.agents.ai_agent import BoutiqueAIAgent
 import os
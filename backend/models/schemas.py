@@ -2,7 +2,7 @@
 Pydantic models for the Fashion Boutique AI Agent
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 from typing import List, Optional, Dict, Any, Literal
 from datetime import datetime
 
@@ -79,6 +79,109 @@ class AgentState(BaseModel):
     # Metadata
     created_at: datetime = Field(default_factory=datetime.now)
 
+# =====================================================
+# LLM OUTPUT MODELS
+# =====================================================
+
+class LLMAction(BaseModel):
+    """Tool call requested by the LLM"""
+    tool: str
+    params: Dict[str, Any] = Field(default_factory=dict)
+    
+    @field_validator("params", mode="before")
+    @classmethod
+    def params_default(cls, value):
+        return value or {}
+
+class LLMReply(BaseModel):
+    """Structured reply returned by the orchestrator LLM"""
+    reply_text: str
+    actions: List[LLMAction] = Field(default_factory=list)
+    intent: str = "unknown"
+    entities: Dict[str, Any] = Field(default_factory=dict)
+    
+    @field_validator("actions", mode="before")
+    @classmethod
+    def drop_malformed_actions(cls, value):
+        """Keep the well-formed actions instead of rejecting the whole reply"""
+        if not isinstance(value, list):
+            return []
+        return [
+            action for action in value
+            if isinstance(action, dict) and isinstance(action.get("tool"), str) and action["tool"]
+            and isinstance(action.get("params") or {}, dict)
+        ]
+    
+    @field_validator("intent", mode="before")
+    @classmethod
+    def intent_default(cls, value):
+        return value if isinstance(value, str) and value else "unknown"
+    
+    @field_validator("entities", mode="before")
+    @classmethod
+    def entities_default(cls, value):
+        return value if isinstance(value, dict) else {}
+
+# =====================================================
+# TOOL ARGUMENT MODELS
+# =====================================================
+
+class ToolArgs(BaseModel):
+    """
+    Arguments the LLM may pass to a tool. Field descriptions become the Gemini
+    function declarations and the prompt's tool manifest. Scope fields
+    (conversation_id, boutique_id, customer_id) come from the webhook and are
+    not part of these models.
+    """
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+
+class GetInventoryArgs(ToolArgs):
+    """Check stock, sizes and colours for one product"""
+    product_id: Optional[str] = Field(None, description="Product ID from the product list")
+    product_name: Optional[str] = Field(None, min_length=2, description="Product name if the ID is unknown")
+    
+    @model_validator(mode="after")
+    def product_required(self):
+        if not self.product_id and not self.product_name:
+            raise ValueError("product_id or product_name is required")
+        return self
+
+class SearchProductsArgs(ToolArgs):
+    """Search the boutique's products by meaning and keywords"""
+    query: str = Field(..., min_length=1, max_length=200, description="What the customer is looking for")
+    category: Optional[str] = Field(None, description="Product category")
+    min_price: Optional[float] = Field(None, ge=0, description="Minimum price in KES")
+    max_price: Optional[float] = Field(None, ge=0, description="Maximum price in KES")
+    limit: int = Field(5, ge=1, le=10, description="Number of products to return")
+
+class SearchProductsByImageArgs(ToolArgs):
+    """Find products that look like the customer's photo"""
+    image_url: str = Field(..., pattern=r"^https?://", description="URL of the customer's image")
+    limit: int = Field(5, ge=1, le=10, description="Number of products to return")
+
+class AddToCartArgs(ToolArgs):
+    """Add a product to the customer's cart"""
+    product_id: str = Field(..., min_length=1, description="Product ID from the product list")
+    quantity: int = Field(1, ge=1, le=20, description="Number of items")
+    size: Optional[str] = Field(None, description="Chosen size")
+    color: Optional[str] = Field(None, description="Chosen colour")
+
+class GetCartArgs(ToolArgs):
+    """Show the customer's cart"""
+
+class InitiateMpesaStkArgs(ToolArgs):
+    """Send an M-Pesa payment prompt to the customer's phone"""
+    phone: str = Field(..., pattern=r"^\+?\d{9,15}$", description="M-Pesa phone number, e.g. 254712345678")
+    amount: float = Field(..., gt=0, le=500000, description="Amount in KES")
+
+class GetOrderStatusArgs(ToolArgs):
+    """Status of the customer's latest order, or of a specific order"""
+    order_number: Optional[str] = Field(None, description="Order number, e.g. ORD-1042")
+
+class GetCustomerProfileArgs(ToolArgs):
+    """Basic profile of the customer"""
+    phone: str = Field(..., pattern=r"^\+?\d{9,15}$", description="Customer phone number")
+
 # =====================================================
 # PRODUCT MODELS
 # =====================================================
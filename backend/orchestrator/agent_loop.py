@@ -0,0 +1,189 @@
+"""
+Agent Loop - Feed tool results back to the model within one turn
+The first reply is generated before any tool data exists. When it asks for
+read-only tools (stock, search, cart, order status), the loop runs them,
+appends compact results to the prompt and asks the model for the final reply,
+repeating up to a step cap and within a per-turn latency budget. Identical
+tool calls are executed once per turn. Replies that only request mutations
+(add to cart, payment) are final as they are: the tools still run, but the
+customer does not wait for another model call.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.orchestrator.llm_client import generate_response
+from backend.orchestrator.tool_executor import ToolExecutor, scoped_calls, tool_executor
+
+logger = logging.getLogger(__name__)
+
+FOLLOW_UP_INSTRUCTIONS = """Write the final reply to the customer using these tool results.
+Only request more actions if you still need data that is not shown above; never repeat an
+action that already has a result. Return JSON in the same format."""
+
+# Fields that cost tokens without helping the reply
+_DROP_FIELDS = {
+    "embedding", "image_urls", "created_at", "updated_at", "boutique_id", "conversation_id",
+    "customer_id", "metadata", "attrs", "search_vector", "is_active",
+}
+
+
+def compact(value: Any, max_items: int = 5, max_chars: int = 200) -> Any:
+    """Shrink a tool result for the prompt: drop bulky fields, cap lists and strings"""
+    if isinstance(value, dict):
+        return {k: compact(v, max_items, max_chars) for k, v in value.items() if k not in _DROP_FIELDS and v is not None}
+    if isinstance(value, list):
+        return [compact(v, max_items, max_chars) for v in value[:max_items]]
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + "…"
+    return value
+
+
+class AgentLoop:
+    """
+    Multi-step tool use for orchestrator replies.
+
+    Configuration (environment):
+        AGENT_LOOP_ENABLED: "false" runs tools after the reply without feeding results back
+        AGENT_LOOP_MAX_STEPS: Follow-up model calls per turn
+        AGENT_LOOP_BUDGET_MS: Latency budget for tools and follow-up calls in one turn
+        AGENT_LOOP_RESULT_CHARS: Longest a single tool result may be in the prompt
+    """
+
+    def __init__(self, executor: ToolExecutor):
+        self.executor = executor
+        self.enabled = os.getenv("AGENT_LOOP_ENABLED", "true").lower() == "true"
+        self.max_steps = int(os.getenv("AGENT_LOOP_MAX_STEPS", "2"))
+        self.budget_ms = float(os.getenv("AGENT_LOOP_BUDGET_MS", "8000"))
+        self.result_chars = int(os.getenv("AGENT_LOOP_RESULT_CHARS", "800"))
+        self.metrics: Dict[str, float] = {
+            "turns": 0,
+            "follow_ups": 0,
+            "cached_tool_calls": 0,
+            "budget_exhausted": 0,
+            "step_cap_reached": 0,
+            "total_turn_ms": 0.0,
+        }
+
+    async def run(
+        self,
+        prompt: str,
+        response: Dict[str, Any],
+        scope: Dict[str, Any],
+        model: Optional[str] = None,
+        cached_content: Any = None
+    ) -> Tuple[Dict[str, Any], List[Any], bool]:
+        """
+        Execute the reply's actions and refine the reply with their results
+
+        Args:
+            prompt: Prompt that produced response
+            response: Parsed LLM reply (reply_text, actions, intent, entities)
+            scope: conversation_id, boutique_id and customer_id for tool calls
+            model: Model used for follow-up calls
+            cached_content: Gemini context cache of the prompt prefix, if any
+
+        Returns:
+            (final reply with every executed action, tool results in execution
+            order, whether the reply text was replaced by a follow-up)
+        """
+        started = time.perf_counter()
+        deadline = started + self.budget_ms / 1000
+        turn_cache: Dict[str, Any] = {}
+        executed: List[Dict[str, Any]] = []
+        results: List[Any] = []
+        transcript: List[str] = []
+        final, replaced, steps = response, False, 0
+        self.metrics["turns"] += 1
+
+        actions = response.get("actions") or []
+        while actions:
+            step_results = await self._execute(actions, scope, turn_cache)
+            new = [(a, r) for a, (r, cached) in zip(actions, step_results) if not cached]
+            executed.extend(a for a, _ in new)
+            results.extend(r for _, r in new)
+            transcript.extend(self._result_line(a, r) for a, r in new)
+
+            if not new or not any(self.executor.registry.is_read_only(a.get("tool")) for a, _ in new):
+                break
+            if steps >= self.max_steps:
+                self.metrics["step_cap_reached"] += 1
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                self.metrics["budget_exhausted"] += 1
+                break
+
+            steps += 1
+            self.metrics["follow_ups"] += 1
+            follow_up = f"{prompt}\nTOOL RESULTS:\n" + "\n".join(transcript) + f"\n\n{FOLLOW_UP_INSTRUCTIONS}\n"
+            try:
+                candidate = await asyncio.wait_for(
+                    generate_response(follow_up, model=model, cached_content=cached_content),
+                    timeout=remaining
+                )
+            except asyncio.TimeoutError:
+                self.metrics["budget_exhausted"] += 1
+                logger.warning(f"⏱️ Agent loop follow-up exceeded the {self.budget_ms:.0f}ms budget")
+                break
+            if not isinstance(candidate, dict) or candidate.get("intent") == "error":
+                break
+            final, replaced = candidate, True
+            actions = candidate.get("actions") or []
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.metrics["total_turn_ms"] += elapsed_ms
+        if steps:
+            logger.info(f"🔁 Agent loop: {steps} follow-up(s), {len(executed)} tool call(s) in {elapsed_ms:.0f}ms")
+        return {**final, "actions": executed}, results, replaced
+
+    async def _execute(
+        self,
+        actions: List[Dict[str, Any]],
+        scope: Dict[str, Any],
+        turn_cache: Dict[str, Any]
+    ) -> List[Tuple[Any, bool]]:
+        """(result, served from the turn cache) per action"""
+        calls = scoped_calls(actions, scope)
+        keys = [f"{name}:{json.dumps(params, sort_keys=True, default=str)}" for name, params in calls]
+
+        pending: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        for key, call in zip(keys, calls):
+            if key not in turn_cache:
+                pending.setdefault(key, call)
+        fresh = dict(zip(pending, await self.executor.run(list(pending.values()))))
+        turn_cache.update(fresh)
+
+        self.metrics["cached_tool_calls"] += len(keys) - len(fresh)
+        outcomes, seen = [], set()
+        for key in keys:
+            cached = key not in fresh or key in seen
+            seen.add(key)
+            outcomes.append((turn_cache[key], cached))
+        return outcomes
+
+    def _result_line(self, action: Dict[str, Any], result: Any) -> str:
+        text = json.dumps(compact(result), default=str, ensure_ascii=False)
+        if len(text) > self.result_chars:
+            text = text[:self.result_chars] + "…"
+        params = json.dumps(action.get("params") or {}, default=str, ensure_ascii=False)
+        return f"- {action.get('tool')}({params}) -> {text}"
+
+    def stats(self) -> Dict[str, Any]:
+        """Agent loop metrics"""
+        turns = self.metrics["turns"]
+        return {
+            "enabled": self.enabled,
+            "max_steps": self.max_steps,
+            "budget_ms": self.budget_ms,
+            "avg_turn_ms": round(self.metrics["total_turn_ms"] / turns, 1) if turns else 0.0,
+            **self.metrics,
+        }
+
+
+# Global instance
+agent_loop = AgentLoop(tool_executor)
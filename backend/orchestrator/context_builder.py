@@ -1,21 +1,111 @@
 """
 Context Builder - Dynamic Prompt Construction
 Fetches AI settings from database and builds LLM prompts
+
+The prompt is assembled from sections (system prompt, tone, conversation
+summary, history, inventory, message, instructions) under a token budget:
+fixed sections always go in, the conversation summary replaces turns that
+have aged out, and the remaining budget is filled with inventory and then the
+newest history turns. The fixed sections form a prefix that is compiled once
+per boutique settings version (see prompt_prefix.py); only the suffix is built
+per message.
 """
 
-from typing import Dict, Any
 import logging
+import os
+from typing import Any, Dict, List, Tuple
+
 from backend.services.ai_settings_service import ai_settings_service
+from backend.services.conversation_summary import unsummarized
+from backend.orchestrator.prompt_prefix import estimate_tokens, prompt_prefix_cache
 
 logger = logging.getLogger(__name__)
 
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2000"))
+PROMPT_MESSAGE_TOKENS = int(os.getenv("PROMPT_MESSAGE_TOKENS", "200"))  # per history message
+PROMPT_INVENTORY_TOKENS = int(os.getenv("PROMPT_INVENTORY_TOKENS", "400"))
+
+SECTIONS = ("system", "tone", "summary", "history", "inventory", "message", "instructions")
+
+# Running token totals per section (see prompt_stats)
+prompt_metrics: Dict[str, Any] = {
+    "prompts": 0,
+    "over_budget": 0,
+    "history_turns_dropped": 0,
+    "tokens": {section: 0 for section in SECTIONS},
+}
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, keeping whole words"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    kept, used = [], 0
+    for word in text.split():
+        used += estimate_tokens(word)
+        if used > max_tokens:
+            break
+        kept.append(word)
+    return " ".join(kept) + " …"
+
+
+def fit_history(history: List[Dict[str, Any]], budget: int) -> Tuple[str, int]:
+    """
+    Newest-first history lines that fit the budget
+
+    Returns:
+        (history section text, number of turns left out)
+    """
+    lines: List[str] = []
+    used = estimate_tokens("\n\nRECENT CONVERSATION:\n")
+    for msg in reversed(history):
+        role = msg.get("role", "unknown")
+        content = truncate_to_tokens(msg.get("content", "") or "", PROMPT_MESSAGE_TOKENS)
+        line = f"{role.upper()}: {content}\n"
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return "", len(history)
+    return "\n\nRECENT CONVERSATION:\n" + "".join(reversed(lines)), len(history) - len(lines)
+
+
+def fit_inventory(inventory: List[Dict[str, Any]], budget: int) -> str:
+    """Most relevant products first, as many as fit the budget (at most 10)"""
+    header = "\n\nAVAILABLE PRODUCTS:\n"
+    text, used = "", estimate_tokens(header)
+    for product in inventory[:10]:
+        line = f"- {product.get('name', '')} (KES {product.get('price', 0)})\n"
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        text += line
+        used += cost
+    return header + text if text else ""
+
+
+def without_current_message(history: List[Dict[str, Any]], current_message: str) -> List[Dict[str, Any]]:
+    """Drop the trailing customer messages already shown as the current message"""
+    end = len(history)
+    while end and history[end - 1].get("role") == "customer" \
+            and (history[end - 1].get("content") or "") in current_message:
+        end -= 1
+    return history[:end]
+
+
 async def build_prompt(context: Dict[str, Any]) -> str:
     """
     Build dynamic LLM prompt with AI settings from database
-    
+
     Args:
         context: Dict containing business_id, history, inventory, current_message, etc.
-    
+            May include pre-loaded ai_settings to skip the settings query, the
+            conversation row whose rolling summary replaces older turns, the
+            compiled prefix, and cached_content when that prefix is held in a
+            Gemini context cache (the prompt then carries only the suffix).
+
     Returns:
         Formatted prompt string for LLM
     """
@@ -24,58 +114,83 @@ async def build_prompt(context: Dict[str, Any]) -> str:
         history = context.get("history", [])
         inventory = context.get("inventory", [])
         current_message = context.get("current_message", "")
+        conversation = context.get("conversation") or {}
         has_image = context.get("has_image", False)
-        
-        # Fetch AI settings from database
-        logger.info(f"Fetching AI settings for boutique: {business_id}")
-        ai_settings = ai_settings_service.get_ai_settings(business_id)
-        
-        if not ai_settings:
-            logger.warning(f"No AI settings found, using defaults")
-            system_prompt = "You are a helpful fashion sales assistant."
-            tone = "friendly"
-        else:
-            system_prompt = ai_settings.get("system_prompt", "")
-            tone = ai_settings.get("tone", "friendly")
-            logger.info(f"Using AI settings version {ai_settings.get('prompt_version')}")
-        
-        # Build conversation history
-        history_text = ""
-        if history:
-            history_text = "\n\nRECENT CONVERSATION:\n"
-            for msg in history[-8:]:
-                role = msg.get("role", "unknown")
-                content = msg.get("content", "")
-                history_text += f"{role.upper()}: {content}\n"
-        
-        # Build inventory
-        inventory_text = ""
-        if inventory:
-            inventory_text = "\n\nAVAILABLE PRODUCTS:\n"
-            for product in inventory[:10]:
-                name = product.get("name", "")
-                price = product.get("price", 0)
-                inventory_text += f"- {name} (KES {price})\n"
-        
-        # Combine into final prompt
-        full_prompt = f"""{system_prompt}
-
-TONE: {tone.upper()}
+
+        prefix = context.get("prefix")
+        if prefix is None:
+            # Use AI settings loaded with the conversation, otherwise fetch from database
+            if "ai_settings" in context:
+                ai_settings = context["ai_settings"]
+            else:
+                logger.info(f"Fetching AI settings for boutique: {business_id}")
+                ai_settings = await ai_settings_service.get_ai_settings(business_id)
+
+            if not ai_settings:
+                logger.warning(f"No AI settings found, using defaults")
+            prefix = prompt_prefix_cache.get(business_id, ai_settings, context.get("model"))
+        logger.info(f"Using AI settings version {prefix.key[1]}")
+
+        # The compiled prefix (system prompt, tone, instructions) always goes in
+        message_text = f"CURRENT CUSTOMER MESSAGE:\n{current_message}"
+        tokens = dict(prefix.tokens)
+        tokens["message"] = estimate_tokens(message_text)
+        remaining = PROMPT_TOKEN_BUDGET - sum(tokens.values())
+
+        # Turns older than the summary watermark are represented by the summary
+        summary_text = ""
+        if conversation.get("summary"):
+            summary_text = f"\n\nCONVERSATION SO FAR:\n{conversation['summary']}"
+        tokens["summary"] = estimate_tokens(summary_text)
+        remaining -= tokens["summary"]
+
+        # Inventory before history: grounding product facts matter more than old chatter
+        inventory_text = fit_inventory(inventory, max(0, min(PROMPT_INVENTORY_TOKENS, remaining)))
+        tokens["inventory"] = estimate_tokens(inventory_text)
+        remaining -= tokens["inventory"]
+
+        recent = without_current_message(unsummarized(conversation, history), current_message)
+        history_text, dropped = fit_history(recent, max(0, remaining))
+        tokens["history"] = estimate_tokens(history_text)
+
+        # Dynamic suffix, appended to the prefix unless Gemini already holds it
+        suffix = f"""{summary_text}
 {history_text}
 {inventory_text}
 
-CURRENT CUSTOMER MESSAGE:
-{current_message}
-
-INSTRUCTIONS:
-- Respond naturally and helpfully
-- Keep responses under 1600 characters
-- Return JSON: {{"reply_text": "...", "actions": [], "intent": "..."}}
+{message_text}
 """
-        
-        logger.info(f"Prompt built ({len(full_prompt)} chars)")
+        full_prompt = suffix.lstrip() if context.get("cached_content") is not None else f"{prefix.text}\n{suffix}"
+
+        total = sum(tokens.values())
+        prompt_metrics["prompts"] += 1
+        prompt_metrics["history_turns_dropped"] += dropped
+        if total > PROMPT_TOKEN_BUDGET:
+            prompt_metrics["over_budget"] += 1
+        for section, count in tokens.items():
+            prompt_metrics["tokens"][section] += count
+        logger.info(
+            f"🧮 Prompt ~{total}/{PROMPT_TOKEN_BUDGET} tokens ("
+            + ", ".join(f"{section}={tokens[section]}" for section in SECTIONS)
+            + f"; {dropped} turns dropped)"
+        )
         return full_prompt
-        
+
     except Exception as e:
         logger.error(f"Error building prompt: {str(e)}")
         return f"You are a helpful assistant.\n\nCustomer: {context.get('current_message', '')}"
+
+
+def prompt_stats() -> Dict[str, Any]:
+    """Average estimated tokens per prompt section"""
+    prompts = prompt_metrics["prompts"]
+    return {
+        "budget": PROMPT_TOKEN_BUDGET,
+        "prompts": prompts,
+        "over_budget": prompt_metrics["over_budget"],
+        "history_turns_dropped": prompt_metrics["history_turns_dropped"],
+        "avg_tokens": {
+            section: round(count / prompts, 1) if prompts else 0.0
+            for section, count in prompt_metrics["tokens"].items()
+        },
+    }
@@ -0,0 +1,288 @@
+"""
+Webhook Dispatcher - Ack-first message processing
+Queues inbound WhatsApp messages so the webhook can answer Twilio immediately,
+while a bounded pool of async workers runs the orchestrator and sends replies.
+
+Messages are sharded per conversation: each conversation key gets its own FIFO
+that is drained strictly in order, while different conversations run in parallel
+(up to the global concurrency limit). Idle shards evict themselves so memory stays
+bounded with thousands of active chats.
+
+An optional coalescing window debounces burst-typed messages: messages from the
+same conversation that arrive within the window are handed to the handler as one
+batch, so they can be answered with a single LLM turn.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+
+class _Shard:
+    """Ordered work queue for a single conversation"""
+
+    __slots__ = ("queue", "task", "busy", "last_active")
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.busy = False
+        self.last_active = time.monotonic()
+
+
+class WebhookDispatcher:
+    """
+    Bounded in-process work queue for inbound webhook payloads.
+
+    Configuration (environment):
+        WEBHOOK_ASYNC_MODE: "true" to acknowledge first and process in the background
+        WEBHOOK_QUEUE_DEPTH: Maximum number of messages waiting for a worker
+        WEBHOOK_WORKERS: Number of messages processed concurrently
+        WEBHOOK_SHARD_IDLE_SECONDS: Idle time after which a conversation shard is evicted
+        WEBHOOK_MAX_SHARDS: Soft cap on live shards; idle shards are evicted LRU-first
+        COALESCE_WINDOW_SECONDS: Debounce window for burst messages (0 disables coalescing)
+        COALESCE_MAX_MESSAGES: Maximum messages merged into one batch
+    """
+
+    def __init__(
+        self,
+        queue_depth: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        enabled: Optional[bool] = None,
+        idle_timeout: Optional[float] = None,
+        max_shards: Optional[int] = None,
+        coalesce_window: Optional[float] = None,
+        coalesce_max_messages: Optional[int] = None
+    ):
+        if enabled is None:
+            enabled = os.getenv("WEBHOOK_ASYNC_MODE", "false").lower() == "true"
+        self.enabled = enabled
+        self.queue_depth = queue_depth or int(os.getenv("WEBHOOK_QUEUE_DEPTH", "500"))
+        self.concurrency = concurrency or int(os.getenv("WEBHOOK_WORKERS", "8"))
+        self.idle_timeout = idle_timeout or float(os.getenv("WEBHOOK_SHARD_IDLE_SECONDS", "60"))
+        self.max_shards = max_shards or int(os.getenv("WEBHOOK_MAX_SHARDS", "5000"))
+        if coalesce_window is None:
+            coalesce_window = float(os.getenv("COALESCE_WINDOW_SECONDS", "0"))
+        self.coalesce_window = coalesce_window
+        self.coalesce_max_messages = coalesce_max_messages or int(os.getenv("COALESCE_MAX_MESSAGES", "5"))
+
+        self._handler: Optional[MessageHandler] = None
+        self._shards: "OrderedDict[Hashable, _Shard]" = OrderedDict()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._drained: Optional[asyncio.Event] = None
+        self._pending = 0
+        self._unfinished = 0
+
+        # Backpressure metrics
+        self.metrics: Dict[str, Any] = {
+            "enqueued": 0,
+            "rejected": 0,
+            "processed": 0,
+            "failed": 0,
+            "in_flight": 0,
+            "max_queue_size": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+            "shards_created": 0,
+            "shards_evicted": 0,
+            "batches": 0,
+            "coalesced_messages": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        """True once the dispatcher has been started"""
+        return self._slots is not None
+
+    async def start(self, handler: MessageHandler):
+        """
+        Start the dispatcher
+
+        Args:
+            handler: Coroutine that processes a batch of webhook payloads from one
+                conversation end to end (a single payload unless coalescing is on)
+        """
+        if self.running:
+            return
+
+        self._handler = handler
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._drained = asyncio.Event()
+        self._drained.set()
+        logger.info(
+            f"🚚 Webhook dispatcher started ({self.concurrency} workers, queue depth {self.queue_depth})"
+        )
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Drain queued messages, then stop all conversation shards
+
+        Args:
+            timeout: Seconds to wait for queued work before cancelling shards
+        """
+        if not self.running:
+            return
+
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Dispatcher stopped with {self._pending} messages still queued")
+
+        tasks = [shard.task for shard in self._shards.values() if shard.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self._shards.clear()
+        self._slots = None
+        self._pending = 0
+        self._unfinished = 0
+        logger.info("🚚 Webhook dispatcher stopped")
+
+    def submit(self, payload: Dict[str, Any], key: Hashable = None) -> bool:
+        """
+        Enqueue a webhook payload without waiting
+
+        Args:
+            payload: Parsed webhook form data
+            key: Conversation key; payloads with the same key are handled in order
+
+        Returns:
+            True if accepted, False if the queue is full (caller should shed load)
+        """
+        if not self.running:
+            return False
+
+        if self._pending >= self.queue_depth:
+            self.metrics["rejected"] += 1
+            logger.warning(f"⚠️ Webhook queue full ({self.queue_depth}), rejecting message")
+            return False
+
+        shard = self._get_shard(key)
+        shard.queue.put_nowait((time.monotonic(), payload))
+        shard.last_active = time.monotonic()
+
+        self._pending += 1
+        self._unfinished += 1
+        self._drained.clear()
+        self.metrics["enqueued"] += 1
+        self.metrics["max_queue_size"] = max(self.metrics["max_queue_size"], self._pending)
+        return True
+
+    def _get_shard(self, key: Hashable) -> _Shard:
+        """Return the live shard for a conversation, creating it if needed"""
+        shard = self._shards.get(key)
+        if shard is not None:
+            self._shards.move_to_end(key)
+            return shard
+
+        if len(self._shards) >= self.max_shards:
+            self._evict_idle_shards()
+
+        shard = _Shard()
+        shard.task = asyncio.create_task(self._run_shard(key, shard))
+        self._shards[key] = shard
+        self.metrics["shards_created"] += 1
+        return shard
+
+    def _evict_idle_shards(self):
+        """Drop least-recently-used shards that have no queued or running work"""
+        overflow = len(self._shards) - self.max_shards + 1
+        for key in list(self._shards.keys()):
+            if overflow <= 0:
+                break
+            shard = self._shards[key]
+            if shard.busy or not shard.queue.empty():
+                continue
+            shard.task.cancel()
+            del self._shards[key]
+            self.metrics["shards_evicted"] += 1
+            overflow -= 1
+
+    async def _run_shard(self, key: Hashable, shard: _Shard):
+        """Drain one conversation's queue in order; exit once idle"""
+        while True:
+            try:
+                enqueued_at, payload = await asyncio.wait_for(shard.queue.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                # No await between the check and removal, so no message can slip in
+                if shard.queue.empty() and self._shards.get(key) is shard:
+                    del self._shards[key]
+                    self.metrics["shards_evicted"] += 1
+                    return
+                continue
+
+            shard.busy = True
+            batch = [payload]
+            try:
+                if self.coalesce_window > 0:
+                    batch.extend(await self._collect_burst(shard))
+
+                async with self._slots:
+                    self._pending -= len(batch)
+                    wait_ms = (time.monotonic() - enqueued_at) * 1000
+                    self.metrics["total_wait_ms"] += wait_ms
+                    self.metrics["max_wait_ms"] = max(self.metrics["max_wait_ms"], wait_ms)
+                    self.metrics["in_flight"] += 1
+                    self.metrics["batches"] += 1
+                    self.metrics["coalesced_messages"] += len(batch) - 1
+
+                    try:
+                        await self._handler(batch)
+                        self.metrics["processed"] += len(batch)
+                    except Exception as e:
+                        self.metrics["failed"] += len(batch)
+                        logger.error(f"❌ Webhook handler failed for {key}: {str(e)}")
+                    finally:
+                        self.metrics["in_flight"] -= 1
+            finally:
+                shard.busy = False
+                shard.last_active = time.monotonic()
+                self._unfinished -= len(batch)
+                if self._unfinished == 0:
+                    self._drained.set()
+
+    async def _collect_burst(self, shard: _Shard) -> List[Dict[str, Any]]:
+        """
+        Debounce: keep taking messages while each arrives within the window.
+        Total wait is capped at three windows so a chatty customer still gets a reply.
+        """
+        burst = []
+        deadline = time.monotonic() + self.coalesce_window * 3
+
+        while len(burst) + 1 < self.coalesce_max_messages:
+            timeout = min(self.coalesce_window, deadline - time.monotonic())
+            if timeout <= 0:
+                break
+            try:
+                _, payload = await asyncio.wait_for(shard.queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+            burst.append(payload)
+
+        return burst
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of queue and backpressure metrics"""
+        started = self.metrics["processed"] + self.metrics["failed"]
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "queue_depth": self.queue_depth,
+            "concurrency": self.concurrency,
+            "queue_size": self._pending,
+            "active_shards": len(self._shards),
+            "avg_wait_ms": round(self.metrics["total_wait_ms"] / started, 2) if started else 0.0,
+            **self.metrics,
+        }
+
+
+# Global instance
+webhook_dispatcher = WebhookDispatcher()
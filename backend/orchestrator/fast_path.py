@@ -0,0 +1,297 @@
+"""
+Fast Path - Deterministic replies that skip the LLM
+Short commands ("cart", "pay", "track order", "2", "hi") need no generative
+reasoning. They are matched with compiled patterns, served by calling the
+ToolRegistry directly and answered from per-boutique reply templates, so they
+take milliseconds instead of a model round trip. Anything that does not match
+cleanly falls through to the normal LLM pipeline.
+"""
+
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from backend.orchestrator.tool_registry import tool_registry
+from backend.services.catalog_service import catalog_service
+from backend.services.model_router import GREETING_PATTERN, THANKS_PATTERN
+
+logger = logging.getLogger(__name__)
+
+# Built-in templates per tone; boutique_ai_settings.reply_templates overrides any key
+DEFAULT_TEMPLATES: Dict[str, Dict[str, str]] = {
+    "friendly": {
+        "greeting": "Hi! 👋 Welcome. What are you shopping for today? I can help you find a style, check sizes and prices, or place an order.",
+        "thanks": "You're welcome! 😊 Let me know if there's anything else I can help you with.",
+        "cart": "🛍️ Here's your cart:\n{items}\n\nTotal: KES {total}\n\nReply *pay* to check out with M-Pesa.",
+        "cart_empty": "Your cart is empty for now 🛍️ Tell me what you're looking for and I'll help you find it!",
+        "payment_sent": "📲 I've sent an M-Pesa prompt for KES {amount} to {phone}. Enter your PIN to complete the payment.",
+        "payment_failed": "😕 I couldn't start the M-Pesa payment just now. Please try again in a moment.",
+        "payment_out_of_stock": "😕 Sorry, {items} just sold out, so I haven't sent a payment prompt. Want me to suggest something similar?",
+        "order_status": "📦 Order {order_number} is *{status}* (payment: {payment_status}). Total: KES {total}.",
+        "order_not_found": "I couldn't find an order for this number yet. Once you've checked out, I can track it for you! 📦",
+        "product": "*{name}* - KES {price}\nSizes: {sizes}\nColours: {colors}\n{stock}\n\nWould you like me to add it to your cart?",
+    },
+    "professional": {
+        "greeting": "Good day and welcome. How may I assist you with your shopping today?",
+        "thanks": "You are most welcome. Please let me know if I can assist you further.",
+        "cart": "Your cart contains:\n{items}\n\nTotal: KES {total}\n\nReply *pay* to complete your purchase via M-Pesa.",
+        "cart_empty": "Your cart is currently empty. Please let me know which items you are interested in.",
+        "payment_sent": "An M-Pesa payment request for KES {amount} has been sent to {phone}. Please enter your PIN to confirm.",
+        "payment_failed": "We were unable to initiate the M-Pesa payment. Please try again shortly.",
+        "payment_out_of_stock": "Unfortunately {items} is no longer in stock, so no payment request was sent. May I suggest an alternative?",
+        "order_status": "Order {order_number} status: {status}. Payment status: {payment_status}. Total: KES {total}.",
+        "order_not_found": "We could not find an order associated with this number.",
+        "product": "{name} - KES {price}\nSizes: {sizes}\nColours: {colors}\n{stock}\n\nShall I add this item to your cart?",
+    },
+    "casual": {
+        "greeting": "Hey! 👋 What are we shopping for today?",
+        "thanks": "Anytime! 😄",
+        "cart": "Your cart 🛒\n{items}\n\nTotal: KES {total}\n\nSay *pay* when you're ready!",
+        "cart_empty": "Cart's empty 🛒 What are you looking for?",
+        "payment_sent": "Sent an M-Pesa prompt for KES {amount} to {phone} 📲 Just enter your PIN!",
+        "payment_failed": "Hmm, the M-Pesa prompt didn't go through 😕 Try again in a bit?",
+        "payment_out_of_stock": "Ah, {items} just sold out 😕 No payment prompt sent. Want something similar?",
+        "order_status": "Order {order_number} is {status} 📦 (payment {payment_status}, KES {total})",
+        "order_not_found": "Can't find an order for you yet 🤔",
+        "product": "{name} - KES {price}\nSizes: {sizes}\nColours: {colors}\n{stock}\n\nWant it in your cart?",
+    },
+}
+
+# "bag" on its own is usually a product ("bag?", "show me bag"), so it needs "my"
+_CART = re.compile(
+    r"^(show |view |see |check )?(me )?(my )?(cart|basket|kikapu)( please| pls| tafadhali)?[?.!]*$"
+    r"|^(show |view |see |check )?(me )?my (shopping )?bag( please| pls| tafadhali)?[?.!]*$"
+    r"|^what('s| is) in my (cart|basket|bag)[?.!]*$"
+)
+_PAY = re.compile(
+    r"^(pay|pay now|checkout|check out|i want to pay|i('m| am) ready to pay|lipa|lipa sasa|nataka kulipa)[.!]*$"
+)
+# Always needs an order word: "track pants" and "track suit" are products
+_TRACK = re.compile(
+    r"^(track( my)? order|where('s| is) my order|order status|status of my order|"
+    r"my order status|oda yangu iko wapi)\b[^?]{0,20}[?.!]*$"
+)
+_NUMBER = re.compile(r"^(?:number|no\.?|option|#)?\s*(\d{1,2})[.!]*$")
+_ORDER_NUMBER = re.compile(r"\b([a-z]{2,5}-?\d{3,})\b")
+_LIST_ITEM = re.compile(r"^\s*(\d{1,2})[.)]\s+(.+)$", re.MULTILINE)
+_ITEM_NAME_END = re.compile(r"\s+(?:[-–—]|x\d|×|\(|@|kes\b|ksh\b)", re.IGNORECASE)
+
+
+def money(amount: float) -> str:
+    return f"{amount:,.0f}"
+
+
+class FastPath:
+    """
+    Rule-based handlers that answer common commands without the LLM.
+
+    Configuration (environment):
+        FAST_PATH_ENABLED: "false" sends every message through the LLM
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+        self.tools = tool_registry
+        self.handlers: List[Tuple[str, re.Pattern, Callable[..., Awaitable[Optional[Dict[str, Any]]]]]] = [
+            ("greeting", GREETING_PATTERN, self._greeting),
+            ("thanks", THANKS_PATTERN, self._thanks),
+            ("view_cart", _CART, self._cart),
+            ("checkout", _PAY, self._pay),
+            ("order_status", _TRACK, self._track),
+            ("product_selection", _NUMBER, self._numbered),
+        ]
+        self.intents: Dict[str, int] = defaultdict(int)
+        self.metrics: Dict[str, float] = {
+            "hits": 0,
+            "declined": 0,
+            "misses": 0,
+            "total_ms": 0.0,
+        }
+
+    async def handle(self, message: str, context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Answer the message deterministically if it is a known command
+
+        Args:
+            message: Customer message
+            context: boutique_id, conversation_id, customer_id, customer_phone,
+                history (oldest first) and ai_settings
+
+        Returns:
+            Reply in the LLM response shape (tools already executed, so no
+            actions), or None to continue with the LLM
+        """
+        if not self.enabled:
+            return None
+        text = " ".join((message or "").lower().split())
+        for intent, pattern, handler in self.handlers:
+            match = pattern.match(text)
+            if not match:
+                continue
+            started = time.perf_counter()
+            try:
+                reply = await handler(match, text, context)
+            except Exception as e:
+                logger.error(f"❌ Fast path {intent} failed: {e}")
+                reply = None
+            if reply is None:
+                self.metrics["declined"] += 1
+                return None
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.metrics["hits"] += 1
+            self.metrics["total_ms"] += elapsed_ms
+            self.intents[intent] += 1
+            logger.info(f"⚡ Fast path {intent} answered in {elapsed_ms:.1f}ms")
+            return {"reply_text": reply, "actions": [], "intent": intent, "entities": {}}
+        self.metrics["misses"] += 1
+        return None
+
+    def render(self, key: str, ai_settings: Optional[Dict[str, Any]], **fields) -> Optional[str]:
+        """
+        Fill the boutique's template for key in its tone
+
+        Returns:
+            Reply text, or None if the template is broken or would say a
+            forbidden phrase (the LLM then handles the message)
+        """
+        ai_settings = ai_settings or {}
+        tone = (ai_settings.get("tone") or "friendly").lower()
+        template = (ai_settings.get("reply_templates") or {}).get(key) \
+            or DEFAULT_TEMPLATES.get(tone, DEFAULT_TEMPLATES["friendly"])[key]
+        try:
+            text = template.format(**fields)
+        except (KeyError, ValueError, IndexError) as e:
+            logger.warning(f"⚠️ Reply template '{key}' could not be rendered: {e}")
+            return None
+
+        lowered = text.lower()
+        if any(phrase and phrase.lower() in lowered for phrase in ai_settings.get("do_not_say") or []):
+            return None
+        return text
+
+    # --- handlers ---
+
+    async def _greeting(self, match, text, context):
+        return self.render("greeting", context.get("ai_settings"))
+
+    async def _thanks(self, match, text, context):
+        return self.render("thanks", context.get("ai_settings"))
+
+    async def _cart_lines(self, context) -> Optional[Tuple[List[str], float]]:
+        """Numbered cart lines and subtotal as priced by the database (None if the cart could not be read)"""
+        cart = await self.tools.get_cart(customer_id=context.get("customer_id"))
+        if cart.get("error"):
+            return None
+        lines = []
+        for number, item in enumerate(cart.get("items") or [], 1):
+            quantity = int(item.get("quantity") or 1)
+            name = item.get("product_name") or "Item"
+            lines.append(f"{number}. {name} x{quantity} - KES {money(float(item.get('line_total') or 0))}")
+        return lines, float(cart.get("subtotal") or 0)
+
+    async def _cart(self, match, text, context):
+        ai_settings = context.get("ai_settings")
+        cart = await self._cart_lines(context)
+        if cart is None:
+            return None
+        lines, total = cart
+        if not lines:
+            return self.render("cart_empty", ai_settings)
+        return self.render("cart", ai_settings, items="\n".join(lines), total=money(total))
+
+    async def _pay(self, match, text, context):
+        ai_settings = context.get("ai_settings")
+        cart = await self._cart_lines(context)
+        if cart is None:
+            return None
+        lines, total = cart
+        if not lines or total <= 0:
+            return self.render("cart_empty", ai_settings)
+        result = await self.tools.initiate_mpesa_stk(
+            phone=context["customer_phone"],
+            amount=total,
+            customer_id=context.get("customer_id"),
+            boutique_id=context["boutique_id"]
+        )
+        if result.get("reason") == "stock":
+            # Retrying cannot help: say what sold out instead
+            items = result.get("message", "").partition("Insufficient inventory:")[2].strip()
+            if not items:
+                return self.render("cart_empty", ai_settings)
+            return self.render("payment_out_of_stock", ai_settings, items=items)
+        if result.get("status") != "pending":
+            return self.render("payment_failed", ai_settings)
+        amount = result.get("amount") or total
+        return self.render("payment_sent", ai_settings, amount=money(amount), phone=context["customer_phone"])
+
+    async def _track(self, match, text, context):
+        if not context.get("customer_id"):
+            return None
+        order_number = _ORDER_NUMBER.search(text)
+        order = await self.tools.get_order_status(
+            customer_id=context["customer_id"],
+            boutique_id=context["boutique_id"],
+            order_number=order_number.group(1) if order_number else None
+        )
+        if order.get("error"):
+            return None
+        if order.get("status") == "not_found":
+            return self.render("order_not_found", context.get("ai_settings"))
+        return self.render(
+            "order_status",
+            context.get("ai_settings"),
+            order_number=order.get("order_number", ""),
+            status=(order.get("order_status") or "pending").replace("_", " "),
+            payment_status=(order.get("payment_status") or "pending").replace("_", " "),
+            total=money(float(order.get("total_amount") or 0))
+        )
+
+    async def _numbered(self, match, text, context):
+        """A number picks an item from the numbered list in the agent's last message"""
+        last_agent = next(
+            (m.get("content") or "" for m in reversed(context.get("history") or []) if m.get("role") == "agent"),
+            ""
+        )
+        items = {int(number): line for number, line in _LIST_ITEM.findall(last_agent)}
+        line = items.get(int(match.group(1)))
+        if not line:
+            return None
+
+        name = _ITEM_NAME_END.split(line.replace("*", ""), maxsplit=1)[0].strip().lower()
+        if not name:
+            return None
+        snapshot = await catalog_service.get_snapshot(context["boutique_id"])
+        products = [p for p in snapshot.products.values() if p.is_active]
+        product = next((p for p in products if p.name.lower() == name), None) \
+            or next((p for p in products if name in p.name.lower() or p.name.lower() in name), None)
+        if product is None or not product.available:
+            # Out of stock: let the LLM suggest alternatives
+            return None
+
+        stock = f"✅ Only {product.stock_quantity} left" if product.stock_quantity <= 3 else "✅ In stock"
+        return self.render(
+            "product",
+            context.get("ai_settings"),
+            name=product.name,
+            price=money(product.price),
+            sizes=", ".join(product.sizes) or "-",
+            colors=", ".join(product.colors) or "-",
+            stock=stock
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Fast path metrics"""
+        hits = self.metrics["hits"]
+        return {
+            "enabled": self.enabled,
+            "avg_ms": round(self.metrics["total_ms"] / hits, 2) if hits else 0.0,
+            "intents": dict(self.intents),
+            **self.metrics,
+        }
+
+
+# Global instance
+fast_path = FastPath()
@@ -1,9 +1,9 @@
 import os
-import json
 import logging
-import asyncio
-import google.generativeai as genai
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional
+
+from backend.services.llm_gateway import llm_gateway
+from backend.orchestrator.structured_output import RESPONSE_SCHEMA, output_metrics, parse_reply
 
 logger = logging.getLogger(__name__)
 if not logger.handlers:
@@ -14,14 +14,33 @@ if not logger.handlers:
     logger.addHandler(console_handler)
     logger.setLevel(logging.INFO)
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-if not GEMINI_API_KEY:
-    logger.warning("⚠️ GEMINI_API_KEY or GOOGLE_API_KEY not found in environment variables")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")  # stable model
+LLM_STREAMING = os.getenv("LLM_STREAMING", "false").lower() == "true"  # send the first sentence early
+LLM_REPAIR_MODEL = os.getenv("LLM_REPAIR_MODEL", "gemini-2.0-flash-lite")  # fixes unparseable output
+
+REPAIR_PROMPT = """Convert the assistant output below into JSON with the keys reply_text, actions \
+(list of {{"tool", "params"}}), intent and entities. Keep the reply wording exactly; use an empty \
+actions list if no tool call is clearly stated.
 
-async def generate_response(prompt: str, image_url: str = None) -> Dict[str, Any]:
+OUTPUT:
+{output}"""
+
+async def generate_response(
+    prompt: str,
+    image_url: str = None,
+    model: Optional[str] = None,
+    cached_content: Any = None
+) -> Dict[str, Any]:
     """
     Generate structured response from Gemini LLM.
     Enforces JSON schema for deterministic parsing.
+    
+    Args:
+        prompt: Full prompt
+        image_url: Customer image, if any
+        model: Model chosen by the model router (defaults to LLM_MODEL)
+        cached_content: Gemini context cache holding the prompt prefix, if the
+            prompt only carries the dynamic suffix
     """
     # Mock flag
     use_mock = os.getenv("USE_MOCK_LLM", "false").lower() == "true"
@@ -42,38 +61,23 @@ async def generate_response(prompt: str, image_url: str = None) -> Dict[str, Any
         }
 
     try:
-        if GEMINI_API_KEY:
-            genai.configure(api_key=GEMINI_API_KEY)
-
-        model = genai.GenerativeModel("gemini-2.0-flash")  # stable model
-
-        generation_config = genai.GenerationConfig(
-            response_mime_type="application/json",
-            temperature=0.7,
-        )
+        generation_config = {
+            "response_mime_type": "application/json",
+            "response_schema": RESPONSE_SCHEMA,
+            "temperature": 0.7,
+        }
 
         parts = [prompt]
 
-        def _sync_generate():
-            return model.generate_content(
-                contents=parts,
-                generation_config=generation_config,
-            )
-
-        logger.info("🔄 Calling Gemini generate_content via asyncio.to_thread...")
-        response = await asyncio.to_thread(_sync_generate)
+        response = await llm_gateway.generate(
+            parts,
+            model=model or LLM_MODEL,
+            generation_config=generation_config,
+            cached_content=cached_content,
+        )
         logger.info(f"✅ LLM response received: {response}")
 
-        response_text = response.text
-
-        try:
-            return json.loads(response_text)
-        except json.JSONDecodeError:
-            logger.error(f"❌ Failed to parse LLM JSON: {response_text}")
-            if "```json" in response_text:
-                clean_text = response_text.split("```json")[1].split("```")[0].strip()
-                return json.loads(clean_text)
-            return _fallback_response()
+        return await _parse_response_text(response.text)
     except Exception as e:
         error_msg = f"❌ LLM Generation failed: {str(e)}"
         logger.error(error_msg)
@@ -84,6 +88,199 @@ async def generate_response(prompt: str, image_url: str = None) -> Dict[str, Any
         print(f"Traceback: {traceback_msg}")
         return _fallback_response()
 
+async def _parse_response_text(response_text: str) -> Dict[str, Any]:
+    """
+    Parse and validate the model's JSON reply.
+    Broken JSON is repaired locally; if that fails, one cheap call to
+    LLM_REPAIR_MODEL reformats the output instead of regenerating the reply.
+    """
+    reply = parse_reply(response_text)
+    if reply is None and response_text and response_text.strip():
+        logger.error(f"❌ Failed to parse LLM JSON, asking {LLM_REPAIR_MODEL} to fix it: {response_text[:200]}")
+        reply = await _repair_call(response_text)
+    if reply is None:
+        output_metrics["fallbacks"] += 1
+        return _fallback_response()
+    return reply.model_dump()
+
+async def _repair_call(response_text: str):
+    """Ask a small model to turn unusable output into schema-valid JSON"""
+    output_metrics["repair_calls"] += 1
+    try:
+        response = await llm_gateway.generate(
+            [REPAIR_PROMPT.format(output=response_text[:6000])],
+            model=LLM_REPAIR_MODEL,
+            generation_config={
+                "response_mime_type": "application/json",
+                "response_schema": RESPONSE_SCHEMA,
+                "temperature": 0,
+                "max_output_tokens": 1024,
+            },
+            timeout=10,
+        )
+        reply = parse_reply(response.text)
+    except Exception as e:
+        logger.error(f"❌ LLM repair call failed: {str(e)}")
+        return None
+    if reply is not None:
+        output_metrics["repair_call_successes"] += 1
+    return reply
+
+class ReplyTextExtractor:
+    """
+    Incrementally decodes the "reply_text" string value from a streamed JSON
+    object, so the reply can be shown before the rest of the object (actions,
+    intent) has been generated. Chunks may split tokens and escapes anywhere.
+    """
+    
+    _KEY = '"reply_text"'
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+    
+    def __init__(self):
+        self.buffer = ""
+        self.text = ""
+        self.done = False
+        self._position = None  # index of the next undecoded char of the value
+    
+    def feed(self, chunk: str) -> str:
+        """
+        Add a chunk of raw model output
+        
+        Returns:
+            Newly decoded reply text (may be empty)
+        """
+        self.buffer += chunk
+        if self.done:
+            return ""
+        
+        if self._position is None:
+            key = self.buffer.find(self._KEY)
+            if key == -1:
+                return ""
+            # Skip whitespace and the colon up to the opening quote
+            index = key + len(self._KEY)
+            while index < len(self.buffer) and self.buffer[index] in " \t\r\n:":
+                index += 1
+            if index >= len(self.buffer):
+                return ""
+            if self.buffer[index] != '"':
+                self.done = True  # not a string value; leave it to the full parse
+                return ""
+            self._position = index + 1
+        
+        decoded = []
+        index = self._position
+        while index < len(self.buffer):
+            char = self.buffer[index]
+            if char == '"':
+                self.done = True
+                index += 1
+                break
+            if char == "\\":
+                if index + 1 >= len(self.buffer):
+                    break  # escape split across chunks
+                code = self.buffer[index + 1]
+                if code == "u":
+                    if index + 6 > len(self.buffer):
+                        break
+                    try:
+                        code_point = int(self.buffer[index + 2:index + 6], 16)
+                    except ValueError:
+                        code_point = 0xFFFD
+                    width = 6
+                    # Characters outside the BMP (emoji) arrive as a surrogate pair
+                    if 0xD800 <= code_point < 0xDC00:
+                        if index + 12 > len(self.buffer):
+                            break
+                        if self.buffer[index + 6:index + 8] == "\\u":
+                            try:
+                                low = int(self.buffer[index + 8:index + 12], 16)
+                            except ValueError:
+                                low = 0
+                            if 0xDC00 <= low < 0xE000:
+                                code_point = 0x10000 + ((code_point - 0xD800) << 10) + (low - 0xDC00)
+                                width = 12
+                    decoded.append(chr(code_point))
+                    index += width
+                    continue
+                decoded.append(self._ESCAPES.get(code, code))
+                index += 2
+                continue
+            decoded.append(char)
+            index += 1
+        
+        self._position = index
+        new_text = "".join(decoded)
+        self.text += new_text
+        return new_text
+
+def first_sentence_boundary(text: str, min_chars: int) -> int:
+    """Index just past the first sentence end at or after min_chars (-1 if none yet)"""
+    for index in range(min_chars, len(text)):
+        char = text[index]
+        if char == "\n" or (char in ".!?" and index + 1 < len(text) and text[index + 1] in " \n"):
+            return index + 1
+    return -1
+
+async def generate_response_stream(
+    prompt: str,
+    image_url: str = None,
+    on_first_message: Optional[Callable[[str], None]] = None,
+    model: Optional[str] = None,
+    cached_content: Any = None
+) -> Dict[str, Any]:
+    """
+    Streaming variant of generate_response.
+    
+    reply_text is decoded while the JSON streams in; as soon as it contains a
+    complete first sentence (at least STREAM_FIRST_MESSAGE_MIN_CHARS long),
+    on_first_message is called with that text so it can be sent right away
+    while the model keeps generating the rest of the reply and its actions.
+    
+    Returns:
+        Parsed response, plus "early_text" (the part handed to on_first_message, if any)
+    """
+    if os.getenv("USE_MOCK_LLM", "false").lower() == "true" or on_first_message is None:
+        return await generate_response(prompt, image_url=image_url, model=model, cached_content=cached_content)
+    
+    min_chars = int(os.getenv("STREAM_FIRST_MESSAGE_MIN_CHARS", "40"))
+    extractor = ReplyTextExtractor()
+    early_text = None
+    
+    try:
+        generation_config = {
+            "response_mime_type": "application/json",
+            "response_schema": RESPONSE_SCHEMA,
+            "temperature": 0.7,
+        }
+        
+        async for chunk in llm_gateway.stream(
+            [prompt], model=model or LLM_MODEL, generation_config=generation_config, cached_content=cached_content
+        ):
+            extractor.feed(chunk)
+            if early_text is None:
+                boundary = first_sentence_boundary(extractor.text, min_chars)
+                # A reply that is already complete is sent in one piece
+                if boundary != -1 and not (extractor.done and boundary >= len(extractor.text.rstrip())):
+                    early_text = extractor.text[:boundary]
+                    on_first_message(early_text)
+        
+        result = await _parse_response_text(extractor.buffer)
+    except Exception as e:
+        logger.error(f"❌ LLM streaming failed: {str(e)}")
+        if early_text is None:
+            return _fallback_response()
+        # The first sentence already went out; finish with what was decoded
+        # (only actions that were completely generated survive the repair)
+        reply = parse_reply(extractor.buffer)
+        result = reply.model_dump() if reply else {
+            "reply_text": extractor.text, "actions": [], "intent": "unknown", "entities": {}
+        }
+    
+    if early_text is not None:
+        result["early_text"] = early_text
+    return result
+
 def _fallback_response() -> Dict[str, Any]:
     """Return safe fallback if LLM fails"""
     return {
@@ -1,114 +1,222 @@
 from fastapi import Request, HTTPException
-from typing import Dict, Any, Optional
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
+import asyncio
 import json
 import logging
+import time
 from datetime import datetime
 
 # Services
 from backend.services.supabase_service import supabase_service
 from backend.services.ai_settings_service import ai_settings_service
+from backend.services.boutique_directory import boutique_directory
+from backend.services.catalog_service import catalog_service
+from backend.services.response_cache import response_cache
+from backend.services.model_router import model_router
+from backend.services.conversation_summary import conversation_summary_service
 
 # Orchestrator components
-from backend.orchestrator.tool_registry import ToolRegistry
+from backend.orchestrator.tool_executor import scoped_calls, tool_executor
+from backend.orchestrator.agent_loop import agent_loop
+from backend.orchestrator.fast_path import fast_path
 from backend.orchestrator.context_builder import build_prompt
-from backend.orchestrator.llm_client import generate_response
+from backend.orchestrator.prompt_prefix import prompt_prefix_cache
+from backend.orchestrator.llm_client import LLM_MODEL, LLM_STREAMING, generate_response, generate_response_stream
 
 # Logger setup
 logger = logging.getLogger(__name__)
 
+# Time from pipeline start until the customer's first reply message is ready to send
+reply_metrics: Dict[str, float] = {
+    "replies": 0,
+    "early_replies": 0,
+    "total_ttfm_ms": 0.0,
+    "max_ttfm_ms": 0.0,
+}
+
 async def handle_whatsapp_message(request: Request) -> Dict[str, Any]:
     """
     Main orchestrator entry point for WhatsApp messages.
     Replaces LangGraph routing with deterministic logic.
     """
+    form_data = await request.form()
+    return await process_inbound_message(dict(form_data))
+
+async def process_inbound_message(form_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run the orchestrator pipeline for an already-parsed Twilio payload.
+    Used directly by the background webhook workers, which no longer hold the request.
+    """
+    return await process_inbound_messages([form_data])
+
+async def process_inbound_messages(
+    batch: List[Dict[str, Any]],
+    on_partial_reply: Optional[Callable[[str], Awaitable[Any]]] = None
+) -> Dict[str, Any]:
+    """
+    Run the orchestrator pipeline for one or more messages from the same conversation.
+    
+    Burst-typed messages ("hi" / "do you have" / "red dresses size M") collected by the
+    dispatcher's coalescing window arrive here together: every message is saved, but
+    they are answered with a single LLM turn.
+    
+    Args:
+        batch: Twilio payloads, oldest first
+        on_partial_reply: With LLM_STREAMING=true, called with the reply's first
+            sentence as soon as it has streamed in; "response" then holds only the rest
+            (the whole reply if the first sentence could not be sent)
+    """
+    started = time.perf_counter()
+    early_send = None
+    ttfm_ms = None
+    
     try:
         # 1. Extract message data
-        form_data = await request.form()
+        form_data = batch[-1]
         from_number = form_data.get("From")
         to_number = form_data.get("To")
-        body = form_data.get("Body", "")
-        media_url = form_data.get("MediaUrl0")
+        bodies = [m.get("Body", "") for m in batch]
+        body = merge_message_bodies(bodies)
+        media_url = next((m.get("MediaUrl0") for m in batch if m.get("MediaUrl0")), None)
         
+        if len(batch) > 1:
+            logger.info(f"🧩 Coalesced {len(batch)} messages from {from_number} into one turn")
         logger.info(f"📩 Received message from {from_number}: {body[:50]}...")
         
         # 2. Identify business (from Twilio number)
         # In production, this would query the boutiques table
         # For MVP, we might hardcode or use a default business ID
-        business_id = get_business_id_by_phone(to_number)
+        business_id = await get_business_id_by_phone(to_number)
         
-        # 3. Get/create conversation
+        # 3-5. Get/create conversation, save customer message(s), fetch context
         # Normalize customer phone number
         customer_phone = normalize_phone_number(from_number)
-        conversation = get_or_create_conversation(business_id, customer_phone)
+        conversation, history, ai_settings = await bootstrap_conversation(business_id, customer_phone, batch)
         conversation_id = conversation['id']
         
-        # 4. Save customer message
-        save_message(conversation_id, "customer", body, media_url)
-        
-        # 5. Fetch context
-        history = get_recent_messages(conversation_id, limit=8)
-        # memories = await search_memories(conversation_id, body) # TODO: Implement memory search
-        memories = []
-        inventory = get_products(business_id)
+        # 6-7. Answer known commands (cart, pay, track order, ...) without the LLM, reuse a
+        # cached answer to the same question, otherwise route the message to a model tier,
+        # build the prompt and call the LLM
+        prompt_version = ai_settings.get('prompt_version', 1) if ai_settings else 1
+        do_not_say = ai_settings.get('do_not_say', []) if ai_settings else []
+        llm_response, message_embedding = None, None
+        early_text = None
+        prompt, model, cached_content = None, None, None
+        if not media_url:
+            llm_response = await fast_path.handle(body, {
+                "boutique_id": business_id,
+                "conversation_id": conversation_id,
+                "customer_id": conversation.get("customer_id"),
+                "customer_phone": customer_phone,
+                "history": history,
+                "ai_settings": ai_settings
+            })
         
-        # 6. Build LLM prompt
-        prompt = await build_prompt({
-            "history": history,
-            "memories": memories,
-            "inventory": inventory,
-            "business_id": business_id,
-            "current_message": body,
-            "has_image": bool(media_url),
-            "media_url": media_url
-        })
+        if llm_response is None and not media_url:
+            catalog_version = await get_catalog_version(business_id)
+            llm_response, message_embedding = await response_cache.lookup(
+                business_id, body, prompt_version, catalog_version, history=history
+            )
         
-        # 7. Call LLM (reasoning only)
-        # If image is present, we might want to analyze it first or pass it to LLM
-        llm_response = await generate_response(prompt, image_url=media_url)
+        if llm_response is None:
+            route = model_router.route(body, history, has_image=bool(media_url))
+            
+            # memories = await search_memories(conversation_id, body) # TODO: Implement memory search
+            memories = []
+            inventory = await get_products(business_id, body)
+            
+            # Static prefix compiled once per settings version; when Gemini holds it in a
+            # context cache only the dynamic suffix is sent
+            model = route.model or LLM_MODEL
+            prefix = prompt_prefix_cache.get(business_id, ai_settings, model)
+            cached_content = prefix.cached_content
+            
+            prompt = await build_prompt({
+                "history": history,
+                "memories": memories,
+                "inventory": inventory,
+                "business_id": business_id,
+                "ai_settings": ai_settings,
+                "conversation": conversation,
+                "prefix": prefix,
+                "cached_content": cached_content,
+                "current_message": body,
+                "has_image": bool(media_url),
+                "media_url": media_url
+            })
+            
+            # If image is present, we might want to analyze it first or pass it to LLM
+            if LLM_STREAMING and on_partial_reply and not media_url:
+                # Send the first sentence while the rest of the reply and its actions generate
+                def send_first_sentence(text: str):
+                    nonlocal early_send, ttfm_ms
+                    early_send = asyncio.create_task(on_partial_reply(filter_response(text, do_not_say)))
+                    ttfm_ms = record_first_message(started, early=True)
+                
+                with model_router.track(route):
+                    llm_response = await generate_response_stream(
+                        prompt, on_first_message=send_first_sentence, model=model, cached_content=cached_content
+                    )
+                early_text = llm_response.pop("early_text", None)
+            else:
+                with model_router.track(route):
+                    llm_response = await generate_response(
+                        prompt, image_url=media_url, model=model, cached_content=cached_content
+                    )
+            
+            if not media_url:
+                response_cache.store(
+                    business_id, body, prompt_version, catalog_version, llm_response, message_embedding,
+                    history=history
+                )
         
         logger.info(f"🧠 LLM Response: {json.dumps(llm_response)}")
         
-        # 8. Execute tools
-        tool_registry = ToolRegistry()
-        action_results = []
-        
-        for action in llm_response.get("actions", []):
-            try:
-                tool_name = action.get("tool")
-                params = action.get("params", {})
-                
-                # Inject conversation_id if needed
-                if "conversation_id" not in params:
-                    params["conversation_id"] = conversation_id
-                
-                logger.info(f"🛠️ Executing tool: {tool_name}")
-                result = await tool_registry.execute(tool_name, params)
-                action_results.append(result)
-                
-            except Exception as e:
-                logger.error(f"❌ Tool execution failed: {str(e)}")
-                # Continue execution, don't crash
-        
-        # 9. Get AI settings for response filtering and version logging
-        ai_settings = ai_settings_service.get_ai_settings(business_id)
-        prompt_version = ai_settings.get('prompt_version', 1) if ai_settings else 1
-        do_not_say = ai_settings.get('do_not_say', []) if ai_settings else []
+        # 8. Execute tools (independent reads concurrently, cart/payment changes in order).
+        # In agent loop mode, results of lookups go back to the model for the final reply
+        scope = {
+            "conversation_id": conversation_id,
+            "boutique_id": business_id,
+            "customer_id": conversation.get("customer_id"),
+        }
+        replaced = False
+        if prompt is not None and agent_loop.enabled and llm_response.get("actions"):
+            with model_router.track(route):
+                llm_response, action_results, replaced = await agent_loop.run(
+                    prompt, llm_response, scope, model=model, cached_content=cached_content
+                )
+        else:
+            action_results = await tool_executor.run(scoped_calls(llm_response.get("actions", []), scope))
         
-        # 10. Filter response against forbidden phrases
+        # 9-10. Filter response against forbidden phrases (do_not_say from the AI settings)
         reply_text = llm_response.get("reply_text", "I'm sorry, I didn't catch that.")
-        filtered_reply = filter_response(reply_text, do_not_say)
+        if early_text:
+            filtered_reply, saved_reply = split_streamed_reply(reply_text, early_text, do_not_say, replaced)
+        else:
+            filtered_reply = filter_response(reply_text, do_not_say)
+            saved_reply = filtered_reply
+            ttfm_ms = record_first_message(started, early=False)
         
         # 11. Save agent response
-        save_message(conversation_id, "agent", filtered_reply)
+        await save_message(conversation_id, "agent", saved_reply)
         
         # 12. Update conversation with prompt version
-        update_conversation_version(conversation_id, prompt_version)
+        await update_conversation_version(conversation_id, prompt_version)
+        
+        # Fold turns that have aged out of the prompt into the rolling summary
+        conversation_summary_service.schedule(conversation, history)
+        
+        # The early message must reach Twilio before the remainder is sent; if it never
+        # got there, the whole reply goes out instead
+        if early_send is not None and not await early_reply_delivered(early_send):
+            filtered_reply = filter_response(reply_text, do_not_say)
         
         # 13. Return response (webhook handler will send via Twilio)
         return {
             "response": filtered_reply,
             "images": [],
-            "intent": llm_response.get("intent")
+            "intent": llm_response.get("intent"),
+            "ttfm_ms": round(ttfm_ms, 1)
         }
 
     except Exception as e:
@@ -122,6 +230,35 @@ async def handle_whatsapp_message(request: Request) -> Dict[str, Any]:
 
 # --- Helper Functions ---
 
+async def early_reply_delivered(early_send: asyncio.Task) -> bool:
+    """Wait for the streamed first sentence to be sent; False if sending it failed"""
+    try:
+        await early_send
+        return True
+    except Exception as e:
+        logger.error(f"❌ Early reply send failed, sending the full reply: {e}")
+        return False
+
+def record_first_message(started: float, early: bool) -> float:
+    """Record time-to-first-message for one request (milliseconds since started)"""
+    ttfm_ms = (time.perf_counter() - started) * 1000
+    reply_metrics["replies"] += 1
+    if early:
+        reply_metrics["early_replies"] += 1
+    reply_metrics["total_ttfm_ms"] += ttfm_ms
+    reply_metrics["max_ttfm_ms"] = max(reply_metrics["max_ttfm_ms"], ttfm_ms)
+    logger.info(f"⏱️ Time to first message: {ttfm_ms:.0f}ms{' (streamed)' if early else ''}")
+    return ttfm_ms
+
+def reply_stats() -> Dict[str, Any]:
+    """Time-to-first-message metrics"""
+    replies = reply_metrics["replies"]
+    return {
+        "streaming": LLM_STREAMING,
+        "avg_ttfm_ms": round(reply_metrics["total_ttfm_ms"] / replies, 1) if replies else 0.0,
+        **reply_metrics,
+    }
+
 def normalize_phone_number(phone: str) -> str:
     """
     Normalize phone number from Twilio format to database format
@@ -139,24 +276,29 @@ def normalize_phone_number(phone: str) -> str:
     
     return phone
 
-def get_business_id_by_phone(phone: str) -> str:
+def merge_message_bodies(bodies: List[str]) -> str:
+    """Join burst-typed message bodies into a single customer turn"""
+    return "\n".join(b.strip() for b in bodies if b and b.strip())
+
+def get_conversation_key(form_data: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Key used to serialize work per conversation: (boutique, customer phone).
+    The Twilio "To" number identifies the boutique, so it stands in for the
+    boutique ID without a database lookup on the webhook path.
+    """
+    return (
+        normalize_phone_number(form_data.get("To")),
+        normalize_phone_number(form_data.get("From"))
+    )
+
+async def get_business_id_by_phone(phone: str) -> str:
     """Get business ID from WhatsApp number"""
     try:
-        # Normalize the phone number
-        normalized_phone = normalize_phone_number(phone)
-        logger.info(f"Looking up business by phone: {phone} -> normalized: {normalized_phone}")
-        
-        # Try exact match first
-        response = supabase_service.client.table("boutiques").select("id").eq("whatsapp_number", normalized_phone).execute()
-        if response.data and len(response.data) > 0:
-            logger.info(f"Found business: {response.data[0]['id']}")
-            return response.data[0]['id']
-        
-        # Try with + prefix
-        response = supabase_service.client.table("boutiques").select("id").eq("whatsapp_number", f"+{normalized_phone}").execute()
-        if response.data and len(response.data) > 0:
-            logger.info(f"Found business with + prefix: {response.data[0]['id']}")
-            return response.data[0]['id']
+        # In-memory routing table; unknown numbers hit the database at most once per negative-cache TTL
+        business_id = await boutique_directory.resolve(phone)
+        if business_id:
+            return business_id
+        logger.info(f"No boutique registered for {phone}")
             
     except Exception as e:
         logger.warning(f"Failed to lookup business by phone {phone}: {e}")
@@ -165,20 +307,73 @@ def get_business_id_by_phone(phone: str) -> str:
     logger.info("Using default boutique ID")
     return "550e8400-e29b-41d4-a716-446655440000" 
 
-def get_or_create_conversation(business_id: str, customer_phone: str) -> Dict:
+# Set to False once the database reports the bootstrap RPC is not deployed
+_bootstrap_rpc_available = True
+
+async def bootstrap_conversation(
+    business_id: str,
+    customer_phone: str,
+    batch: List[Dict[str, Any]]
+) -> Tuple[Dict, List[Dict], Optional[Dict]]:
+    """
+    Get/create the conversation, save the inbound message(s) and load history and
+    AI settings. Uses the single-round-trip bootstrap_conversation RPC, falling back
+    to individual queries if the migration has not been applied yet.
+    
+    Returns:
+        (conversation, history, ai_settings)
+    
+    Raises:
+        Exception: If the RPC fails for any other reason (a timeout may come after the
+            messages were committed, so they are not inserted a second time)
+    """
+    global _bootstrap_rpc_available
+    
+    if _bootstrap_rpc_available:
+        try:
+            result = await supabase_service.bootstrap_conversation(
+                business_id,
+                customer_phone,
+                [
+                    {
+                        "content": m.get("Body", ""),
+                        "attachments": [m["MediaUrl0"]] if m.get("MediaUrl0") else []
+                    }
+                    for m in batch
+                ],
+                history_limit=conversation_summary_service.history_window
+            )
+            ai_settings = result.get("ai_settings")
+            ai_settings_service.observe_settings(business_id, ai_settings)
+            return result["conversation"], result.get("history") or [], ai_settings
+        except Exception as e:
+            if getattr(e, "code", None) != "PGRST202":
+                raise
+            logger.warning("⚠️ bootstrap_conversation RPC not found, using per-query bootstrap")
+            _bootstrap_rpc_available = False
+    
+    conversation = await get_or_create_conversation(business_id, customer_phone)
+    conversation_id = conversation['id']
+    for message in batch:
+        await save_message(conversation_id, "customer", message.get("Body", ""), message.get("MediaUrl0"))
+    history = await get_recent_messages(conversation_id, limit=conversation_summary_service.history_window)
+    ai_settings = await ai_settings_service.get_ai_settings(business_id)
+    return conversation, history, ai_settings
+
+async def get_or_create_conversation(business_id: str, customer_phone: str) -> Dict:
     """Get existing conversation or create new one"""
     try:
         # First, get or create the customer
-        customer = get_or_create_customer(business_id, customer_phone)
+        customer = await get_or_create_customer(business_id, customer_phone)
         customer_id = customer['id']
         
         # Try to find active conversation
-        response = supabase_service.client.table("conversations")\
+        query = supabase_service.client.table("conversations")\
             .select("*")\
             .eq("boutique_id", business_id)\
             .eq("customer_id", customer_id)\
-            .eq("status", "active")\
-            .execute()
+            .eq("status", "active")
+        response = await supabase_service.execute(query)
             
         if response.data and len(response.data) > 0:
             return response.data[0]
@@ -190,7 +385,8 @@ def get_or_create_conversation(business_id: str, customer_phone: str) -> Dict:
             "customer_phone": customer_phone,
             "status": "active"
         }
-        response = supabase_service.client.table("conversations").insert(new_conv).execute()
+        query = supabase_service.client.table("conversations").insert(new_conv)
+        response = await supabase_service.execute(query)
         return response.data[0]
     except Exception as e:
         logger.error(f"Failed to get/create conversation: {e}")
@@ -198,15 +394,15 @@ def get_or_create_conversation(business_id: str, customer_phone: str) -> Dict:
         logger.error(traceback.format_exc())
         raise  # Re-raise to trigger fallback response
 
-def get_or_create_customer(business_id: str, customer_phone: str) -> Dict:
+async def get_or_create_customer(business_id: str, customer_phone: str) -> Dict:
     """Get existing customer or create new one"""
     try:
         # Try to find existing customer
-        response = supabase_service.client.table("customers")\
+        query = supabase_service.client.table("customers")\
             .select("*")\
             .eq("boutique_id", business_id)\
-            .eq("whatsapp_number", customer_phone)\
-            .execute()
+            .eq("whatsapp_number", customer_phone)
+        response = await supabase_service.execute(query)
             
         if response.data and len(response.data) > 0:
             return response.data[0]
@@ -217,7 +413,8 @@ def get_or_create_customer(business_id: str, customer_phone: str) -> Dict:
             "whatsapp_number": customer_phone,
             "name": None  # Will be updated later when we learn their name
         }
-        response = supabase_service.client.table("customers").insert(new_customer).execute()
+        query = supabase_service.client.table("customers").insert(new_customer)
+        response = await supabase_service.execute(query)
         return response.data[0]
     except Exception as e:
         logger.error(f"Failed to get/create customer: {e}")
@@ -225,7 +422,7 @@ def get_or_create_customer(business_id: str, customer_phone: str) -> Dict:
         logger.error(traceback.format_exc())
         raise
 
-def save_message(conversation_id: str, role: str, content: str, media_url: str = None):
+async def save_message(conversation_id: str, role: str, content: str, media_url: str = None):
     """Save message to database"""
     try:
         msg = {
@@ -234,19 +431,20 @@ def save_message(conversation_id: str, role: str, content: str, media_url: str =
             "content": content,
             "attachments": [media_url] if media_url else []
         }
-        supabase_service.client.table("messages").insert(msg).execute()
+        query = supabase_service.client.table("messages").insert(msg)
+        await supabase_service.execute(query)
     except Exception as e:
         logger.error(f"Failed to save message: {e}")
 
-def get_recent_messages(conversation_id: str, limit: int = 8):
+async def get_recent_messages(conversation_id: str, limit: int = 8):
     """Fetch recent chat history"""
     try:
-        response = supabase_service.client.table("messages")\
+        query = supabase_service.client.table("messages")\
             .select("*")\
             .eq("conversation_id", conversation_id)\
             .order("created_at", desc=True)\
-            .limit(limit)\
-            .execute()
+            .limit(limit)
+        response = await supabase_service.execute(query)
         
         # Return in chronological order
         return sorted(response.data, key=lambda x: x['created_at']) if response.data else []
@@ -254,20 +452,50 @@ def get_recent_messages(conversation_id: str, limit: int = 8):
         logger.error(f"Failed to fetch history: {e}")
         return []
 
-def get_products(business_id: str):
-    """Fetch available products"""
+async def get_catalog_version(business_id: str) -> Optional[int]:
+    """Version of the boutique's catalog snapshot (None if unavailable)"""
     try:
-        response = supabase_service.client.table("products")\
-            .select("id, name, price, stock_quantity, sizes, colors")\
-            .eq("boutique_id", business_id)\
-            .gt("stock_quantity", 0)\
-            .limit(10)\
-            .execute()
-        return response.data if response.data else []
+        return await catalog_service.version(business_id)
+    except Exception as e:
+        logger.warning(f"Catalog version unavailable: {e}")
+        return None
+
+async def get_products(business_id: str, message: Optional[str] = None):
+    """Fetch available products, most relevant to the customer's message first"""
+    try:
+        # Served from the in-memory catalog snapshot (no DB call once warm)
+        return await catalog_service.get_products(business_id, message)
     except Exception as e:
         logger.error(f"Failed to fetch products: {e}")
         return []
 
+def split_streamed_reply(reply_text: str, early_text: str, forbidden_phrases: list, replaced: bool) -> tuple:
+    """
+    Work out what is left to send after the first sentence was streamed
+    
+    The whole reply is filtered before it is split, so forbidden phrases that
+    span the first sentence and the rest are still caught.
+    
+    Args:
+        reply_text: Final reply from the LLM
+        early_text: First sentence already sent to the customer (unfiltered)
+        forbidden_phrases: List of phrases to filter out
+        replaced: Whether the reply was rewritten with tool results
+        
+    Returns:
+        (text still to send, reply to save in the conversation)
+    """
+    sent = filter_response(early_text, forbidden_phrases)
+    filtered = filter_response(reply_text, forbidden_phrases)
+    if replaced:
+        # A reply rewritten with tool results goes out in full
+        return filtered, f"{sent} {filtered}".strip()
+    if filtered.startswith(sent):
+        return filtered[len(sent):].lstrip(), filtered
+    # The reply no longer starts with what was sent: send all of it
+    return filtered, filtered
+
+
 def filter_response(response: str, forbidden_phrases: list) -> str:
     """
     Filter response to remove forbidden phrases
@@ -294,7 +522,7 @@ def filter_response(response: str, forbidden_phrases: list) -> str:
     
     return filtered
 
-def update_conversation_version(conversation_id: str, prompt_version: int):
+async def update_conversation_version(conversation_id: str, prompt_version: int):
     """
     Update conversation with the prompt version used
     
@@ -303,10 +531,10 @@ def update_conversation_version(conversation_id: str, prompt_version: int):
         prompt_version: Version of AI settings used
     """
     try:
-        supabase_service.client.table("conversations")\
+        query = supabase_service.client.table("conversations")\
             .update({"prompt_version": prompt_version})\
-            .eq("id", conversation_id)\
-            .execute()
+            .eq("id", conversation_id)
+        await supabase_service.execute(query)
         logger.info(f"📝 Logged prompt version {prompt_version} for conversation {conversation_id}")
     except Exception as e:
         logger.error(f"Failed to update conversation version: {e}")
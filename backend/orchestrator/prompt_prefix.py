@@ -0,0 +1,177 @@
+"""
+Prompt Prefix - Compiled static part of the orchestrator prompt
+The system prompt, tone and instructions (with the compact tool manifest)
+only change when a boutique saves new AI settings, so they are compiled once
+per (boutique_id, prompt_version, model) and reused; only the dynamic suffix
+(summary, history, inventory, message) is built per message. Prefixes long
+enough for Gemini context caching are also registered as cached content in the
+background, after which calls send just the suffix and the prefix tokens are
+billed at the cached rate.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+from backend.utils.cache import TTLCache
+from backend.services.llm_gateway import llm_gateway
+from backend.orchestrator.tool_registry import tool_registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful fashion sales assistant."
+
+INSTRUCTIONS = """INSTRUCTIONS:
+- Respond naturally and helpfully
+- Keep responses under 1600 characters
+- Return JSON: {"reply_text": "...", "actions": [], "intent": "..."}
+- Request tools in actions as {"tool": "<name>", "params": {...}}; available tools (? = optional):"""
+
+REMOTE_RETRY_SECONDS = 300
+
+_PIECE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Approximate Gemini token count without an API call: about one token per
+    four characters of a word, and one per punctuation mark or emoji
+    """
+    if not text:
+        return 0
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECE.findall(text))
+
+
+class PromptPrefix:
+    """Static prompt sections for one boutique settings version"""
+
+    def __init__(self, key: Tuple[Any, ...], system_prompt: str, tone: str):
+        self.key = key
+        self.tone_text = f"TONE: {tone.upper()}"
+        instructions = f"{INSTRUCTIONS}\n{tool_registry.manifest()}"
+        self.text = f"{system_prompt}\n\n{self.tone_text}\n\n{instructions}"
+        self.tokens: Dict[str, int] = {
+            "system": estimate_tokens(system_prompt),
+            "tone": estimate_tokens(self.tone_text),
+            "instructions": estimate_tokens(instructions),
+        }
+        self.remote = None  # google.generativeai CachedContent
+        self.remote_expires_at = 0.0
+        self.remote_retry_at = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+    @property
+    def cached_content(self):
+        """Gemini cached content for this prefix, if registered and not about to expire"""
+        if self.remote is not None and time.monotonic() < self.remote_expires_at:
+            return self.remote
+        return None
+
+
+class PromptPrefixCache:
+    """
+    Compiled prompt prefixes per boutique, settings version and model.
+
+    Configuration (environment):
+        PROMPT_PREFIX_CACHE_SIZE: Maximum prefixes kept in memory
+        PROMPT_CONTEXT_CACHE_ENABLED: "false" keeps prefixes local only
+        PROMPT_CONTEXT_CACHE_MIN_TOKENS: Prefix size needed for Gemini context caching
+            (Gemini rejects smaller caches)
+        PROMPT_CONTEXT_CACHE_TTL_SECONDS: Lifetime of a Gemini context cache
+    """
+
+    def __init__(self):
+        self.remote_enabled = os.getenv("PROMPT_CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+        self.min_remote_tokens = int(os.getenv("PROMPT_CONTEXT_CACHE_MIN_TOKENS", "4096"))
+        self.remote_ttl = float(os.getenv("PROMPT_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+        self._prefixes = TTLCache(
+            maxsize=int(os.getenv("PROMPT_PREFIX_CACHE_SIZE", "1000")),
+            ttl=self.remote_ttl
+        )
+        self._registering: Set[Tuple[Any, ...]] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.metrics: Dict[str, int] = {
+            "compiled": 0,
+            "remote_created": 0,
+            "remote_failures": 0,
+        }
+
+    def get(self, boutique_id: str, ai_settings: Optional[Dict[str, Any]], model: str) -> PromptPrefix:
+        """
+        Compiled prefix for a boutique's current settings
+
+        Args:
+            boutique_id: UUID of the boutique
+            ai_settings: Boutique AI settings row (None uses the defaults)
+            model: Model the prompt will be sent to (context caches are per model)
+        """
+        version = ai_settings.get("prompt_version") if ai_settings else None
+        key = (boutique_id, version, model)
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            if ai_settings:
+                prefix = PromptPrefix(key, ai_settings.get("system_prompt", ""), ai_settings.get("tone", "friendly"))
+            else:
+                prefix = PromptPrefix(key, DEFAULT_SYSTEM_PROMPT, "friendly")
+            self._prefixes.set(key, prefix)
+            self.metrics["compiled"] += 1
+            logger.info(f"🧱 Compiled prompt prefix for {boutique_id} v{version} ({prefix.total_tokens} tokens)")
+
+        if model and self._wants_remote(prefix):
+            self._registering.add(key)
+            task = asyncio.create_task(self._register(prefix, model))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return prefix
+
+    def _wants_remote(self, prefix: PromptPrefix) -> bool:
+        return (
+            self.remote_enabled
+            and bool(llm_gateway.api_key)
+            and os.getenv("USE_MOCK_LLM", "false").lower() != "true"
+            and prefix.total_tokens >= self.min_remote_tokens
+            and prefix.cached_content is None
+            and prefix.key not in self._registering
+            and time.monotonic() >= prefix.remote_retry_at
+        )
+
+    async def _register(self, prefix: PromptPrefix, model: str):
+        try:
+            started = time.monotonic()
+            prefix.remote = await llm_gateway.create_context_cache(
+                model,
+                system_instruction=prefix.text,
+                ttl_seconds=self.remote_ttl,
+                display_name=f"prefix-{prefix.key[0]}-v{prefix.key[1]}"
+            )
+            # Stop using the cache a little before Gemini expires it
+            prefix.remote_expires_at = started + self.remote_ttl * 0.9
+            self.metrics["remote_created"] += 1
+            logger.info(f"🗄️ Registered Gemini context cache for {prefix.key[0]} v{prefix.key[1]} ({model})")
+        except Exception as e:
+            self.metrics["remote_failures"] += 1
+            prefix.remote_retry_at = time.monotonic() + REMOTE_RETRY_SECONDS
+            logger.warning(f"⚠️ Context cache registration failed, using local prefix: {e}")
+        finally:
+            self._registering.discard(prefix.key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Prefix cache metrics"""
+        return {
+            "remote_enabled": self.remote_enabled,
+            "min_remote_tokens": self.min_remote_tokens,
+            "size": len(self._prefixes),
+            **self._prefixes.metrics,
+            **self.metrics,
+        }
+
+
+# Global instance
+prompt_prefix_cache = PromptPrefixCache()
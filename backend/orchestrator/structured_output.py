@@ -0,0 +1,344 @@
+"""
+Structured Output - Schema and tolerant parsing for LLM replies
+Gemini is asked for JSON matching RESPONSE_SCHEMA. What comes back is parsed
+with a repairing parser (markdown fences, trailing commas, output cut off at
+the token limit) and validated into LLMReply, so a slightly broken generation
+is still used instead of being thrown away.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from backend.models.schemas import LLMReply
+
+logger = logging.getLogger(__name__)
+
+# Gemini response_schema (OpenAPI subset). Objects need explicit properties, so
+# tool params and entities list the fields the tools and prompts use (params
+# must cover every tool argument model in backend/models/schemas.py).
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "reply_text": {"type": "string"},
+        "actions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "tool": {"type": "string"},
+                    "params": {
+                        "type": "object",
+                        "properties": {
+                            "query": {"type": "string"},
+                            "product_id": {"type": "string"},
+                            "product_name": {"type": "string"},
+                            "category": {"type": "string"},
+                            "min_price": {"type": "number"},
+                            "max_price": {"type": "number"},
+                            "limit": {"type": "integer"},
+                            "quantity": {"type": "integer"},
+                            "size": {"type": "string"},
+                            "color": {"type": "string"},
+                            "image_url": {"type": "string"},
+                            "phone": {"type": "string"},
+                            "amount": {"type": "number"},
+                            "order_number": {"type": "string"},
+                        },
+                    },
+                },
+                "required": ["tool"],
+            },
+        },
+        "intent": {"type": "string"},
+        "entities": {
+            "type": "object",
+            "properties": {
+                "product": {"type": "string"},
+                "category": {"type": "string"},
+                "size": {"type": "string"},
+                "color": {"type": "string"},
+                "quantity": {"type": "integer"},
+                "budget": {"type": "number"},
+            },
+        },
+    },
+    "required": ["reply_text", "actions", "intent"],
+}
+
+_LITERALS = ("true", "false", "null")
+_NUMBER = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?")
+
+
+def _complete_literal(token: str) -> str:
+    """Finish a cut-off literal ("tru" -> "true", "12." -> "12"); anything else becomes null"""
+    if token in _LITERALS:
+        return token
+    for candidate in (token, token.rstrip("+-.eE")):
+        if _NUMBER.fullmatch(candidate):
+            return candidate
+    return next((literal for literal in _LITERALS if token and literal.startswith(token)), "null")
+
+
+class _Container:
+    __slots__ = ("kind", "expecting", "start")
+
+    def __init__(self, kind: str, expecting: str, start: int):
+        self.kind = kind            # "{" or "["
+        self.expecting = expecting  # "key", "colon", "value" or "comma"
+        self.start = start          # position of the opening bracket in the output
+
+
+class JSONRepairParser:
+    """
+    Incremental, tolerant JSON scanner.
+
+    Chunks are fed as they arrive; the scanner keeps its state (open containers,
+    string/escape state) so each chunk is only looked at once. close() returns
+    the text seen so far turned into valid JSON:
+        - text before the first "{" and after the top-level object is ignored
+          (markdown fences, chatter)
+        - trailing commas are dropped
+        - unterminated strings, literals and containers are completed
+        - an unfinished object inside an array (e.g. a half-written action) is
+          dropped rather than completed with guessed values
+    """
+
+    def __init__(self):
+        self._out: List[str] = []
+        self._stack: List[_Container] = []
+        self._started = False
+        self.complete = False
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = False
+        self._unicode_digits = 0
+        self._literal: Optional[List[str]] = None
+        self.repaired = False
+
+    def feed(self, chunk: str):
+        """Scan the next chunk of model output"""
+        for char in chunk:
+            if self.complete:
+                return
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._open("{")
+                continue
+            if self._in_string:
+                self._string_char(char)
+                continue
+            if self._literal is not None:
+                if char.isalnum() or char in "+-.":
+                    self._literal.append(char)
+                    continue
+                self._end_literal()
+            self._structural(char)
+
+    # --- scanning ---
+
+    def _open(self, kind: str):
+        self._out.append(kind)
+        self._stack.append(_Container(kind, "key" if kind == "{" else "value", len(self._out) - 1))
+
+    def _value_done(self):
+        if self._stack:
+            self._stack[-1].expecting = "comma"
+
+    def _string_char(self, char: str):
+        self._out.append(char)
+        if self._unicode_digits:
+            self._unicode_digits -= 1
+        elif self._escape:
+            self._escape = False
+            if char == "u":
+                self._unicode_digits = 4
+        elif char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            if self._string_is_key:
+                self._stack[-1].expecting = "colon"
+            else:
+                self._value_done()
+        elif char in "\n\r\t":
+            # Raw control characters are invalid inside JSON strings
+            self._out[-1] = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}[char]
+            self.repaired = True
+
+    def _structural(self, char: str):
+        container = self._stack[-1]
+        if char in " \t\r\n":
+            return
+        if char == '"':
+            self._string_is_key = container.kind == "{" and container.expecting == "key"
+            self._in_string = True
+            self._out.append(char)
+        elif char == ":":
+            if container.expecting == "colon":
+                container.expecting = "value"
+                self._out.append(char)
+        elif char == ",":
+            if container.expecting == "comma":
+                container.expecting = "key" if container.kind == "{" else "value"
+                self._out.append(char)
+        elif char in "}]":
+            self._trim_trailing_comma()
+            if container.kind == "{" and container.expecting in ("colon", "value"):
+                self._out.append(":null" if container.expecting == "colon" else "null")
+                self.repaired = True
+            self._out.append("}" if container.kind == "{" else "]")
+            self._stack.pop()
+            if self._stack:
+                self._value_done()
+            else:
+                self.complete = True
+        elif char in "{[":
+            if container.expecting == "value":
+                self._open(char)
+        elif container.expecting == "value":
+            self._literal = [char]
+
+    def _end_literal(self):
+        token = "".join(self._literal)
+        self._literal = None
+        completed = _complete_literal(token)
+        if completed != token:
+            self.repaired = True
+        self._out.append(completed)
+        self._value_done()
+
+    def _trim_trailing_comma(self):
+        while self._out and self._out[-1] == ",":
+            self._out.pop()
+            self.repaired = True
+
+    # --- completion ---
+
+    def close(self) -> Optional[str]:
+        """
+        Valid JSON for everything fed so far
+
+        Returns:
+            JSON text, or None if no object was started
+        """
+        if not self._started:
+            return None
+        if self.complete:
+            return "".join(self._out)
+
+        self.repaired = True
+        out = list(self._out)
+        stack = list(self._stack)
+
+        # Drop an unfinished object that is an element of an array
+        for depth in range(1, len(stack)):
+            if stack[depth].kind == "{" and stack[depth - 1].kind == "[":
+                del out[stack[depth].start:]
+                del stack[depth:]
+                while out and out[-1] == ",":
+                    out.pop()
+                stack[-1].expecting = "comma" if out[-1] != "[" else "value"
+                return self._finish(out, stack, in_string=False, literal=None)
+
+        return self._finish(out, stack, self._in_string, self._literal)
+
+    def _finish(self, out: List[str], stack: List[_Container], in_string: bool, literal) -> str:
+        container = stack[-1]
+        if in_string:
+            if self._escape:
+                out.pop()
+            elif self._unicode_digits:
+                del out[-(6 - self._unicode_digits):]
+            out.append('"')
+            if self._string_is_key:
+                out.append(":null")
+            else:
+                container.expecting = "comma"
+        elif literal is not None:
+            out.append(_complete_literal("".join(literal)))
+            container.expecting = "comma"
+
+        while out and out[-1] == ",":
+            out.pop()
+        if container.kind == "{" and container.expecting == "colon":
+            out.append(":null")
+        elif container.kind == "{" and container.expecting == "value":
+            out.append("null")
+
+        for open_container in reversed(stack):
+            out.append("}" if open_container.kind == "{" else "]")
+        return "".join(out)
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Parse possibly broken model JSON
+
+    Returns:
+        Parsed value, or None if nothing usable was found
+    """
+    parser = JSONRepairParser()
+    parser.feed(text)
+    repaired = parser.close()
+    if repaired is None:
+        return None
+    try:
+        return json.loads(repaired)
+    except json.JSONDecodeError as e:
+        logger.warning(f"JSON repair failed: {e}")
+        return None
+
+
+# Outcome counters for LLM output handling (see output_stats)
+output_metrics: Dict[str, int] = {
+    "parsed": 0,
+    "repaired": 0,
+    "invalid": 0,
+    "repair_calls": 0,
+    "repair_call_successes": 0,
+    "fallbacks": 0,
+}
+
+
+def parse_reply(text: str) -> Optional[LLMReply]:
+    """
+    Parse and validate a structured LLM reply
+
+    Args:
+        text: Raw model output
+
+    Returns:
+        LLMReply, or None if the output cannot be recovered
+    """
+    repaired = False
+    try:
+        data = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        data = repair_json(text or "")
+        repaired = data is not None
+
+    try:
+        if not isinstance(data, dict):
+            raise ValueError("no JSON object in output")
+        reply = LLMReply.model_validate(data)
+    except (ValidationError, ValueError) as e:
+        output_metrics["invalid"] += 1
+        logger.warning(f"⚠️ Unusable LLM output: {e}")
+        return None
+
+    if repaired:
+        output_metrics["repaired"] += 1
+        logger.info("🩹 Repaired malformed LLM JSON")
+    else:
+        output_metrics["parsed"] += 1
+    return reply
+
+
+def output_stats() -> Dict[str, int]:
+    """LLM output parsing metrics"""
+    return dict(output_metrics)
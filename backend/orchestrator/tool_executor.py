@@ -0,0 +1,174 @@
+"""
+Tool Executor - Runs the LLM's tool actions for one message
+Actions are split at mutating tools: consecutive read-only tools
+(search_products, get_inventory, get_cart, ...) run concurrently under a
+per-message limit, while mutating tools (add_to_cart, initiate_mpesa_stk) run
+alone and in the order the model asked for them, so a read that follows a
+mutation sees its effect. Every call has a timeout, and per-tool latency is
+kept as a histogram.
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+from backend.orchestrator.tool_registry import SCOPE_FIELDS, ToolRegistry, tool_registry
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def scoped_calls(actions: List[Dict[str, Any]], scope: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    (tool name, params) pairs for the model's actions, scoped to the conversation
+
+    Args:
+        actions: Actions from the LLM reply ({"tool", "params"})
+        scope: conversation_id, boutique_id and customer_id from the webhook
+    """
+    calls = []
+    for action in actions:
+        params = dict(action.get("params") or {})
+
+        # Conversation, tenant and customer always come from the webhook,
+        # never from the model (carts and stock holds are keyed by customer)
+        for key in SCOPE_FIELDS:
+            params[key] = scope.get(key)
+
+        calls.append((action.get("tool"), params))
+    return calls
+
+
+class ToolExecutor:
+    """
+    Dependency-aware executor for tool actions.
+
+    Configuration (environment):
+        TOOL_MAX_CONCURRENCY: Read-only tools run at the same time for one message
+    """
+
+    def __init__(self, registry: ToolRegistry):
+        self.registry = registry
+        self.max_concurrency = int(os.getenv("TOOL_MAX_CONCURRENCY", "4"))
+        self.tool_metrics: Dict[str, Dict[str, Any]] = {}
+        self.metrics: Dict[str, float] = {
+            "batches": 0,
+            "calls": 0,
+            "concurrent_calls": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "total_batch_ms": 0.0,
+        }
+
+    async def run(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+        """
+        Execute tool calls
+
+        Args:
+            calls: (tool name, params) pairs in the order the model listed them
+
+        Returns:
+            One result per call, in the same order (errors and timeouts are
+            returned as {"error": ...} and never raise)
+        """
+        if not calls:
+            return []
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results: List[Any] = [None] * len(calls)
+
+        for group in self._groups(calls):
+            if len(group) == 1:
+                index = group[0]
+                results[index] = await self._run_one(*calls[index], semaphore)
+                continue
+            self.metrics["concurrent_calls"] += len(group)
+            outcomes = await asyncio.gather(*(self._run_one(*calls[i], semaphore) for i in group))
+            for index, outcome in zip(group, outcomes):
+                results[index] = outcome
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.metrics["batches"] += 1
+        self.metrics["total_batch_ms"] += elapsed_ms
+        logger.info(f"🛠️ Ran {len(calls)} tool(s) in {elapsed_ms:.0f}ms")
+        return results
+
+    def _groups(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[List[int]]:
+        """Indices of calls that may run together: runs of read-only tools, or one mutating tool"""
+        groups: List[List[int]] = []
+        reads: List[int] = []
+        for index, (name, _) in enumerate(calls):
+            if self.registry.is_read_only(name):
+                reads.append(index)
+                continue
+            if reads:
+                groups.append(reads)
+                reads = []
+            groups.append([index])
+        if reads:
+            groups.append(reads)
+        return groups
+
+    async def _run_one(self, name: str, params: Dict[str, Any], semaphore: asyncio.Semaphore) -> Any:
+        async with semaphore:
+            logger.info(f"🛠️ Executing tool: {name}")
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(
+                    self.registry.execute(name, params),
+                    timeout=self.registry.timeout_for(name)
+                )
+            except asyncio.TimeoutError:
+                self.metrics["timeouts"] += 1
+                logger.error(f"⏱️ Tool {name} timed out after {self.registry.timeout_for(name):.0f}s")
+                result = {"error": f"Tool {name} timed out"}
+            except Exception as e:
+                logger.error(f"❌ Tool execution failed: {str(e)}")
+                result = {"error": str(e)}
+            self._record(name, (time.perf_counter() - started) * 1000, result)
+            return result
+
+    def _record(self, name: str, latency_ms: float, result: Any):
+        entry = self.tool_metrics.get(name)
+        if entry is None:
+            entry = {"calls": 0, "errors": 0, "total_ms": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+            self.tool_metrics[name] = entry
+        entry["calls"] += 1
+        entry["total_ms"] += latency_ms
+        entry["buckets"][bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.metrics["calls"] += 1
+        if isinstance(result, dict) and result.get("error"):
+            entry["errors"] += 1
+            self.metrics["errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Executor metrics with per-tool latency histograms (cumulative "le" buckets in ms)"""
+        tools = {}
+        for name, entry in self.tool_metrics.items():
+            cumulative, histogram = 0, {}
+            for bound, count in zip([*LATENCY_BUCKETS_MS, "+Inf"], entry["buckets"]):
+                cumulative += count
+                histogram[str(bound)] = cumulative
+            tools[name] = {
+                "calls": entry["calls"],
+                "errors": entry["errors"],
+                "avg_ms": round(entry["total_ms"] / entry["calls"], 1),
+                "latency_ms_le": histogram,
+            }
+        batches = self.metrics["batches"]
+        return {
+            "max_concurrency": self.max_concurrency,
+            "rejected_arguments": dict(self.registry.rejections),
+            "avg_batch_ms": round(self.metrics["total_batch_ms"] / batches, 1) if batches else 0.0,
+            **self.metrics,
+            "tools": tools,
+        }
+
+
+# Global instance
+tool_executor = ToolExecutor(tool_registry)
@@ -1,45 +1,211 @@
-from typing import Dict, Callable, Any, List
+from typing import Dict, Callable, Any, List, NamedTuple, Optional, Type
 import logging
+import os
+import uuid
+
+from pydantic import ValidationError
 
 # Import services
 from backend.services.supabase_service import supabase_service
 from backend.services.paylink_service import paylink_service
+from backend.services.product_retrieval_service import product_retrieval_service
+from backend.services.catalog_service import catalog_service, tokenize
+from backend.services.inventory_service import inventory_service
+from backend.models.schemas import (
+    ToolArgs,
+    GetInventoryArgs,
+    SearchProductsArgs,
+    SearchProductsByImageArgs,
+    AddToCartArgs,
+    GetCartArgs,
+    InitiateMpesaStkArgs,
+    GetOrderStatusArgs,
+    GetCustomerProfileArgs,
+)
 
 logger = logging.getLogger(__name__)
 
+# Injected from the webhook for every call; never taken from the model's arguments
+SCOPE_FIELDS = ("conversation_id", "boutique_id", "customer_id")
+
+# Live stock lookup: everything the reply needs, without the embedding
+INVENTORY_COLUMNS = "id, name, description, category, price, stock_quantity, sizes, colors, is_active"
+
+# Gemini function declarations use an OpenAPI subset
+_SCHEMA_KEYS = ("type", "description", "enum", "items", "properties", "required", "nullable")
+
+
+class ToolSpec(NamedTuple):
+    """Declaration of one tool"""
+    name: str
+    args: Type[ToolArgs]
+    mutating: bool = False
+    timeout: Optional[float] = None  # seconds, defaults to TOOL_TIMEOUT_SECONDS
+
+
+TOOL_SPECS: List[ToolSpec] = [
+    # Product Tools
+    ToolSpec("get_inventory", GetInventoryArgs),
+    ToolSpec("search_products", SearchProductsArgs),
+    # Image analysis is an LLM call plus a vector search
+    ToolSpec("search_products_by_image", SearchProductsByImageArgs, timeout=30.0),
+    
+    # Cart Tools
+    ToolSpec("add_to_cart", AddToCartArgs, mutating=True),
+    ToolSpec("get_cart", GetCartArgs),
+    
+    # Payment Tools
+    ToolSpec("initiate_mpesa_stk", InitiateMpesaStkArgs, mutating=True, timeout=20.0),
+    
+    # Order Tools
+    ToolSpec("get_order_status", GetOrderStatusArgs),
+    
+    # Customer Tools
+    ToolSpec("get_customer_profile", GetCustomerProfileArgs),
+]
+
+
+def gemini_schema(schema: Dict[str, Any], defs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Convert a Pydantic JSON schema to the subset Gemini function declarations accept"""
+    defs = schema.get("$defs", {}) if defs is None else defs
+    if "$ref" in schema:
+        schema = defs[schema["$ref"].rsplit("/", 1)[-1]]
+    result: Dict[str, Any] = {}
+    variants = schema.get("anyOf")
+    if variants:
+        # Optional[X] is anyOf [X, null]
+        concrete = [v for v in variants if v.get("type") != "null"]
+        result = gemini_schema(concrete[0], defs) if concrete else {"type": "string"}
+        if len(concrete) < len(variants):
+            result["nullable"] = True
+    for key in _SCHEMA_KEYS:
+        if key not in schema:
+            continue
+        value = schema[key]
+        if key == "properties":
+            value = {name: gemini_schema(prop, defs) for name, prop in value.items()}
+        elif key == "items":
+            value = gemini_schema(value, defs)
+        elif key == "type":
+            value = value.upper()
+        result[key] = value
+    return result
+
+
+def function_declaration(spec: ToolSpec) -> Dict[str, Any]:
+    """Gemini function declaration generated from a tool's argument model"""
+    parameters = gemini_schema(spec.args.model_json_schema())
+    parameters.pop("description", None)
+    declaration = {"name": spec.name, "description": (spec.args.__doc__ or spec.name).strip()}
+    if parameters.get("properties"):
+        declaration["parameters"] = parameters
+    return declaration
+
+
 class ToolRegistry:
     """
     Central registry for all agent tools.
     Replaces LangGraph nodes with deterministic functions.
+    
+    Tools are declared in TOOL_SPECS with a Pydantic argument model: arguments
+    from the LLM are validated before anything runs, and the same models
+    generate the Gemini function declarations and the prompt's tool manifest.
+    Each tool is also declared read-only or mutating (see ToolExecutor) and may
+    override the default timeout.
+    
+    Configuration (environment):
+        TOOL_TIMEOUT_SECONDS: Default per-tool timeout
     """
     
     def __init__(self):
-        self.tools: Dict[str, Callable] = {
-            # Product Tools
-            "get_inventory": self.get_inventory,
-            "search_products": self.search_products,
-            
-            # Cart Tools
-            "add_to_cart": self.add_to_cart,
-            "get_cart": self.get_cart,
-            
-            # Payment Tools
-            "initiate_mpesa_stk": self.initiate_mpesa_stk,
-            
-            # Customer Tools
-            "get_customer_profile": self.get_customer_profile,
+        self.specs: Dict[str, ToolSpec] = {spec.name: spec for spec in TOOL_SPECS}
+        self.tools: Dict[str, Callable] = {spec.name: getattr(self, spec.name) for spec in TOOL_SPECS}
+        
+        # Tools that change state (cart, payment) run one at a time, in order;
+        # everything else only reads and may run concurrently
+        self.mutating_tools = {spec.name for spec in TOOL_SPECS if spec.mutating}
+        
+        self.default_timeout = float(os.getenv("TOOL_TIMEOUT_SECONDS", "10"))
+        self.timeouts: Dict[str, float] = {
+            spec.name: max(self.default_timeout, spec.timeout) for spec in TOOL_SPECS if spec.timeout
         }
+        
+        self.rejections: Dict[str, int] = {}
+        self._declarations: Optional[List[Dict[str, Any]]] = None
+        self._manifest: Optional[str] = None
+    
+    def is_read_only(self, tool_name: str) -> bool:
+        """Whether a tool only reads (unknown tools are treated as mutating)"""
+        return tool_name in self.tools and tool_name not in self.mutating_tools
+    
+    def timeout_for(self, tool_name: str) -> float:
+        """Seconds a tool call may take before it is abandoned"""
+        return self.timeouts.get(tool_name, self.default_timeout)
+    
+    def function_declarations(self) -> List[Dict[str, Any]]:
+        """Gemini function declarations for every tool (generated once)"""
+        if self._declarations is None:
+            self._declarations = [function_declaration(spec) for spec in self.specs.values()]
+        return self._declarations
+    
+    def manifest(self) -> str:
+        """
+        Compact tool list for prompts, one line per tool:
+        name(required, optional?): description
+        """
+        if self._manifest is None:
+            lines = []
+            for spec in self.specs.values():
+                fields = ", ".join(
+                    name if field.is_required() else f"{name}?"
+                    for name, field in spec.args.model_fields.items()
+                )
+                lines.append(f"- {spec.name}({fields}): {(spec.args.__doc__ or '').strip()}")
+            self._manifest = "\n".join(lines)
+        return self._manifest
+    
+    def validate(self, tool_name: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Validate the model's arguments for a tool
+        
+        Scope fields in params are passed through as they are: callers must
+        set them from the webhook (see scoped_calls), never from the model.
+        
+        Returns:
+            Keyword arguments for the tool (validated arguments plus scope fields)
+        
+        Raises:
+            ValidationError: If the arguments do not match the tool's model
+        """
+        spec = self.specs.get(tool_name)
+        scope = {key: params[key] for key in SCOPE_FIELDS if params.get(key) is not None}
+        if spec is None:
+            return dict(params)
+        args = spec.args.model_validate({k: v for k, v in params.items() if k not in SCOPE_FIELDS})
+        return {**args.model_dump(exclude_none=True), **scope}
 
     async def execute(self, tool_name: str, params: Dict[str, Any]) -> Any:
-        """Execute a tool by name with parameters"""
+        """Validate the arguments and execute a tool by name"""
         if tool_name not in self.tools:
             logger.warning(f"⚠️ Attempted to execute unknown tool: {tool_name}")
             return {"error": f"Unknown tool: {tool_name}"}
         
+        try:
+            kwargs = self.validate(tool_name, params)
+        except ValidationError as e:
+            # Rejected before any database or payment call
+            self.rejections[tool_name] = self.rejections.get(tool_name, 0) + 1
+            problems = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc']) or 'arguments'}: {error['msg']}"
+                for error in e.errors()
+            )
+            logger.warning(f"⚠️ Rejected {tool_name} arguments: {problems}")
+            return {"error": f"Invalid arguments for {tool_name}: {problems}"}
+        
         try:
             tool_func = self.tools[tool_name]
-            logger.info(f"▶️ Running tool {tool_name} with params: {params}")
-            result = await tool_func(**params)
+            logger.info(f"▶️ Running tool {tool_name} with params: {kwargs}")
+            result = await tool_func(**kwargs)
             return result
         except Exception as e:
             logger.error(f"❌ Tool execution error ({tool_name}): {str(e)}")
@@ -47,116 +213,188 @@ class ToolRegistry:
 
     # --- Product Tools ---
     
-    async def get_inventory(self, product_name: str = None, product_id: str = None, **kwargs):
+    async def get_inventory(
+        self,
+        product_name: str = None,
+        product_id: str = None,
+        boutique_id: str = None,
+        **kwargs
+    ):
         """Check stock levels for a product"""
         try:
-            query = supabase_service.client.table("products").select("*")
+            if not product_id and product_name and boutique_id:
+                # Resolve the name in the in-memory catalog so live stock is a primary-key read
+                product_id = await self._resolve_product_id(boutique_id, product_name)
             
+            query = supabase_service.client.table("products").select(INVENTORY_COLUMNS)
             if product_id:
                 query = query.eq("id", product_id)
             elif product_name:
                 query = query.ilike("name", f"%{product_name}%")
             else:
                 return {"error": "Product name or ID required"}
+            if boutique_id:
+                query = query.eq("boutique_id", boutique_id)
                 
-            response = await query.single().execute()
+            response = await supabase_service.execute(query.limit(1))
+            if not response.data:
+                return {"error": "Product not found"}
             
             # Format response to include sizes/colors in a readable way
-            product = response.data
-            if product:
-                product['attrs'] = {
-                    'sizes': product.get('sizes'),
-                    'colors': product.get('colors')
-                }
+            product = response.data[0]
+            product['attrs'] = {
+                'sizes': product.get('sizes'),
+                'colors': product.get('colors')
+            }
             return product
         except Exception as e:
             return {"error": f"Product not found: {e}"}
 
-    async def search_products(self, query: str, **kwargs):
-        """Search for products by text"""
+    async def _resolve_product_id(self, boutique_id: str, product_name: str) -> Optional[str]:
+        """Best name match in the boutique's catalog snapshot, in stock or not"""
+        snapshot = await catalog_service.get_snapshot(boutique_id)
+        tokens = set(tokenize(product_name))
+        best = max(snapshot.products.values(), key=lambda p: p.score(tokens), default=None)
+        if best is None or not best.score(tokens):
+            return None
+        return best.id
+
+    async def search_products(
+        self,
+        query: str,
+        boutique_id: str = None,
+        limit: int = 5,
+        category: str = None,
+        min_price: float = None,
+        max_price: float = None,
+        **kwargs
+    ):
+        """Search for products by meaning and keywords within the boutique"""
         try:
-            # Simple text search for MVP
-            response = await supabase_service.client.table("products")\
+            if boutique_id:
+                # Hybrid search degrades on its own: a failed side is skipped, and
+                # keyword search falls back to database full-text search
+                return await product_retrieval_service.search(
+                    boutique_id,
+                    query,
+                    limit=limit,
+                    category=category,
+                    min_price=min_price,
+                    max_price=max_price
+                )
+            
+            # Unscoped callers: simple name match
+            query_builder = supabase_service.client.table("products")\
                 .select("*")\
                 .ilike("name", f"%{query}%")\
-                .limit(5)\
-                .execute()
+                .limit(limit)
+            response = await supabase_service.execute(query_builder)
             return response.data
         except Exception as e:
+            logger.error(f"Product search failed: {e}")
+            return []
+
+    async def search_products_by_image(self, image_url: str, boutique_id: str, limit: int = 5, **kwargs):
+        """Find products that look like a customer's photo"""
+        try:
+            from backend.services.gemini_service import gemini_service
+            
+            analysis = await gemini_service.analyze_product_image(image_url)
+            return await product_retrieval_service.search_by_image(boutique_id, analysis, limit=limit)
+        except Exception as e:
+            logger.error(f"Image search failed: {e}")
             return []
 
     # --- Cart Tools ---
     
-    async def add_to_cart(self, conversation_id: str, product_id: str, quantity: int = 1, **kwargs):
-        """Add item to cart (stored in conversation metadata for MVP)"""
+    async def add_to_cart(
+        self,
+        product_id: str,
+        quantity: int = 1,
+        size: str = None,
+        color: str = None,
+        customer_id: str = None,
+        boutique_id: str = None,
+        **kwargs
+    ):
+        """Add item to the customer's cart (one atomic upsert, returns the updated cart)"""
+        if not customer_id:
+            return {"error": "No customer for this conversation"}
         try:
-            # 1. Get current metadata
-            conv = await supabase_service.client.table("conversations")\
-                .select("metadata")\
-                .eq("id", conversation_id)\
-                .single()\
-                .execute()
-                
-            metadata = conv.data.get("metadata", {}) or {}
-            cart = metadata.get("cart", [])
-            
-            # 2. Add item
-            cart.append({
-                "product_id": product_id,
-                "quantity": quantity,
-                "added_at": str(logging.Formatter.converter) # timestamp
-            })
-            
-            metadata["cart"] = cart
-            
-            # 3. Update DB
-            await supabase_service.client.table("conversations")\
-                .update({"metadata": metadata})\
-                .eq("id", conversation_id)\
-                .execute()
-                
-            return {"status": "success", "message": "Added to cart"}
+            cart = await supabase_service.add_to_cart(
+                customer_id,
+                product_id,
+                size=size,
+                quantity=quantity,
+                color=color,
+                boutique_id=boutique_id
+            )
+            return {"status": "success", "message": "Added to cart", "cart": cart}
         except Exception as e:
             return {"error": str(e)}
 
-    async def get_cart(self, conversation_id: str, **kwargs):
-        """Get current cart contents"""
+    async def get_cart(self, customer_id: str = None, **kwargs):
+        """Get current cart contents with item count and subtotal"""
+        if not customer_id:
+            return {"items": [], "item_count": 0, "subtotal": 0}
         try:
-            conv = await supabase_service.client.table("conversations")\
-                .select("metadata")\
-                .eq("id", conversation_id)\
-                .single()\
-                .execute()
-            
-            return conv.data.get("metadata", {}).get("cart", [])
+            return await supabase_service.get_customer_cart(customer_id)
         except Exception as e:
-            return []
+            logger.error(f"Cart lookup failed: {e}")
+            return {"error": str(e), "items": []}
 
     # --- Payment Tools ---
     
-    async def initiate_mpesa_stk(self, phone: str, amount: float, **kwargs):
-        """Initiate M-Pesa STK Push via PayLink"""
+    async def initiate_mpesa_stk(
+        self,
+        phone: str,
+        amount: float,
+        customer_id: str = None,
+        boutique_id: str = None,
+        **kwargs
+    ):
+        """Initiate M-Pesa STK Push via PayLink, holding the cart's stock until the payment settles"""
         try:
-            # Use the existing PayLink service
-            # Generate a reference based on timestamp or order ID if available
-            import time
-            reference = kwargs.get("order_id", f"ORD-{int(time.time())}")
+            # Always generated here, never taken from the model: the reference keys the
+            # stock hold. PayLink keeps 12 characters of it: "ORD-" + 8 random hex
+            reference = f"ORD-{uuid.uuid4().hex[:8].upper()}"
+            
+            hold = None
+            if customer_id:
+                try:
+                    hold = await inventory_service.reserve_cart(customer_id, reference, boutique_id=boutique_id)
+                except ValueError as e:
+                    # Nothing was held and no payment prompt is sent
+                    return {"status": "failed", "reason": "stock", "message": str(e)}
+            
+            if hold:
+                # Charge exactly what is held, whatever amount the caller worked out
+                held_amount = float(hold["cart"]["subtotal"])
+                if round(held_amount) != round(float(amount)):
+                    logger.warning(f"⚠️ Checkout {reference}: requested KES {amount}, charging held cart total KES {held_amount}")
+                amount = held_amount
             
             result = await paylink_service.initiate_stk_push(
                 phone_number=phone,
-                amount=int(amount),
+                amount=int(round(amount)),
                 account_reference=reference,
                 transaction_desc="Boutique Purchase"
             )
             
             if result.get("success"):
+                if hold and result.get("transaction_id"):
+                    await inventory_service.attach_checkout(reference, result["transaction_id"], customer_id)
                 return {
                     "status": "pending",
                     "message": "STK Push sent to phone",
+                    "amount": int(round(amount)),
                     "checkout_request_id": result.get("transaction_id", "unknown"),
-                    "mpesa_reference": result.get("reference")
+                    "mpesa_reference": result.get("reference"),
+                    "reserved_until": hold.get("expires_at") if hold else None
                 }
             else:
+                if hold:
+                    await inventory_service.settle(reference, paid=False, customer_id=customer_id)
                 return {
                     "status": "failed",
                     "message": result.get("error", "Payment initiation failed")
@@ -165,6 +403,33 @@ class ToolRegistry:
             logger.error(f"Payment tool error: {e}")
             return {"status": "failed", "message": str(e)}
 
+    # --- Order Tools ---
+    
+    async def get_order_status(
+        self,
+        customer_id: str,
+        boutique_id: str = None,
+        order_number: str = None,
+        **kwargs
+    ):
+        """Status of the customer's most recent order (or a specific order number)"""
+        try:
+            query = supabase_service.client.table("orders")\
+                .select("order_number, order_status, payment_status, total_amount, items, created_at, delivered_at")\
+                .eq("customer_id", customer_id)
+            if boutique_id:
+                query = query.eq("boutique_id", boutique_id)
+            if order_number:
+                query = query.ilike("order_number", order_number)
+            response = await supabase_service.execute(query.order("created_at", desc=True).limit(1))
+            
+            if not response.data:
+                return {"status": "not_found"}
+            return {"status": "found", **response.data[0]}
+        except Exception as e:
+            logger.error(f"Order status tool error: {e}")
+            return {"error": str(e)}
+
     # --- Customer Tools ---
     
     async def get_customer_profile(self, phone: str, **kwargs):
@@ -174,3 +439,7 @@ class ToolRegistry:
             "phone": phone,
             "segment": "new"
         }
+
+
+# Global instance
+tool_registry = ToolRegistry()
@@ -3,18 +3,39 @@ AI Settings Service
 Manages boutique AI behavior configuration and prompt versioning
 """
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable
 from backend.services.supabase_service import supabase_service
+from backend.utils.cache import TTLCache
+import json
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 class AISettingsService:
-    """Service for managing AI settings and prompt versions"""
+    """
+    Service for managing AI settings and prompt versions
     
-    def get_ai_settings(self, boutique_id: str) -> Optional[Dict[str, Any]]:
+    Settings are cached per boutique (TTL + bounded LRU, single-flight loads).
+    Entries are replaced when a newer prompt_version is observed, on local updates,
+    and on 'ai_settings_changed' notifications from Postgres when SUPABASE_DB_URL is set.
+    
+    Configuration (environment):
+        AI_SETTINGS_CACHE_TTL: Seconds a cached settings row stays valid
+        AI_SETTINGS_CACHE_SIZE: Maximum number of boutiques kept in the cache
+    """
+    
+    def __init__(self):
+        self._cache = TTLCache(
+            maxsize=int(os.getenv("AI_SETTINGS_CACHE_SIZE", "1000")),
+            ttl=float(os.getenv("AI_SETTINGS_CACHE_TTL", "300"))
+        )
+        self._subscribers: List[Callable[[str], None]] = []
+        self._listener_conn = None
+    
+    async def get_ai_settings(self, boutique_id: str) -> Optional[Dict[str, Any]]:
         """
-        Fetch AI settings for a boutique
+        Fetch AI settings for a boutique (cached)
         
         Args:
             boutique_id: UUID of the boutique
@@ -23,21 +44,104 @@ class AISettingsService:
             Dict with AI settings or None if not found
         """
         try:
-            logger.info(f"Fetching AI settings for boutique: {boutique_id}")
-            
-            response = supabase_service.client.table("boutique_ai_settings").select("*").eq("boutique_id", boutique_id).single().execute()
-            
-            if response.data:
-                logger.info(f"AI settings found (version {response.data.get('prompt_version')})")
-                return response.data
-            
-            logger.warning(f"No AI settings found for boutique {boutique_id}")
-            return None
-            
+            return await self._cache.get_or_load(boutique_id, lambda: self._fetch_ai_settings(boutique_id))
         except Exception as e:
             logger.error(f"Error fetching AI settings: {str(e)}")
             return None
     
+    async def _fetch_ai_settings(self, boutique_id: str) -> Optional[Dict[str, Any]]:
+        """Load AI settings from the database (errors propagate so they are not cached)"""
+        logger.info(f"Fetching AI settings for boutique: {boutique_id}")
+        
+        query = supabase_service.client.table("boutique_ai_settings").select("*").eq("boutique_id", boutique_id).limit(1)
+        response = await supabase_service.execute(query)
+        
+        if response.data:
+            logger.info(f"AI settings found (version {response.data[0].get('prompt_version')})")
+            return response.data[0]
+        
+        logger.warning(f"No AI settings found for boutique {boutique_id}")
+        return None
+    
+    def observe_settings(self, boutique_id: str, settings: Optional[Dict[str, Any]]):
+        """
+        Refresh the cache with settings loaded elsewhere (e.g. the bootstrap RPC)
+        
+        Args:
+            boutique_id: UUID of the boutique
+            settings: Settings row as read from the database, or None
+        """
+        cached = self._cache.get(boutique_id, None, record=False)
+        self._cache.set(boutique_id, settings)
+        
+        old_version = cached.get("prompt_version") if cached else None
+        new_version = settings.get("prompt_version") if settings else None
+        if cached is not None and old_version != new_version:
+            logger.info(f"🔄 AI settings for {boutique_id} changed (v{old_version} -> v{new_version})")
+            self._notify(boutique_id)
+    
+    def invalidate(self, boutique_id: str, prompt_version: Optional[int] = None):
+        """
+        Drop cached settings for a boutique
+        
+        Args:
+            boutique_id: UUID of the boutique
+            prompt_version: If given, only invalidate when the cached version is older
+        """
+        cached = self._cache.get(boutique_id, None, record=False)
+        if prompt_version is not None and cached and cached.get("prompt_version", 0) >= prompt_version:
+            return
+        
+        self._cache.invalidate(boutique_id)
+        self._notify(boutique_id)
+    
+    def subscribe(self, callback: Callable[[str], None]):
+        """Register a callback invoked with the boutique ID whenever its settings change"""
+        self._subscribers.append(callback)
+    
+    def _notify(self, boutique_id: str):
+        for callback in self._subscribers:
+            try:
+                callback(boutique_id)
+            except Exception as e:
+                logger.error(f"AI settings subscriber failed: {e}")
+    
+    async def start_change_listener(self):
+        """
+        LISTEN for 'ai_settings_changed' notifications so dashboard edits made
+        directly in Supabase invalidate this process's cache immediately
+        """
+        db_url = os.getenv("SUPABASE_DB_URL")
+        if not db_url or self._listener_conn is not None:
+            return
+        
+        try:
+            import asyncpg
+            
+            self._listener_conn = await asyncpg.connect(db_url)
+            await self._listener_conn.add_listener("ai_settings_changed", self._on_change_notification)
+            logger.info("👂 Listening for AI settings changes")
+        except Exception as e:
+            logger.warning(f"⚠️ AI settings change listener unavailable, relying on TTL: {e}")
+            self._listener_conn = None
+    
+    async def stop_change_listener(self):
+        """Close the LISTEN connection"""
+        if self._listener_conn is not None:
+            await self._listener_conn.close()
+            self._listener_conn = None
+    
+    def _on_change_notification(self, connection, pid, channel, payload):
+        try:
+            data = json.loads(payload)
+            self.invalidate(data["boutique_id"], data.get("prompt_version"))
+        except Exception as e:
+            logger.error(f"Invalid AI settings notification {payload!r}: {e}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Cache metrics"""
+        return self._cache.stats()
+    
     async def update_ai_settings(
         self,
         boutique_id: str,
@@ -45,7 +149,8 @@ class AISettingsService:
         tone: Optional[str] = None,
         language_style: Optional[str] = None,
         upsell_rules: Optional[List[Dict]] = None,
-        do_not_say: Optional[List[str]] = None
+        do_not_say: Optional[List[str]] = None,
+        reply_templates: Optional[Dict[str, str]] = None
     ) -> Dict[str, Any]:
         """
         Update AI settings for a boutique
@@ -58,6 +163,7 @@ class AISettingsService:
             language_style: Language formality (conversational, formal, etc.)
             upsell_rules: List of upsell trigger-action rules
             do_not_say: List of forbidden phrases
+            reply_templates: Fast-path reply overrides (see orchestrator/fast_path.py)
             
         Returns:
             Updated AI settings
@@ -77,16 +183,20 @@ class AISettingsService:
                 update_data["upsell_rules"] = upsell_rules
             if do_not_say is not None:
                 update_data["do_not_say"] = do_not_say
+            if reply_templates is not None:
+                update_data["reply_templates"] = reply_templates
             
             if not update_data:
                 raise ValueError("No fields provided for update")
             
             # Update settings (trigger will auto-increment version and save history)
-            response = await supabase_service.client.table("boutique_ai_settings").update(update_data).eq("boutique_id", boutique_id).execute()
+            query = supabase_service.client.table("boutique_ai_settings").update(update_data).eq("boutique_id", boutique_id)
+            response = await supabase_service.execute(query)
             
             if response.data:
                 new_version = response.data[0].get("prompt_version")
                 logger.info(f"AI settings updated to version {new_version}")
+                self.observe_settings(boutique_id, response.data[0])
                 return response.data[0]
             
             raise Exception("Update failed - no data returned")
@@ -0,0 +1,210 @@
+"""
+Boutique Directory - WhatsApp number routing table
+Keeps an in-memory index of normalized WhatsApp numbers to boutique IDs so the
+tenant for an inbound message resolves with a single dictionary lookup
+"""
+
+import asyncio
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from backend.services.supabase_service import supabase_service
+from backend.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+class BoutiqueDirectory:
+    """
+    Phone -> boutique index, loaded at startup and refreshed incrementally.
+
+    Configuration (environment):
+        BOUTIQUE_DIRECTORY_REFRESH_SECONDS: Interval between incremental refreshes (updated_at watermark)
+        BOUTIQUE_DIRECTORY_FULL_RELOAD_SECONDS: Interval between full reloads (picks up deletions)
+        BOUTIQUE_NEGATIVE_CACHE_SECONDS: How long an unknown number is remembered as unknown
+    """
+
+    def __init__(self):
+        self.refresh_interval = float(os.getenv("BOUTIQUE_DIRECTORY_REFRESH_SECONDS", "60"))
+        self.full_reload_interval = float(os.getenv("BOUTIQUE_DIRECTORY_FULL_RELOAD_SECONDS", "1800"))
+
+        self._by_number: Dict[str, str] = {}
+        self._number_by_id: Dict[str, str] = {}
+        self._watermark: Optional[str] = None
+        self._negative = TTLCache(
+            maxsize=10000,
+            ttl=float(os.getenv("BOUTIQUE_NEGATIVE_CACHE_SECONDS", "60"))
+        )
+        self._task: Optional[asyncio.Task] = None
+        self.loaded = False
+
+        self.metrics: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "negative_hits": 0,
+            "db_lookups": 0,
+            "refreshes": 0,
+        }
+
+    @staticmethod
+    def normalize(phone: Optional[str]) -> str:
+        """Reduce any WhatsApp number format (whatsapp:+254..., +254 7..., 254...) to digits"""
+        if not phone:
+            return ""
+        return _NON_DIGITS.sub("", phone.replace("whatsapp:", ""))
+
+    def _index(self, rows: List[Dict[str, Any]], advance_watermark: bool = True):
+        """
+        Add or move boutiques in the index
+
+        Args:
+            rows: Boutique rows (id, whatsapp_number, updated_at)
+            advance_watermark: False for rows fetched outside load/refresh, so
+                boutiques changed before them are still picked up by refresh()
+        """
+        for row in rows:
+            boutique_id = row["id"]
+            number = self.normalize(row.get("whatsapp_number"))
+
+            old_number = self._number_by_id.get(boutique_id)
+            if old_number and old_number != number:
+                self._by_number.pop(old_number, None)
+
+            if number:
+                self._by_number[number] = boutique_id
+                self._number_by_id[boutique_id] = number
+                self._negative.invalidate(number)
+
+            updated_at = row.get("updated_at")
+            if advance_watermark and updated_at and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+
+    async def load(self, page_size: int = 1000):
+        """Full (re)load of the routing table"""
+        rows: List[Dict[str, Any]] = []
+        start = 0
+        while True:
+            query = supabase_service.client.table("boutiques")\
+                .select("id, whatsapp_number, updated_at")\
+                .order("id")\
+                .range(start, start + page_size - 1)
+            response = await supabase_service.execute(query)
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                break
+            start += page_size
+
+        self._by_number = {}
+        self._number_by_id = {}
+        self._watermark = None
+        self._index(rows)
+        self.loaded = True
+        logger.info(f"📇 Boutique directory loaded ({len(self._by_number)} numbers)")
+
+    async def refresh(self):
+        """Incremental refresh: fetch boutiques changed since the last seen updated_at"""
+        if not self.loaded:
+            await self.load()
+            return
+
+        query = supabase_service.client.table("boutiques")\
+            .select("id, whatsapp_number, updated_at")
+        if self._watermark:
+            query = query.gte("updated_at", self._watermark)
+        response = await supabase_service.execute(query)
+
+        self._index(response.data or [])
+        self.metrics["refreshes"] += 1
+
+    async def start(self):
+        """Load the table and keep it fresh in the background"""
+        try:
+            await self.load()
+        except Exception as e:
+            logger.warning(f"⚠️ Boutique directory initial load failed, resolving lazily: {e}")
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        """Stop background refreshes"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refresh_loop(self):
+        since_full_reload = 0.0
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            since_full_reload += self.refresh_interval
+            try:
+                if since_full_reload >= self.full_reload_interval:
+                    await self.load()
+                    since_full_reload = 0.0
+                else:
+                    await self.refresh()
+            except Exception as e:
+                logger.error(f"Boutique directory refresh failed: {e}")
+
+    def get(self, phone: Optional[str]) -> Optional[str]:
+        """Index-only lookup (never touches the database)"""
+        return self._by_number.get(self.normalize(phone))
+
+    async def resolve(self, phone: Optional[str]) -> Optional[str]:
+        """
+        Resolve a WhatsApp number to a boutique ID
+
+        Args:
+            phone: Number in any format (e.g. whatsapp:+254712345678)
+
+        Returns:
+            Boutique ID, or None if no boutique owns the number
+        """
+        number = self.normalize(phone)
+        if not number:
+            return None
+
+        boutique_id = self._by_number.get(number)
+        if boutique_id:
+            self.metrics["hits"] += 1
+            return boutique_id
+
+        if self._negative.get(number, False):
+            self.metrics["negative_hits"] += 1
+            return None
+
+        # Not in the table yet (new boutique since the last refresh): one query covers both formats
+        self.metrics["misses"] += 1
+        self.metrics["db_lookups"] += 1
+        query = supabase_service.client.table("boutiques")\
+            .select("id, whatsapp_number, updated_at")\
+            .in_("whatsapp_number", [number, f"+{number}"])\
+            .limit(1)
+        response = await supabase_service.execute(query)
+
+        if response.data:
+            self._index(response.data, advance_watermark=False)
+            return response.data[0]["id"]
+
+        self._negative.set(number, True)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Routing table metrics"""
+        return {
+            "loaded": self.loaded,
+            "numbers": len(self._by_number),
+            "watermark": self._watermark,
+            "negative_cached": len(self._negative),
+            **self.metrics,
+        }
+
+
+# Global instance
+boutique_directory = BoutiqueDirectory()
@@ -0,0 +1,322 @@
+"""
+Catalog Service - Per-boutique hot catalog snapshots
+Keeps each active boutique's product list in memory as compact records so prompt
+building needs no database calls, and ranks products by relevance to the
+customer's message instead of returning an arbitrary slice.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+
+from backend.services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_COLUMNS = (
+    "id, name, price, stock_quantity, sizes, colors, category, tags, "
+    "description, image_urls, is_active, updated_at"
+)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Snapshot versions are drawn from one process-wide counter, so a snapshot that
+# is evicted and loaded again never repeats a version the caches already saw
+_VERSIONS = itertools.count(1)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase word tokens of two or more characters"""
+    if not text:
+        return []
+    return [token for token in _TOKEN.findall(text.lower()) if len(token) > 1]
+
+
+def _as_list(value: Any) -> List[str]:
+    """JSONB list columns may come back as None or a bare string"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [str(item) for item in value]
+
+
+class ProductRecord:
+    """Compact in-memory product row"""
+
+    __slots__ = (
+        "id", "name", "price", "stock_quantity", "sizes", "colors", "category",
+        "tags", "description", "image_urls", "is_active", "updated_at",
+        "name_tokens", "attribute_tokens", "description_tokens",
+    )
+
+    def __init__(self, row: Dict[str, Any]):
+        self.id: str = row["id"]
+        self.name: str = row.get("name") or ""
+        self.price: float = float(row.get("price") or 0)
+        self.stock_quantity: int = int(row.get("stock_quantity") or 0)
+        self.sizes: List[str] = _as_list(row.get("sizes"))
+        self.colors: List[str] = _as_list(row.get("colors"))
+        self.category: Optional[str] = row.get("category")
+        self.tags: List[str] = _as_list(row.get("tags"))
+        self.description: str = row.get("description") or ""
+        self.image_urls: List[str] = _as_list(row.get("image_urls"))
+        self.is_active: bool = row.get("is_active", True) is not False
+        self.updated_at: Optional[str] = row.get("updated_at")
+
+        # Pre-tokenized fields for relevance ranking
+        self.name_tokens: FrozenSet[str] = frozenset(tokenize(self.name))
+        self.attribute_tokens: FrozenSet[str] = frozenset(
+            tokenize(" ".join([self.category or ""] + self.tags + self.colors + self.sizes))
+        )
+        self.description_tokens: FrozenSet[str] = frozenset(tokenize(self.description))
+
+    @property
+    def available(self) -> bool:
+        return self.is_active and self.stock_quantity > 0
+
+    def score(self, query_tokens: Set[str]) -> int:
+        """Token-overlap relevance: name matches weigh most, then attributes, then description"""
+        return (
+            3 * len(query_tokens & self.name_tokens)
+            + 2 * len(query_tokens & self.attribute_tokens)
+            + len(query_tokens & self.description_tokens)
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "price": self.price,
+            "stock_quantity": self.stock_quantity,
+            "sizes": self.sizes,
+            "colors": self.colors,
+            "category": self.category,
+        }
+
+
+class CatalogSnapshot:
+    """All products of one boutique, plus the refresh watermark"""
+
+    def __init__(self, boutique_id: str):
+        self.boutique_id = boutique_id
+        self.products: Dict[str, ProductRecord] = {}
+        self.watermark: Optional[str] = None
+        self.version = next(_VERSIONS)
+        self.refreshed_at = 0.0
+        self.full_loaded_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def apply(self, rows: List[Dict[str, Any]], replace: bool = False) -> bool:
+        """
+        Merge product rows into the snapshot
+
+        Args:
+            rows: Product rows (any subset of PRODUCT_COLUMNS, must include id)
+            replace: Treat rows as the complete catalog (drops products not present)
+
+        Returns:
+            True if the catalog changed
+        """
+        changed = False
+        if replace:
+            ids = {row["id"] for row in rows}
+            for product_id in list(self.products.keys()):
+                if product_id not in ids:
+                    del self.products[product_id]
+                    changed = True
+
+        for row in rows:
+            current = self.products.get(row["id"])
+            updated_at = row.get("updated_at")
+            if current is None or current.updated_at != updated_at or updated_at is None:
+                self.products[row["id"]] = ProductRecord(row)
+                changed = True
+            if updated_at and (self.watermark is None or updated_at > self.watermark):
+                self.watermark = updated_at
+
+        if changed:
+            self.version = next(_VERSIONS)
+        return changed
+
+    def available(self) -> List[ProductRecord]:
+        return [product for product in self.products.values() if product.available]
+
+    def rank(self, message: Optional[str] = None, limit: int = 10) -> List[ProductRecord]:
+        """
+        In-stock products ordered by relevance to the message
+
+        Products with no overlap keep recency order so the list is never empty
+        while the boutique has stock.
+        """
+        products = self.available()
+        products.sort(key=lambda p: p.updated_at or "", reverse=True)
+
+        query_tokens = set(tokenize(message))
+        if query_tokens:
+            # Stable sort keeps recency as the tie-breaker
+            products.sort(key=lambda p: p.score(query_tokens), reverse=True)
+
+        return products[:limit]
+
+
+class CatalogService:
+    """
+    Registry of per-boutique catalog snapshots.
+
+    Snapshots are served stale-while-revalidate: once older than the refresh
+    interval, the current snapshot is returned immediately and an incremental
+    refresh (rows with updated_at >= watermark) runs in the background.
+
+    Configuration (environment):
+        CATALOG_REFRESH_SECONDS: Age after which a snapshot is refreshed incrementally
+        CATALOG_FULL_RELOAD_SECONDS: Age after which a snapshot is fully reloaded (picks up deletions)
+        CATALOG_MAX_BOUTIQUES: Maximum snapshots kept in memory (least recently used are dropped)
+    """
+
+    def __init__(self):
+        self.refresh_interval = float(os.getenv("CATALOG_REFRESH_SECONDS", "30"))
+        self.full_reload_interval = float(os.getenv("CATALOG_FULL_RELOAD_SECONDS", "900"))
+        self.max_boutiques = int(os.getenv("CATALOG_MAX_BOUTIQUES", "500"))
+
+        self._snapshots: "OrderedDict[str, CatalogSnapshot]" = OrderedDict()
+        self._background: Set[asyncio.Task] = set()
+
+        self.metrics: Dict[str, int] = {
+            "hits": 0,
+            "loads": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "evictions": 0,
+        }
+
+    async def get_snapshot(self, boutique_id: str) -> CatalogSnapshot:
+        """
+        Return the boutique's snapshot, loading it on first use
+
+        Args:
+            boutique_id: Boutique UUID
+
+        Returns:
+            CatalogSnapshot (possibly slightly stale while a refresh runs)
+        """
+        snapshot = self._snapshots.get(boutique_id)
+        if snapshot is None:
+            snapshot = CatalogSnapshot(boutique_id)
+            self._snapshots[boutique_id] = snapshot
+            self._evict()
+
+        self._snapshots.move_to_end(boutique_id)
+
+        if not snapshot.full_loaded_at:
+            # First use: callers wait for (and share) the initial load
+            async with snapshot.lock:
+                if not snapshot.full_loaded_at:
+                    await self._load(snapshot)
+            return snapshot
+
+        self.metrics["hits"] += 1
+        if time.monotonic() - snapshot.refreshed_at > self.refresh_interval and not snapshot.lock.locked():
+            task = asyncio.create_task(self._refresh_in_background(snapshot))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        return snapshot
+
+    async def get_products(
+        self,
+        boutique_id: str,
+        message: Optional[str] = None,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """
+        In-stock products for the prompt, most relevant to the message first
+
+        Args:
+            boutique_id: Boutique UUID
+            message: Current customer message used for ranking
+            limit: Maximum products returned
+
+        Returns:
+            List of product dicts
+        """
+        snapshot = await self.get_snapshot(boutique_id)
+        return [product.to_dict() for product in snapshot.rank(message, limit)]
+
+    async def version(self, boutique_id: str) -> int:
+        """Catalog version counter (increments whenever the snapshot changes)"""
+        return (await self.get_snapshot(boutique_id)).version
+
+    def invalidate(self, boutique_id: str):
+        """Drop a snapshot so the next request reloads it"""
+        self._snapshots.pop(boutique_id, None)
+
+    async def _load(self, snapshot: CatalogSnapshot, page_size: int = 1000):
+        """Full load of a boutique's catalog"""
+        rows: List[Dict[str, Any]] = []
+        start = 0
+        while True:
+            query = supabase_service.client.table("products")\
+                .select(PRODUCT_COLUMNS)\
+                .eq("boutique_id", snapshot.boutique_id)\
+                .order("id")\
+                .range(start, start + page_size - 1)
+            response = await supabase_service.execute(query)
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                break
+            start += page_size
+
+        snapshot.apply(rows, replace=True)
+        snapshot.refreshed_at = snapshot.full_loaded_at = time.monotonic()
+        self.metrics["loads"] += 1
+        logger.info(f"🛍️ Catalog loaded for {snapshot.boutique_id} ({len(snapshot.products)} products)")
+
+    async def _refresh(self, snapshot: CatalogSnapshot):
+        """Incremental refresh using the updated_at watermark"""
+        if time.monotonic() - snapshot.full_loaded_at > self.full_reload_interval:
+            await self._load(snapshot)
+            return
+
+        query = supabase_service.client.table("products")\
+            .select(PRODUCT_COLUMNS)\
+            .eq("boutique_id", snapshot.boutique_id)
+        if snapshot.watermark:
+            query = query.gte("updated_at", snapshot.watermark)
+        response = await supabase_service.execute(query)
+
+        snapshot.apply(response.data or [])
+        snapshot.refreshed_at = time.monotonic()
+        self.metrics["refreshes"] += 1
+
+    async def _refresh_in_background(self, snapshot: CatalogSnapshot):
+        async with snapshot.lock:
+            try:
+                await self._refresh(snapshot)
+            except Exception as e:
+                # Keep serving the current snapshot; retry after the next interval
+                snapshot.refreshed_at = time.monotonic()
+                self.metrics["refresh_failures"] += 1
+                logger.error(f"Catalog refresh failed for {snapshot.boutique_id}: {e}")
+
+    def _evict(self):
+        while len(self._snapshots) > self.max_boutiques:
+            self._snapshots.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot registry metrics"""
+        return {
+            "boutiques": len(self._snapshots),
+            "products": sum(len(s.products) for s in self._snapshots.values()),
+            **self.metrics,
+        }
+
+
+# Global instance
+catalog_service = CatalogService()
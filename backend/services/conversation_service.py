@@ -20,7 +20,7 @@ async def save_conversation_message(
         "metadata": metadata or {}
     }
     
-    response = supabase_client.table("conversation_history").insert(message_data).execute()
+    response = await supabase_client.table("conversation_history").insert(message_data).execute()
     return response.data[0] if response.data else None
 
 
@@ -36,7 +36,7 @@ async def get_conversation_history(
         List of dicts with 'role' and 'content' keys
     """
     
-    response = supabase_client.table("conversation_history")\
+    response = await supabase_client.table("conversation_history")\
         .select("role, message, created_at")\
         .eq("customer_id", customer_id)\
         .order("created_at", desc=True)\
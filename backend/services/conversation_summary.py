@@ -0,0 +1,173 @@
+"""
+Conversation Summary - Rolling per-conversation summary of older turns
+The prompt only carries the most recent messages verbatim; everything before
+them is folded into conversations.summary. Updates are incremental (previous
+summary + the newly aged-out messages), run in the background after the reply
+has been sent, and advance the summary_through watermark.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from backend.services.supabase_service import supabase_service
+from backend.services.llm_gateway import llm_gateway
+from backend.services.model_router import FLASH, model_router
+
+logger = logging.getLogger(__name__)
+
+# Recent messages loaded per turn when summaries need no more
+DEFAULT_HISTORY_LIMIT = 8
+
+SUMMARY_PROMPT = """You maintain a short running summary of a WhatsApp conversation between a \
+fashion boutique's sales assistant and a customer. Update the summary with the new messages.
+Keep only what matters for the rest of the sale: the customer's name, sizes, colours, budget \
+and preferences, products discussed or rejected, cart and order/payment state, and open questions.
+Write at most {max_words} words of plain text, no preamble.
+
+CURRENT SUMMARY:
+{summary}
+
+NEW MESSAGES:
+{messages}
+
+UPDATED SUMMARY:"""
+
+
+def unsummarized(conversation: Dict[str, Any], history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """History messages newer than the conversation's summary watermark"""
+    through = conversation.get("summary_through")
+    if not through:
+        return list(history)
+    return [m for m in history if (m.get("created_at") or "") > through]
+
+
+class ConversationSummaryService:
+    """
+    Background summarizer for aged-out conversation turns.
+
+    Configuration (environment):
+        CONVERSATION_SUMMARY_ENABLED: "false" disables summaries
+        CONVERSATION_SUMMARY_KEEP: Most recent messages always kept verbatim
+        CONVERSATION_SUMMARY_BATCH: Aged-out messages collected before an update
+        CONVERSATION_SUMMARY_MAX_WORDS: Summary length limit
+        CONVERSATION_SUMMARY_MAX_MESSAGES: Most messages folded into the summary by one update
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("CONVERSATION_SUMMARY_ENABLED", "true").lower() == "true"
+        self.keep_recent = int(os.getenv("CONVERSATION_SUMMARY_KEEP", "4"))
+        self.batch_size = int(os.getenv("CONVERSATION_SUMMARY_BATCH", "4"))
+        self.max_words = int(os.getenv("CONVERSATION_SUMMARY_MAX_WORDS", "120"))
+        self.max_messages = int(os.getenv("CONVERSATION_SUMMARY_MAX_MESSAGES", "40"))
+
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.metrics: Dict[str, int] = {
+            "updates": 0,
+            "failures": 0,
+            "messages_summarized": 0,
+        }
+
+    @property
+    def history_window(self) -> int:
+        """Recent messages to load per turn: always enough to see a full batch behind the verbatim ones"""
+        return max(DEFAULT_HISTORY_LIMIT, self.keep_recent + self.batch_size)
+
+    def pending(self, conversation: Dict[str, Any], history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Messages that have aged out of the verbatim window but are not in the summary yet"""
+        fresh = unsummarized(conversation, history)
+        return fresh[:-self.keep_recent] if self.keep_recent else fresh
+
+    def schedule(self, conversation: Dict[str, Any], history: List[Dict[str, Any]]):
+        """
+        Start a background summary update if enough turns have aged out
+
+        Args:
+            conversation: Conversation row (id, summary, summary_through)
+            history: Recent messages, oldest first
+        """
+        if not self.enabled:
+            return
+        conversation_id = conversation.get("id")
+        messages = self.pending(conversation, history)
+        if not conversation_id or conversation_id in self._running or len(messages) < self.batch_size:
+            return
+
+        # Everything older than the verbatim window is summarized, including
+        # messages that slid out of the window while an update failed or ran
+        keep_from = history[-self.keep_recent]["created_at"] if self.keep_recent else None
+        self._running.add(conversation_id)
+        task = asyncio.create_task(self._update(
+            conversation_id, conversation.get("summary"), conversation.get("summary_through"), keep_from
+        ))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load_unsummarized(
+        self,
+        conversation_id: str,
+        through: Optional[str],
+        keep_from: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """Messages after the summary watermark and before the verbatim window, oldest first"""
+        query = supabase_service.client.table("messages")\
+            .select("role, content, created_at")\
+            .eq("conversation_id", conversation_id)
+        if through:
+            query = query.gt("created_at", through)
+        if keep_from:
+            query = query.lt("created_at", keep_from)
+        response = await supabase_service.execute(query.order("created_at").limit(self.max_messages))
+        return response.data or []
+
+    async def _update(
+        self,
+        conversation_id: str,
+        summary: Optional[str],
+        through: Optional[str],
+        keep_from: Optional[str]
+    ):
+        try:
+            messages = await self._load_unsummarized(conversation_id, through, keep_from)
+            if not messages:
+                return
+            transcript = "\n".join(
+                f"{(m.get('role') or 'unknown').upper()}: {m.get('content') or ''}" for m in messages
+            )
+            new_summary = await llm_gateway.generate_text(
+                SUMMARY_PROMPT.format(max_words=self.max_words, summary=summary or "(none yet)", messages=transcript),
+                model=model_router.model_for(FLASH),
+                generation_config={"temperature": 0.2, "max_output_tokens": 400}
+            )
+            query = supabase_service.client.table("conversations")\
+                .update({"summary": new_summary.strip(), "summary_through": messages[-1]["created_at"]})\
+                .eq("id", conversation_id)
+            await supabase_service.execute(query)
+
+            self.metrics["updates"] += 1
+            self.metrics["messages_summarized"] += len(messages)
+            logger.info(f"📝 Summarized {len(messages)} older messages of conversation {conversation_id}")
+        except Exception as e:
+            self.metrics["failures"] += 1
+            logger.error(f"Conversation summary update failed: {e}")
+        finally:
+            self._running.discard(conversation_id)
+
+    async def drain(self):
+        """Wait for in-flight updates (used at shutdown)"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Summary metrics"""
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._running),
+            **self.metrics,
+        }
+
+
+# Global instance
+conversation_summary_service = ConversationSummaryService()
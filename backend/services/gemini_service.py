@@ -8,6 +8,9 @@ import os
 from dotenv import load_dotenv
 import httpx
 
+from backend.services.llm_gateway import llm_gateway
+from backend.services.model_router import FLASH, PRO, model_router
+
 load_dotenv()
 
 class GeminiService:
@@ -18,11 +21,10 @@ class GeminiService:
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY must be set in environment variables")
         
-        genai.configure(api_key=self.api_key)
-        
-        # Use Gemini 2.5 Pro (Latest Stable High-Reasoning Model)
-        self.vision_model = genai.GenerativeModel('gemini-2.5-pro')
-        self.text_model = genai.GenerativeModel('gemini-2.5-pro')
+        # Pro tier for image analysis, flash tier for short text tasks; recommendations
+        # are routed per message. Calls go through the shared gateway (async, pooled, rate-limited)
+        self.vision_model = model_router.model_for(PRO)
+        self.text_model = model_router.model_for(FLASH)
     
     async def analyze_product_image(self, image_url: str) -> Dict[str, Any]:
         """
@@ -51,7 +53,10 @@ class GeminiService:
 
 Be specific and accurate. Focus on visual attributes that would help match similar products."""
 
-        response = self.vision_model.generate_content([prompt, {"mime_type": "image/jpeg", "data": image_data}])
+        response = await llm_gateway.generate(
+            [prompt, {"mime_type": "image/jpeg", "data": image_data}],
+            model=self.vision_model
+        )
         
         # Parse JSON response
         import json
@@ -97,7 +102,7 @@ Be specific and accurate. Focus on visual attributes that would help match simil
         Returns:
             Generated text response
         """
-        response = self.text_model.generate_content(prompt)
+        response = await llm_gateway.generate(prompt, model=self.text_model)
         return response.text.strip()
     
     async def generate_conversational_response(
@@ -143,7 +148,9 @@ Generate a warm, friendly response that:
 
 Response:"""
 
-        response = self.text_model.generate_content(prompt)
+        route = model_router.route(customer_message, conversation_history)
+        with model_router.track(route):
+            response = await llm_gateway.generate(prompt, model=route.model or self.text_model)
         return response.text.strip()
     
     async def generate_size_recommendation(
@@ -164,7 +171,7 @@ And this product:
 
 Recommend the most likely size for this customer. Reply with just the size (S/M/L/XL) or "unknown" if uncertain."""
 
-        response = self.text_model.generate_content(prompt)
+        response = await llm_gateway.generate(prompt, model=self.text_model)
         size = response.text.strip().upper()
         
         # Validate size is in available sizes
@@ -180,8 +187,8 @@ Recommend the most likely size for this customer. Reply with just the size (S/M/
     async def chat_with_tools(
         self,
         message: str,
-        tools: List[Dict[str, Any]],
-        context: Dict[str, Any],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        context: Dict[str, Any] = None,
         conversation_history: List[Dict[str, str]] = None
     ) -> Dict[str, Any]:
         """
@@ -189,19 +196,23 @@ Recommend the most likely size for this customer. Reply with just the size (S/M/
         
         Args:
             message: User's message
-            tools: List of tool schemas
-            context: Context dict with boutique_id, customer_id, etc.
+            tools: Function declarations (defaults to the ToolRegistry's generated declarations)
+            context: Context dict with boutique_id, customer_id, conversation_id
             conversation_history: Previous conversation turns
         
         Returns:
             Dict with response text, tool_calls, and updated history
         """
-        from agents.tools import execute_tool
+        from backend.orchestrator.tool_registry import tool_registry
+        from backend.orchestrator.tool_executor import scoped_calls, tool_executor
+        
+        context = context or {}
+        tools = tools or tool_registry.function_declarations()
         
         # Create model with tools
-        model_with_tools = genai.GenerativeModel(
-            model_name='gemini-2.5-pro',
-            tools=tools
+        route = model_router.route(message, conversation_history)
+        model_with_tools = llm_gateway.model(
+            route.model or self.text_model, tools=[{"function_declarations": tools}]
         )
         
         # Build conversation history for Gemini
@@ -217,7 +228,8 @@ Recommend the most likely size for this customer. Reply with just the size (S/M/
         chat = model_with_tools.start_chat(history=history)
         
         # Send message
-        response = chat.send_message(message)
+        with model_router.track(route):
+            response = await llm_gateway.send_message(chat, message)
         
         # Check if model wants to call functions
         tool_calls = []
@@ -235,11 +247,9 @@ Recommend the most likely size for this customer. Reply with just the size (S/M/
                         
                         print(f"🔧 Tool call: {function_name}({function_args})")
                         
-                        # Execute the tool
-                        tool_result = await execute_tool(
-                            tool_name=function_name,
-                            tool_args=function_args,
-                            context=context
+                        # Execute the tool (arguments validated, scoped to the conversation)
+                        [tool_result] = await tool_executor.run(
+                            scoped_calls([{"tool": function_name, "params": function_args}], context)
                         )
                         
                         tool_calls.append({
@@ -249,16 +259,18 @@ Recommend the most likely size for this customer. Reply with just the size (S/M/
                         })
                         
                         # Send result back to model
-                        response = chat.send_message(
-                            genai.protos.Content(
-                                parts=[genai.protos.Part(
-                                    function_response=genai.protos.FunctionResponse(
-                                        name=function_name,
-                                        response={"result": tool_result}
-                                    )
-                                )]
+                        with model_router.track(route):
+                            response = await llm_gateway.send_message(
+                                chat,
+                                genai.protos.Content(
+                                    parts=[genai.protos.Part(
+                                        function_response=genai.protos.FunctionResponse(
+                                            name=function_name,
+                                            response={"result": tool_result}
+                                        )
+                                    )]
+                                )
                             )
-                        )
                     
                     # Get text response
                     if hasattr(part, 'text') and part.text:
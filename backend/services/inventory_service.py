@@ -0,0 +1,183 @@
+"""
+Inventory Reservations - Hold stock between the STK push and the payment
+Checkout takes the cart's stock in one conditional UPDATE (reserve_cart RPC)
+and records a hold that expires after INVENTORY_HOLD_SECONDS. The payment
+callback confirms the hold or gives the stock back; holds nobody settled are
+released in batches by a background sweeper.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from backend.services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+# Raised by the RPCs for "not enough stock" (P0001) and "empty cart" (P0002)
+_STOCK_ERRORS = {"P0001", "P0002"}
+
+
+class InventoryReservationService:
+    """
+    Stock holds for checkouts.
+
+    Configuration (environment):
+        INVENTORY_RESERVATIONS_ENABLED: "false" sends STK pushes without holding stock
+        INVENTORY_HOLD_SECONDS: How long a checkout holds stock while the customer pays
+        INVENTORY_SWEEP_INTERVAL_SECONDS: Interval between sweeps for expired holds
+        INVENTORY_SWEEP_BATCH: Expired holds released per sweeper query
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("INVENTORY_RESERVATIONS_ENABLED", "true").lower() == "true"
+        self.hold_seconds = int(os.getenv("INVENTORY_HOLD_SECONDS", "600"))
+        self.sweep_interval = float(os.getenv("INVENTORY_SWEEP_INTERVAL_SECONDS", "30"))
+        self.sweep_batch = int(os.getenv("INVENTORY_SWEEP_BATCH", "200"))
+
+        self._task: Optional[asyncio.Task] = None
+        self.metrics: Dict[str, int] = {
+            "reserved": 0,
+            "rejected": 0,
+            "confirmed": 0,
+            "released": 0,
+            "expired": 0,
+            "sweeps": 0,
+            "sweep_failures": 0,
+        }
+
+    async def _rpc(self, name: str, params: Dict[str, Any]) -> Any:
+        """Call a reservation RPC; disables reservations if the migration is not deployed"""
+        try:
+            response = await supabase_service.execute(supabase_service.client.rpc(name, params))
+            return response.data
+        except Exception as e:
+            code = getattr(e, "code", None)
+            if code == "PGRST202":
+                logger.warning("⚠️ Inventory reservation RPCs not deployed, checkout continues without holds")
+                self.enabled = False
+                return None
+            if code in _STOCK_ERRORS:
+                raise ValueError(getattr(e, "message", None) or str(e)) from e
+            raise
+
+    async def reserve_cart(
+        self,
+        customer_id: str,
+        reference: str,
+        boutique_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Hold stock for everything in the customer's cart
+
+        Args:
+            customer_id: UUID of the customer
+            reference: STK account reference the hold is tied to
+            boutique_id: Only hold products of this boutique
+
+        Returns:
+            {"reference", "expires_at", "cart"}, or None when reservations are disabled
+
+        Raises:
+            ValueError: If the cart is empty or a product does not have enough stock
+                (nothing is held)
+        """
+        if not self.enabled:
+            return None
+        try:
+            hold = await self._rpc("reserve_cart", {
+                "p_customer_id": customer_id,
+                "p_reference": reference,
+                "p_ttl_seconds": self.hold_seconds,
+                "p_boutique_id": boutique_id
+            })
+        except ValueError:
+            self.metrics["rejected"] += 1
+            raise
+        if hold is not None:
+            self.metrics["reserved"] += 1
+            logger.info(f"📦 Stock held for {reference} until {hold.get('expires_at')}")
+        return hold
+
+    async def attach_checkout(self, reference: str, checkout_request_id: str, customer_id: str):
+        """Link a customer's hold to the PayLink transaction ID the payment callback will report"""
+        query = supabase_service.client.table("inventory_reservations")\
+            .update({"checkout_request_id": checkout_request_id})\
+            .eq("reference", reference)\
+            .eq("customer_id", customer_id)\
+            .eq("status", "held")
+        await supabase_service.execute(query)
+
+    async def settle(self, key: str, paid: bool, customer_id: Optional[str] = None) -> int:
+        """
+        Confirm (paid) or release (failed, cancelled) the holds of a checkout
+
+        Args:
+            key: PayLink transaction ID or STK account reference
+            paid: Whether the payment succeeded
+            customer_id: Only settle this customer's holds
+
+        Returns:
+            Number of holds settled
+        """
+        if not self.enabled:
+            return 0
+        count = await self._rpc("settle_reservation", {
+            "p_key": key,
+            "p_paid": paid,
+            "p_customer_id": customer_id
+        }) or 0
+        self.metrics["confirmed" if paid else "released"] += count
+        if paid and not count:
+            # Hold already expired: the sale stands, but its stock was put back
+            logger.warning(f"⚠️ Payment {key} confirmed with no live stock hold")
+        return count
+
+    async def sweep(self) -> int:
+        """Release expired holds in batches until none are left; returns how many were released"""
+        total = 0
+        while self.enabled:
+            released = await self._rpc("release_expired_reservations", {"p_limit": self.sweep_batch}) or 0
+            total += released
+            if released < self.sweep_batch:
+                break
+        self.metrics["sweeps"] += 1
+        self.metrics["expired"] += total
+        if total:
+            logger.info(f"📦 Released {total} expired stock hold(s)")
+        return total
+
+    async def start(self):
+        """Start the background sweeper"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        """Stop the background sweeper"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _sweep_loop(self):
+        while self.enabled:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                self.metrics["sweep_failures"] += 1
+                logger.error(f"Inventory sweep failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Reservation metrics"""
+        return {
+            "enabled": self.enabled,
+            "hold_seconds": self.hold_seconds,
+            "sweeper_running": self._task is not None and not self._task.done(),
+            **self.metrics,
+        }
+
+
+# Global instance
+inventory_service = InventoryReservationService()
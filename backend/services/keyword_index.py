@@ -0,0 +1,278 @@
+"""
+Keyword Index - In-process inverted index for catalog text search
+Builds a per-boutique inverted index from the catalog snapshot so keyword search
+is ranked (BM25), tolerant of misspellings ("dres", "jaket") and filtered by
+price/category without touching Postgres.
+"""
+
+import logging
+import math
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from backend.services.catalog_service import CatalogSnapshot, catalog_service, tokenize
+
+logger = logging.getLogger(__name__)
+
+# English and Swahili filler words customers wrap around what they actually want
+STOP_WORDS = frozenset({
+    # English
+    "a", "about", "all", "am", "an", "and", "any", "are", "can", "do", "does", "for",
+    "from", "get", "give", "have", "he", "her", "hi", "hello", "how", "i", "in", "is",
+    "it", "like", "looking", "me", "my", "need", "of", "on", "or", "please", "pls",
+    "she", "show", "some", "that", "the", "there", "this", "to", "want", "what",
+    "which", "with", "would", "you", "your",
+    # Swahili
+    "hii", "hizi", "hiyo", "hizo", "ile", "je", "kwa", "la", "mimi", "mna", "na",
+    "naomba", "nataka", "nina", "ni", "niko", "nipe", "sasa", "tafadhali", "tu",
+    "una", "uko", "wa", "ya", "yako", "za", "zako", "gani", "habari", "jambo",
+    "mambo", "bei",
+})
+
+# Field weights (BM25F-style): a name hit matters more than a description hit
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "category": 2.0,
+    "tags": 2.0,
+    "colors": 1.5,
+    "description": 1.0,
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+FUZZY_PENALTY = 0.7
+
+
+def stem(token: str) -> str:
+    """Light plural/suffix stripping (dresses -> dress, jackets -> jacket)"""
+    if len(token) <= 3 or token.isdigit():
+        return token
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith(("sses", "shes", "ches", "xes")):
+        return token[:-2]
+    # Short words keep their "s" so misspellings like "dres" are not mangled
+    if len(token) > 4 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def analyze(text: Optional[str]) -> List[str]:
+    """Tokenize, drop stop words and stem"""
+    return [stem(token) for token in tokenize(text) if token not in STOP_WORDS]
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance with transpositions, abandoned once above limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            cost = 0 if char_a == char_b else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and char_a == b[j - 2] and a[i - 2] == char_b):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class KeywordIndex:
+    """BM25 inverted index over one boutique's catalog"""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.boutique_id = snapshot.boutique_id
+        self.version = snapshot.version
+
+        self.ids: List[str] = []
+        self.prices: List[float] = []
+        self.categories: List[str] = []
+        self.available: List[bool] = []
+        self.lengths: List[float] = []
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self.trigram_terms: Dict[str, Set[str]] = defaultdict(set)
+
+        for product in snapshot.products.values():
+            if not product.is_active:
+                continue
+            doc = len(self.ids)
+            self.ids.append(product.id)
+            self.prices.append(product.price)
+            self.categories.append((product.category or "").lower())
+            self.available.append(product.available)
+
+            fields = {
+                "name": product.name,
+                "category": product.category,
+                "tags": " ".join(product.tags),
+                "colors": " ".join(product.colors),
+                "description": product.description,
+            }
+            length = 0.0
+            for field, text in fields.items():
+                weight = FIELD_WEIGHTS[field]
+                for term in analyze(text):
+                    self.postings[term][doc] = self.postings[term].get(doc, 0.0) + weight
+                    length += weight
+            self.lengths.append(length)
+
+        self.postings = dict(self.postings)
+        for term in self.postings:
+            for gram in trigrams(term):
+                self.trigram_terms[gram].add(term)
+
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def expand(self, term: str) -> List[Tuple[str, float]]:
+        """
+        Vocabulary terms matching a query term: exact, or within a small edit
+        distance (1 for short words, 2 for longer ones) found via shared trigrams
+        """
+        if term in self.postings:
+            return [(term, 1.0)]
+        if len(term) < 3:
+            return []
+
+        limit = 1 if len(term) <= 5 else 2
+        grams = trigrams(term)
+        overlap: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for candidate in self.trigram_terms.get(gram, ()):
+                overlap[candidate] += 1
+
+        matches = []
+        for candidate, shared in overlap.items():
+            if shared * 3 < len(grams):
+                continue
+            if edit_distance(term, candidate, limit) <= limit:
+                matches.append((candidate, FUZZY_PENALTY))
+        return matches
+
+    def _passes(
+        self,
+        doc: int,
+        category: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        in_stock_only: bool
+    ) -> bool:
+        if in_stock_only and not self.available[doc]:
+            return False
+        if category and self.categories[doc] != category:
+            return False
+        if min_price is not None and self.prices[doc] < min_price:
+            return False
+        if max_price is not None and self.prices[doc] > max_price:
+            return False
+        return True
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        in_stock_only: bool = True
+    ) -> List[Tuple[str, float]]:
+        """
+        Ranked keyword search
+
+        Args:
+            query: Customer text
+            limit: Maximum results
+            category: Exact category filter (case-insensitive)
+            min_price: Minimum price filter
+            max_price: Maximum price filter
+            in_stock_only: Skip inactive/out-of-stock products
+
+        Returns:
+            (product_id, bm25_score) pairs, best first
+        """
+        if not self.ids:
+            return []
+
+        category = category.lower() if category else None
+        total_docs = len(self.ids)
+        scores: Dict[int, float] = defaultdict(float)
+
+        for term in dict.fromkeys(analyze(query)):
+            for matched, boost in self.expand(term):
+                postings = self.postings[matched]
+                idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc, tf in postings.items():
+                    if not self._passes(doc, category, min_price, max_price, in_stock_only):
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc] / (self.average_length or 1.0))
+                    scores[doc] += boost * idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(self.ids[doc], round(score, 4)) for doc, score in ranked]
+
+
+class KeywordIndexService:
+    """
+    Per-boutique keyword indexes, rebuilt whenever the catalog snapshot version changes
+    """
+
+    def __init__(self, max_boutiques: int = 500):
+        self.max_boutiques = max_boutiques
+        self._indexes: "OrderedDict[str, KeywordIndex]" = OrderedDict()
+        self.metrics: Dict[str, float] = {
+            "searches": 0,
+            "builds": 0,
+            "total_build_ms": 0.0,
+            "total_search_us": 0.0,
+        }
+
+    async def get_index(self, boutique_id: str) -> KeywordIndex:
+        """Return an index matching the current catalog snapshot"""
+        snapshot = await catalog_service.get_snapshot(boutique_id)
+        index = self._indexes.get(boutique_id)
+        if index is None or index.version != snapshot.version:
+            started = time.perf_counter()
+            index = KeywordIndex(snapshot)
+            self.metrics["builds"] += 1
+            self.metrics["total_build_ms"] += (time.perf_counter() - started) * 1000
+            self._indexes[boutique_id] = index
+            while len(self._indexes) > self.max_boutiques:
+                self._indexes.popitem(last=False)
+        self._indexes.move_to_end(boutique_id)
+        return index
+
+    async def search(self, boutique_id: str, query: str, **filters) -> List[Tuple[str, float]]:
+        """Ranked keyword search over a boutique's catalog (see KeywordIndex.search)"""
+        index = await self.get_index(boutique_id)
+        started = time.perf_counter()
+        results = index.search(query, **filters)
+        self.metrics["searches"] += 1
+        self.metrics["total_search_us"] += (time.perf_counter() - started) * 1e6
+        return results
+
+    def stats(self) -> Dict[str, float]:
+        """Index metrics"""
+        searches = self.metrics["searches"]
+        return {
+            "boutiques": len(self._indexes),
+            "terms": sum(len(index.postings) for index in self._indexes.values()),
+            "avg_search_us": round(self.metrics["total_search_us"] / searches, 1) if searches else 0.0,
+            **self.metrics,
+        }
+
+
+# Global instance
+keyword_index_service = KeywordIndexService()
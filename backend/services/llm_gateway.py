@@ -0,0 +1,338 @@
+"""
+LLM Gateway - Process-wide Gemini access
+Configures the Gemini SDK once, caches model handles (so the underlying async
+transport and its connections are reused) and runs every call through the
+async API with a concurrency limit and a per-call timeout.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import google.generativeai as genai
+from google.generativeai import caching
+
+logger = logging.getLogger(__name__)
+
+# Usage totals of the calls made inside track_usage() (per task, see contextvars)
+_usage_sink: ContextVar[Optional[Dict[str, float]]] = ContextVar("llm_usage_sink", default=None)
+
+
+def _empty_usage() -> Dict[str, float]:
+    return {"calls": 0, "total_latency_ms": 0.0, "input_tokens": 0, "output_tokens": 0}
+
+
+class LLMGateway:
+    """
+    Shared entry point for generation, chat and embedding calls.
+
+    Configuration (environment):
+        GEMINI_API_KEY / GOOGLE_API_KEY: API key
+        LLM_DEFAULT_MODEL: Model used when a caller does not name one
+        LLM_MAX_CONCURRENCY: Maximum generation calls in flight
+        LLM_TIMEOUT_SECONDS: Default per-call timeout
+        LLM_MAX_CACHED_MODELS: Maximum handles kept for context-cached prompts
+        EMBEDDING_CONCURRENCY: Maximum embedding calls in flight
+    """
+
+    def __init__(self):
+        self.api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+        self.default_model = os.getenv("LLM_DEFAULT_MODEL", "gemini-2.0-flash")
+        self.timeout = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+        self.max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+        self.embedding_concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+        self.max_cached_models = int(os.getenv("LLM_MAX_CACHED_MODELS", "256"))
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._embed_semaphore = asyncio.Semaphore(self.embedding_concurrency)
+        self._models: Dict[Any, genai.GenerativeModel] = {}
+        self._cached_models: "OrderedDict[str, genai.GenerativeModel]" = OrderedDict()
+        self._configured = False
+
+        self.metrics: Dict[str, Any] = {
+            "calls": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "in_flight": 0,
+            "total_latency_ms": 0.0,
+            "embed_calls": 0,
+            "context_caches_created": 0,
+        }
+        # Per-model calls, latency and token usage (for per-tier cost reporting)
+        self.model_metrics: Dict[str, Dict[str, float]] = {}
+
+    def configure(self):
+        """Configure the SDK once (called at startup, and lazily on first use)"""
+        if self._configured:
+            return
+        if self.api_key:
+            genai.configure(api_key=self.api_key)
+        else:
+            logger.warning("⚠️ GEMINI_API_KEY or GOOGLE_API_KEY not found in environment variables")
+        self._configured = True
+        logger.info(f"🧠 LLM gateway ready (default model {self.default_model}, {self.max_concurrency} concurrent calls)")
+
+    def model(self, name: Optional[str] = None, **kwargs) -> genai.GenerativeModel:
+        """
+        Cached model handle
+
+        Args:
+            name: Model name (defaults to LLM_DEFAULT_MODEL)
+            **kwargs: GenerativeModel options (tools, system_instruction, ...)
+        """
+        self.configure()
+        name = name or self.default_model
+        key = (name, repr(sorted(kwargs.items())))
+        model = self._models.get(key)
+        if model is None:
+            model = genai.GenerativeModel(model_name=name, **kwargs)
+            self._models[key] = model
+        return model
+
+    def cached_model(self, cached_content: caching.CachedContent) -> genai.GenerativeModel:
+        """Model handle bound to a Gemini context cache (see create_context_cache)"""
+        model = self._cached_models.get(cached_content.name)
+        if model is None:
+            self.configure()
+            model = genai.GenerativeModel.from_cached_content(cached_content)
+            self._cached_models[cached_content.name] = model
+            while len(self._cached_models) > self.max_cached_models:
+                self._cached_models.popitem(last=False)
+        else:
+            self._cached_models.move_to_end(cached_content.name)
+        return model
+
+    async def create_context_cache(
+        self,
+        model: str,
+        system_instruction: str,
+        ttl_seconds: float,
+        display_name: Optional[str] = None
+    ) -> caching.CachedContent:
+        """
+        Register a long, reused prompt prefix as Gemini cached content
+
+        Cached input tokens are billed at a reduced rate and are not re-processed
+        on every call. The cache expires on Gemini's side after ttl_seconds.
+        """
+        self.configure()
+        cached_content = await asyncio.wait_for(
+            asyncio.to_thread(
+                caching.CachedContent.create,
+                model=model,
+                display_name=display_name,
+                system_instruction=system_instruction,
+                ttl=datetime.timedelta(seconds=ttl_seconds)
+            ),
+            timeout=self.timeout
+        )
+        self.metrics["context_caches_created"] += 1
+        return cached_content
+
+    def _handle(self, model: Optional[str], cached_content: Optional[caching.CachedContent], model_kwargs) -> genai.GenerativeModel:
+        if cached_content is not None:
+            return self.cached_model(cached_content)
+        return self.model(model, **model_kwargs)
+
+    def _model_entry(self, name: str) -> Dict[str, float]:
+        entry = self.model_metrics.get(name)
+        if entry is None:
+            entry = _empty_usage()
+            self.model_metrics[name] = entry
+        return entry
+
+    @contextmanager
+    def track_usage(self) -> Iterator[Dict[str, float]]:
+        """
+        Collect calls, latency and token usage of the generation calls made
+        inside the block (by this task and the tasks it starts)
+
+        Yields:
+            {"calls", "total_latency_ms", "input_tokens", "output_tokens"}, filled in as calls finish
+        """
+        usage = _empty_usage()
+        token = _usage_sink.set(usage)
+        try:
+            yield usage
+        finally:
+            _usage_sink.reset(token)
+
+    def _record(self, model_name: Optional[str], latency_ms: float, response: Any = None):
+        """Add one call's latency and token usage to the per-model metrics (and any tracked block)"""
+        self.metrics["total_latency_ms"] += latency_ms
+        entries = [_usage_sink.get()]
+        if model_name:
+            entries.append(self._model_entry(model_name.rsplit("/", 1)[-1]))
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", None)
+        output_tokens = getattr(usage, "candidates_token_count", None)
+        for entry in entries:
+            if entry is None:
+                continue
+            entry["calls"] += 1
+            entry["total_latency_ms"] += latency_ms
+            if isinstance(prompt_tokens, int):
+                entry["input_tokens"] += prompt_tokens
+            if isinstance(output_tokens, int):
+                entry["output_tokens"] += output_tokens
+
+    async def _call(self, coroutine_factory, timeout: Optional[float], model_name: Optional[str] = None):
+        """Run one SDK call under the concurrency limit and deadline"""
+        async with self._semaphore:
+            self.metrics["calls"] += 1
+            self.metrics["in_flight"] += 1
+            started = time.perf_counter()
+            response = None
+            try:
+                response = await asyncio.wait_for(coroutine_factory(), timeout=timeout or self.timeout)
+                return response
+            except asyncio.TimeoutError:
+                self.metrics["timeouts"] += 1
+                raise
+            except Exception:
+                self.metrics["failures"] += 1
+                raise
+            finally:
+                self.metrics["in_flight"] -= 1
+                self._record(model_name, (time.perf_counter() - started) * 1000, response)
+
+    async def generate(
+        self,
+        contents: Any,
+        model: Optional[str] = None,
+        generation_config: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        cached_content: Optional[caching.CachedContent] = None,
+        **model_kwargs
+    ):
+        """
+        Generate content without blocking the event loop
+
+        Args:
+            contents: Prompt string or list of parts
+            model: Model name (defaults to LLM_DEFAULT_MODEL)
+            generation_config: Generation options (temperature, response_mime_type, ...)
+            timeout: Seconds before the call is abandoned (defaults to LLM_TIMEOUT_SECONDS)
+            cached_content: Context cache holding the prompt prefix (created for model)
+
+        Returns:
+            GenerateContentResponse
+        """
+        handle = self._handle(model, cached_content, model_kwargs)
+        return await self._call(
+            lambda: handle.generate_content_async(contents, generation_config=generation_config),
+            timeout,
+            model or self.default_model
+        )
+
+    async def stream(
+        self,
+        contents: Any,
+        model: Optional[str] = None,
+        generation_config: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        cached_content: Optional[caching.CachedContent] = None,
+        **model_kwargs
+    ) -> AsyncIterator[str]:
+        """
+        Stream generated text chunks as they arrive
+
+        The concurrency slot is held until the stream is exhausted, and the
+        timeout applies to the whole generation.
+        """
+        handle = self._handle(model, cached_content, model_kwargs)
+        deadline = time.monotonic() + (timeout or self.timeout)
+
+        async with self._semaphore:
+            self.metrics["calls"] += 1
+            self.metrics["in_flight"] += 1
+            started = time.perf_counter()
+            last_chunk = None
+            try:
+                response = await asyncio.wait_for(
+                    handle.generate_content_async(contents, generation_config=generation_config, stream=True),
+                    timeout=max(deadline - time.monotonic(), 0.001)
+                )
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(
+                            chunks.__anext__(),
+                            timeout=max(deadline - time.monotonic(), 0.001)
+                        )
+                    except StopAsyncIteration:
+                        break
+                    last_chunk = chunk
+                    if chunk.parts:
+                        yield chunk.text
+            except asyncio.TimeoutError:
+                self.metrics["timeouts"] += 1
+                raise
+            except Exception:
+                self.metrics["failures"] += 1
+                raise
+            finally:
+                self.metrics["in_flight"] -= 1
+                # Usage totals arrive on the final chunk
+                self._record(model or self.default_model, (time.perf_counter() - started) * 1000, last_chunk)
+
+    async def generate_text(self, contents: Any, model: Optional[str] = None, **kwargs) -> str:
+        """Generate content and return the response text"""
+        response = await self.generate(contents, model=model, **kwargs)
+        return response.text
+
+    async def send_message(self, chat, content: Any, timeout: Optional[float] = None):
+        """Send a message on a chat session (see GenerativeModel.start_chat)"""
+        model_name = getattr(getattr(chat, "model", None), "model_name", None)
+        return await self._call(lambda: chat.send_message_async(content), timeout, model_name)
+
+    async def embed(
+        self,
+        content: Any,
+        model: str,
+        task_type: str,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Embed one text or a batch of texts
+
+        Returns:
+            {"embedding": [...]} (a list of embeddings for batch input)
+        """
+        self.configure()
+        async with self._embed_semaphore:
+            self.metrics["embed_calls"] += 1
+            return await asyncio.wait_for(
+                genai.embed_content_async(model=model, content=content, task_type=task_type),
+                timeout=timeout or self.timeout
+            )
+
+    def model_stats(self, name: str) -> Dict[str, float]:
+        """Calls, latency and token usage for one model"""
+        entry = self.model_metrics.get(name)
+        if entry is None:
+            return {"calls": 0, "total_latency_ms": 0.0, "input_tokens": 0, "output_tokens": 0}
+        return dict(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        """Gateway metrics"""
+        calls = self.metrics["calls"]
+        return {
+            "default_model": self.default_model,
+            "max_concurrency": self.max_concurrency,
+            "cached_models": len(self._models),
+            "context_cached_models": len(self._cached_models),
+            "avg_latency_ms": round(self.metrics["total_latency_ms"] / calls, 1) if calls else 0.0,
+            **self.metrics,
+            "models": {name: dict(entry) for name, entry in self.model_metrics.items()},
+        }
+
+
+# Global instance
+llm_gateway = LLMGateway()
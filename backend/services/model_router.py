@@ -0,0 +1,273 @@
+"""
+Model Router - Pick the cheapest model tier that can handle a message
+Greetings and thanks are left to templates (see orchestrator/fast_path.py),
+FAQs and cart/price lookups go to a flash-class model, and the pro model is kept
+for image analysis and open-ended recommendations. Classification is local:
+keyword rules first, then a small naive Bayes classifier over the message, so
+routing adds no API call.
+"""
+
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+from backend.services.llm_gateway import llm_gateway
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE = "template"
+FLASH = "flash"
+PRO = "pro"
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+GREETING_PATTERN = re.compile(
+    r"^(hi+|hey+|hello+|helo|hallo|habari|habari yako|mambo|jambo|niaje|sasa|vipi|"
+    r"good (morning|afternoon|evening)|hi there|hello there)[\s!.,👋😊]*$"
+)
+THANKS_PATTERN = re.compile(
+    r"^(thanks?|thank you( so much| very much)?|thanx|thx|asante( sana)?|ok(ay)? thanks?|"
+    r"sawa asante|great thanks?)[\s!.,🙏😊]*$"
+)
+_COMPLEX = re.compile(
+    r"\b(recommend\w*|suggest\w*|advice|advise|outfit|occasion|wedding|graduation|"
+    r"party|match\w*|go with|compare|difference|which is better|what should i|style me|"
+    r"\w*pendekez\w*|nishauri)\b"
+)
+_LOOKUP = re.compile(
+    r"\b(price|cost|how much|bei|ngapi|cart|checkout|pay|mpesa|m-pesa|order|track|"
+    r"deliver\w*|open|hours|location|where are you|size|sizes|stock|available)\b"
+)
+
+# Seed examples for the fallback classifier (English and Swahili)
+TRAINING_EXAMPLES = {
+    FLASH: [
+        "how much is the red dress",
+        "do you have size m",
+        "is the black jacket available",
+        "what sizes do you have for the jeans",
+        "add it to my cart",
+        "show me my cart",
+        "i want to pay",
+        "send me the mpesa prompt",
+        "where is my order",
+        "do you deliver to kisumu",
+        "what time do you open",
+        "where are you located",
+        "bei ya hii ni ngapi",
+        "mna size large",
+        "nataka kulipa",
+        "je mnafanya delivery",
+        "do you have red dresses",
+        "show me shoes",
+        "any bags under 3000",
+        "yes please",
+    ],
+    PRO: [
+        "what would look good on me for a wedding",
+        "i need an outfit for my graduation next week",
+        "can you recommend something for a beach holiday",
+        "which of these two dresses is better for a dinner date",
+        "help me put together a look for an office party",
+        "i am plus size and i want something flattering",
+        "what shoes go with the green maxi dress",
+        "suggest a gift for my mother she likes bright colours",
+        "i have a budget of 10000 what complete outfit can i get",
+        "compare the linen shirt and the cotton shirt",
+        "nipendekezee nguo ya harusi",
+        "what is trending this season and what suits a pear body shape",
+    ],
+}
+
+
+class Route(NamedTuple):
+    """Routing decision for one message"""
+    tier: str
+    model: Optional[str]
+    intent: str
+    reason: str
+
+
+class NaiveBayesIntent:
+    """Multinomial naive Bayes over word unigrams and bigrams"""
+
+    def __init__(self, examples: Dict[str, List[str]]):
+        self.priors: Dict[str, float] = {}
+        self.likelihoods: Dict[str, Dict[str, float]] = {}
+        self.unknown: Dict[str, float] = {}
+
+        vocabulary = set()
+        counts: Dict[str, Counter] = {}
+        for label, texts in examples.items():
+            counts[label] = Counter(feature for text in texts for feature in self.features(text))
+            vocabulary.update(counts[label])
+
+        total_examples = sum(len(texts) for texts in examples.values())
+        for label, texts in examples.items():
+            total = sum(counts[label].values()) + len(vocabulary)
+            self.priors[label] = math.log(len(texts) / total_examples)
+            self.likelihoods[label] = {
+                feature: math.log((count + 1) / total) for feature, count in counts[label].items()
+            }
+            self.unknown[label] = math.log(1 / total)
+
+    @staticmethod
+    def features(text: str) -> List[str]:
+        words = _WORD.findall(text.lower())
+        return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+    def predict(self, text: str) -> Dict[str, float]:
+        """Posterior probability per label"""
+        features = self.features(text)
+        scores = {
+            label: prior + sum(self.likelihoods[label].get(f, self.unknown[label]) for f in features)
+            for label, prior in self.priors.items()
+        }
+        best = max(scores.values())
+        exp = {label: math.exp(score - best) for label, score in scores.items()}
+        total = sum(exp.values())
+        return {label: value / total for label, value in exp.items()}
+
+
+class ModelRouter:
+    """
+    Routes each message to a model tier and tracks per-tier latency and cost.
+
+    Configuration (environment):
+        MODEL_ROUTING_ENABLED: "false" sends every orchestrator call to the flash tier
+        LLM_FLASH_MODEL: Fast, cheap model (defaults to LLM_MODEL)
+        LLM_PRO_MODEL: High-reasoning model for images and recommendations
+        MODEL_ROUTER_PRO_THRESHOLD: Classifier probability needed to pick pro
+        LLM_FLASH_PRICE_INPUT / LLM_FLASH_PRICE_OUTPUT: USD per million tokens
+        LLM_PRO_PRICE_INPUT / LLM_PRO_PRICE_OUTPUT: USD per million tokens
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("MODEL_ROUTING_ENABLED", "true").lower() == "true"
+        self.models = {
+            FLASH: os.getenv("LLM_FLASH_MODEL", os.getenv("LLM_MODEL", "gemini-2.0-flash")),
+            PRO: os.getenv("LLM_PRO_MODEL", "gemini-2.5-pro"),
+        }
+        self.prices = {
+            FLASH: (float(os.getenv("LLM_FLASH_PRICE_INPUT", "0.10")), float(os.getenv("LLM_FLASH_PRICE_OUTPUT", "0.40"))),
+            PRO: (float(os.getenv("LLM_PRO_PRICE_INPUT", "1.25")), float(os.getenv("LLM_PRO_PRICE_OUTPUT", "10.0"))),
+        }
+        self.pro_threshold = float(os.getenv("MODEL_ROUTER_PRO_THRESHOLD", "0.8"))
+        self.classifier = NaiveBayesIntent(TRAINING_EXAMPLES)
+
+        # Usage of the calls made for routed messages only (summaries and other
+        # callers of the same model are not counted)
+        self.usage: Dict[str, Dict[str, float]] = {
+            tier: {"calls": 0, "total_latency_ms": 0.0, "input_tokens": 0, "output_tokens": 0}
+            for tier in self.models
+        }
+        self.routed: Dict[str, int] = defaultdict(int)
+        self.reasons: Dict[str, int] = defaultdict(int)
+        self.metrics: Dict[str, float] = {"routes": 0, "total_route_us": 0.0}
+
+    def model_for(self, tier: str) -> str:
+        """Model name for a tier ("flash" or "pro")"""
+        return self.models[tier]
+
+    def route(
+        self,
+        message: str,
+        history: Optional[List[Dict[str, Any]]] = None,
+        has_image: bool = False
+    ) -> Route:
+        """
+        Choose a tier for a customer message
+
+        Args:
+            message: Customer message (coalesced burst)
+            history: Recent messages, oldest first ({"role", "content"})
+            has_image: Whether the customer sent an image
+
+        Returns:
+            Route with tier, model name (None for templates: callers without a
+            template for the intent use the flash model), intent and reason
+        """
+        started = time.perf_counter()
+        route = self._classify((message or "").strip().lower(), history or [], has_image)
+        if not self.enabled:
+            route = Route(FLASH, self.models[FLASH], route.intent, "routing_disabled")
+
+        self.routed[route.tier] += 1
+        self.reasons[route.reason] += 1
+        self.metrics["routes"] += 1
+        self.metrics["total_route_us"] += (time.perf_counter() - started) * 1e6
+        logger.info(f"🧭 Routed to {route.tier} ({route.reason})")
+        return route
+
+    @contextmanager
+    def track(self, route: Route) -> Iterator[None]:
+        """
+        Attribute the LLM calls made inside the block to the route's tier
+        (template routes that still reach the LLM count as flash)
+        """
+        tier = route.tier if route.tier in self.usage else FLASH
+        with llm_gateway.track_usage() as usage:
+            try:
+                yield
+            finally:
+                for key, value in usage.items():
+                    self.usage[tier][key] += value
+
+    def _classify(self, text: str, history: List[Dict[str, Any]], has_image: bool) -> Route:
+        if has_image:
+            return Route(PRO, self.models[PRO], "image_analysis", "image")
+        if GREETING_PATTERN.match(text):
+            return Route(TEMPLATE, None, "greeting", "greeting")
+        if THANKS_PATTERN.match(text):
+            return Route(TEMPLATE, None, "thanks", "thanks")
+        if _COMPLEX.search(text):
+            return Route(PRO, self.models[PRO], "recommendation", "keyword")
+
+        # Short answers to the agent's last question ("M", "2", "the blue one") stay cheap
+        words = _WORD.findall(text)
+        last_agent = next((m for m in reversed(history) if m.get("role") == "agent"), None)
+        if len(words) <= 3 and last_agent and "?" in (last_agent.get("content") or ""):
+            return Route(FLASH, self.models[FLASH], "follow_up", "follow_up")
+        if _LOOKUP.search(text):
+            return Route(FLASH, self.models[FLASH], "lookup", "keyword")
+
+        probabilities = self.classifier.predict(text)
+        if probabilities[PRO] >= self.pro_threshold:
+            return Route(PRO, self.models[PRO], "recommendation", "classifier")
+        return Route(FLASH, self.models[FLASH], "general", "classifier")
+
+    def stats(self) -> Dict[str, Any]:
+        """Routing decisions plus per-tier latency and estimated cost"""
+        tiers = {}
+        for tier, model in self.models.items():
+            usage = self.usage[tier]
+            price_in, price_out = self.prices[tier]
+            calls = usage["calls"]
+            tiers[tier] = {
+                "model": model,
+                "routed": self.routed.get(tier, 0),
+                "calls": calls,
+                "avg_latency_ms": round(usage["total_latency_ms"] / calls, 1) if calls else 0.0,
+                "input_tokens": usage["input_tokens"],
+                "output_tokens": usage["output_tokens"],
+                "estimated_cost_usd": round(
+                    (usage["input_tokens"] * price_in + usage["output_tokens"] * price_out) / 1e6, 6
+                ),
+            }
+        tiers[TEMPLATE] = {"routed": self.routed.get(TEMPLATE, 0)}
+        routes = self.metrics["routes"]
+        return {
+            "enabled": self.enabled,
+            "tiers": tiers,
+            "reasons": dict(self.reasons),
+            "avg_route_us": round(self.metrics["total_route_us"] / routes, 1) if routes else 0.0,
+        }
+
+
+# Global instance
+model_router = ModelRouter()
@@ -0,0 +1,347 @@
+"""
+Product Retrieval Service - Hybrid semantic + keyword product search
+Embeds the customer's query with Gemini, runs the pgvector match_products RPC
+alongside keyword search, and fuses both rankings (reciprocal rank fusion).
+Also provides the batch backfill for products that have no embedding yet.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from backend.services.supabase_service import supabase_service
+from backend.services.llm_gateway import llm_gateway
+from backend.services.catalog_service import catalog_service
+from backend.services.vector_index import vector_index_service
+from backend.services.keyword_index import keyword_index_service
+from backend.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Reciprocal rank fusion constant (standard value from the RRF paper)
+RRF_K = 60
+
+
+class ProductRetrievalService:
+    """
+    Hybrid product retrieval.
+
+    Configuration (environment):
+        EMBEDDING_MODEL: Gemini embedding model (768 dimensions, matches products.embedding)
+        PRODUCT_MATCH_THRESHOLD: Minimum cosine similarity for semantic matches
+        PRODUCT_MATCH_COUNT: Semantic candidates fetched before fusion
+        EMBEDDING_BATCH_SIZE: Products embedded per request during backfill
+    """
+
+    def __init__(self):
+        self.model = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
+        self.match_threshold = float(os.getenv("PRODUCT_MATCH_THRESHOLD", "0.5"))
+        self.match_count = int(os.getenv("PRODUCT_MATCH_COUNT", "20"))
+        self.batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "50"))
+
+        # Customers repeat the same short queries ("red dress"); skip re-embedding them
+        self._query_embeddings = TTLCache(maxsize=2000, ttl=3600)
+
+    @staticmethod
+    def product_text(product: Dict[str, Any]) -> str:
+        """Text representation of a product used for its document embedding"""
+        parts = [product.get("name") or "", product.get("category") or "", product.get("description") or ""]
+        for field in ("colors", "tags"):
+            values = product.get(field) or []
+            if isinstance(values, list):
+                parts.append(" ".join(str(value) for value in values))
+        return ". ".join(part for part in parts if part)
+
+    async def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a customer query (cached)
+
+        Args:
+            text: Query text
+
+        Returns:
+            768-dim embedding
+        """
+        key = " ".join(text.lower().split())
+
+        async def load():
+            result = await llm_gateway.embed(key, model=self.model, task_type="retrieval_query")
+            return result["embedding"]
+
+        return await self._query_embeddings.get_or_load(key, load)
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of product texts in a single request"""
+        result = await llm_gateway.embed(texts, model=self.model, task_type="retrieval_document")
+        return result["embedding"]
+
+    async def semantic_search(
+        self,
+        boutique_id: str,
+        query: str,
+        match_threshold: Optional[float] = None,
+        match_count: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Vector search for a text query"""
+        embedding = await self.embed_query(query)
+        return await self.match_embedding(boutique_id, embedding, match_threshold, match_count)
+
+    async def match_embedding(
+        self,
+        boutique_id: str,
+        embedding: List[float],
+        match_threshold: Optional[float] = None,
+        match_count: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Products most similar to an embedding. Answered by the in-process vector
+        index when enabled, otherwise by the match_products RPC.
+
+        Returns:
+            Rows shaped like match_products (id, name, description, price, image_urls, similarity)
+        """
+        threshold = self.match_threshold if match_threshold is None else match_threshold
+        count = match_count or self.match_count
+
+        matches = await vector_index_service.search(boutique_id, embedding, threshold, count)
+        if matches is not None:
+            snapshot = await catalog_service.get_snapshot(boutique_id)
+            rows = []
+            for product_id, similarity in matches:
+                record = snapshot.products.get(product_id)
+                if record is None or not record.is_active:
+                    continue
+                rows.append({
+                    "id": record.id,
+                    "name": record.name,
+                    "description": record.description,
+                    "price": record.price,
+                    "image_urls": record.image_urls,
+                    "similarity": similarity,
+                })
+            return rows
+
+        return await supabase_service.match_products(
+            boutique_id,
+            embedding,
+            match_threshold=threshold,
+            match_count=count
+        )
+
+    async def search_by_image(
+        self,
+        boutique_id: str,
+        image_analysis: Dict[str, Any],
+        limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """
+        Products visually similar to a customer photo
+
+        Args:
+            boutique_id: Boutique UUID
+            image_analysis: Attributes extracted by GeminiService.analyze_product_image
+
+        Returns:
+            In-stock products, most similar first
+        """
+        parts = [image_analysis.get("description") or "", image_analysis.get("category") or ""]
+        for field in ("colors", "patterns", "search_keywords"):
+            values = image_analysis.get(field) or []
+            if isinstance(values, list):
+                parts.append(" ".join(str(value) for value in values))
+        text = ". ".join(part for part in parts if part)
+        if not text:
+            return []
+
+        rows = await self.semantic_search(boutique_id, text, match_count=max(limit * 2, limit))
+        snapshot = await catalog_service.get_snapshot(boutique_id)
+        results = []
+        for row in rows:
+            record = snapshot.products.get(row["id"])
+            if record is not None and not record.available:
+                continue
+            results.append({**(record.to_dict() if record else {}), **row})
+            if len(results) >= limit:
+                break
+        return results
+
+    async def keyword_search(
+        self,
+        boutique_id: str,
+        query: str,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Ranked keyword search from the in-process inverted index, falling back
+        to the database if the catalog cannot be loaded
+        """
+        try:
+            matches = await keyword_index_service.search(
+                boutique_id, query,
+                limit=self.match_count,
+                category=category, min_price=min_price, max_price=max_price
+            )
+            snapshot = await catalog_service.get_snapshot(boutique_id)
+            return [
+                {**snapshot.products[product_id].to_dict(), "keyword_score": score}
+                for product_id, score in matches
+                if product_id in snapshot.products
+            ]
+        except Exception as e:
+            logger.warning(f"Keyword index unavailable, searching the database: {e}")
+            return await supabase_service.search_products_by_text(
+                boutique_id, query,
+                category=category, min_price=min_price, max_price=max_price,
+                limit=self.match_count
+            )
+
+    async def search(
+        self,
+        boutique_id: str,
+        query: str,
+        limit: int = 5,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Hybrid search: semantic and keyword retrieval run concurrently and are
+        merged with reciprocal rank fusion. Either side failing degrades to the other.
+
+        Args:
+            boutique_id: Boutique UUID (results never cross tenants)
+            query: Customer query text
+            limit: Maximum products returned
+            category: Optional category filter
+            min_price: Optional minimum price
+            max_price: Optional maximum price
+
+        Returns:
+            Products, best match first (each with a "score")
+        """
+        semantic, keyword = await asyncio.gather(
+            self.semantic_search(boutique_id, query),
+            self.keyword_search(
+                boutique_id, query,
+                category=category, min_price=min_price, max_price=max_price
+            ),
+            return_exceptions=True
+        )
+        if isinstance(semantic, Exception):
+            logger.warning(f"Semantic search unavailable, using keyword results only: {semantic}")
+            semantic = []
+        if isinstance(keyword, Exception):
+            logger.warning(f"Keyword search failed: {keyword}")
+            keyword = []
+
+        # Semantic rows only carry a few columns; fill in stock/sizes/category from the catalog snapshot
+        try:
+            snapshot = await catalog_service.get_snapshot(boutique_id)
+        except Exception as e:
+            logger.warning(f"Catalog snapshot unavailable for search enrichment: {e}")
+            snapshot = None
+
+        candidates: Dict[str, Dict[str, Any]] = {}
+        scores: Dict[str, float] = {}
+        for results in (semantic, keyword):
+            for rank, row in enumerate(results or []):
+                product_id = row["id"]
+                merged = candidates.setdefault(product_id, {})
+                merged.update((k, v) for k, v in row.items() if k != "embedding")
+                scores[product_id] = scores.get(product_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        ranked = []
+        for product_id in sorted(scores, key=scores.get, reverse=True):
+            product = candidates[product_id]
+            record = snapshot.products.get(product_id) if snapshot else None
+            if record is not None:
+                if not record.available:
+                    continue
+                product = {**record.to_dict(), **product}
+
+            if not self._matches_filters(product, category, min_price, max_price):
+                continue
+
+            product["score"] = round(scores[product_id], 5)
+            ranked.append(product)
+            if len(ranked) >= limit:
+                break
+
+        return ranked
+
+    @staticmethod
+    def _matches_filters(
+        product: Dict[str, Any],
+        category: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float]
+    ) -> bool:
+        """Apply keyword-search filters to semantic hits too"""
+        if category and product.get("category") and product["category"].lower() != category.lower():
+            return False
+        price = product.get("price")
+        if price is not None:
+            if min_price is not None and float(price) < min_price:
+                return False
+            if max_price is not None and float(price) > max_price:
+                return False
+        return True
+
+    async def backfill_embeddings(
+        self,
+        boutique_id: Optional[str] = None,
+        page_size: int = 200
+    ) -> Dict[str, int]:
+        """
+        Compute embeddings for all active products that are missing one.
+
+        Products are embedded in batches (one request per EMBEDDING_BATCH_SIZE
+        products) with at most EMBEDDING_CONCURRENCY requests in flight.
+
+        Args:
+            boutique_id: Limit the backfill to one boutique (all boutiques if None)
+            page_size: Products fetched per database page
+
+        Returns:
+            Counts of embedded and failed products
+        """
+        totals = {"embedded": 0, "failed": 0}
+        after_id = None
+
+        async def embed_batch(products: List[Dict[str, Any]]):
+            try:
+                embeddings = await self.embed_documents([self.product_text(p) for p in products])
+                await asyncio.gather(*(
+                    supabase_service.update_product_embedding(product["id"], embedding)
+                    for product, embedding in zip(products, embeddings)
+                ))
+                for product, embedding in zip(products, embeddings):
+                    vector_index_service.upsert(product.get("boutique_id"), product["id"], embedding)
+                totals["embedded"] += len(products)
+            except Exception as e:
+                totals["failed"] += len(products)
+                logger.error(f"❌ Embedding batch failed ({len(products)} products): {e}")
+
+        while True:
+            page = await supabase_service.get_products_missing_embeddings(
+                boutique_id=boutique_id, after_id=after_id, limit=page_size
+            )
+            if not page:
+                break
+
+            batches = [page[i:i + self.batch_size] for i in range(0, len(page), self.batch_size)]
+            await asyncio.gather(*(embed_batch(batch) for batch in batches))
+            logger.info(f"🧮 Embedded {totals['embedded']} products ({totals['failed']} failed)")
+
+            after_id = page[-1]["id"]
+            if len(page) < page_size:
+                break
+
+        return totals
+
+
+# Global instance
+product_retrieval_service = ProductRetrievalService()
@@ -0,0 +1,233 @@
+"""
+Response Cache - Reuse answers to repeated customer questions
+Many WhatsApp questions are near-identical across customers of a boutique
+(opening hours, delivery fees, "do you have red dresses"). This cache stores
+the model's structured reply per boutique and serves it again for the same, or
+a semantically equivalent, question, skipping the Gemini call.
+
+Entries are only valid for the prompt_version and catalog version they were
+generated with, so edits to AI settings or inventory take effect immediately.
+Only opening questions are cached: once the agent has replied in a conversation,
+follow-ups ("how much is that one?") depend on what was said and are answered
+by the model.
+"""
+
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.services.ai_settings_service import ai_settings_service
+from backend.services.product_retrieval_service import product_retrieval_service
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+# Short replies whose meaning depends on the conversation ("yes", "2", "ok sawa")
+_CONTEXTUAL = re.compile(r"^(yes|yeah|yep|no|nope|ok|okay|sawa|ndio|hapana|thanks|asante|\d+)(\s+\w+)?$")
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace"""
+    return " ".join(_PUNCTUATION.sub(" ", message.lower()).split())
+
+
+class _Entry:
+    __slots__ = ("response", "embedding", "prompt_version", "catalog_version", "expires_at", "hits")
+
+    def __init__(self, response, embedding, prompt_version, catalog_version, expires_at):
+        self.response = response
+        self.embedding = embedding
+        self.prompt_version = prompt_version
+        self.catalog_version = catalog_version
+        self.expires_at = expires_at
+        self.hits = 0
+
+
+class ResponseCache:
+    """
+    Per-boutique exact + semantic response cache with LRU/TTL eviction.
+
+    Configuration (environment):
+        RESPONSE_CACHE_ENABLED: "true" to serve cached replies
+        RESPONSE_CACHE_SEMANTIC: "true" to also match paraphrases by embedding similarity
+        RESPONSE_CACHE_SIMILARITY: Minimum cosine similarity for a semantic hit
+        RESPONSE_CACHE_TTL: Seconds a cached reply stays valid
+        RESPONSE_CACHE_SIZE: Maximum cached replies per boutique
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+        self.semantic = os.getenv("RESPONSE_CACHE_SEMANTIC", "true").lower() == "true"
+        self.similarity_threshold = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+        self.ttl = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+        self.max_entries = int(os.getenv("RESPONSE_CACHE_SIZE", "500"))
+
+        self._boutiques: Dict[str, "OrderedDict[str, _Entry]"] = {}
+
+        self.metrics: Dict[str, int] = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "skipped": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+        # Settings edits change the prompt: drop the boutique's answers right away
+        ai_settings_service.subscribe(self.invalidate)
+
+    @staticmethod
+    def is_cacheable(message: str, history: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """Only standalone questions; short replies and follow-ups depend on the conversation so far"""
+        if any(turn.get("role") == "agent" for turn in history or []):
+            return False
+        normalized = normalize_message(message or "")
+        return len(normalized) >= 6 and not _CONTEXTUAL.match(normalized)
+
+    async def _embed(self, normalized: str) -> Optional[np.ndarray]:
+        try:
+            vector = np.asarray(await product_retrieval_service.embed_query(normalized), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Response cache embedding failed: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _live_entries(
+        self,
+        boutique_id: str,
+        prompt_version: Any,
+        catalog_version: Any
+    ) -> "OrderedDict[str, _Entry]":
+        """Drop expired or out-of-date entries and return the rest"""
+        entries = self._boutiques.get(boutique_id)
+        if entries is None:
+            return OrderedDict()
+        now = time.monotonic()
+        for key in [
+            key for key, entry in entries.items()
+            if entry.expires_at <= now
+            or entry.prompt_version != prompt_version
+            or entry.catalog_version != catalog_version
+        ]:
+            del entries[key]
+            self.metrics["evictions"] += 1
+        return entries
+
+    async def lookup(
+        self,
+        boutique_id: str,
+        message: str,
+        prompt_version: Any,
+        catalog_version: Any,
+        history: Optional[List[Dict[str, Any]]] = None
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        """
+        Find a cached reply for the message
+
+        Args:
+            boutique_id: Boutique UUID
+            message: Customer message
+            prompt_version: Current AI settings prompt_version
+            catalog_version: Current catalog snapshot version
+            history: Recent conversation messages; nothing is served once the agent has replied
+
+        Returns:
+            (cached LLM response or None, query embedding to reuse when storing)
+        """
+        if not self.enabled or not self.is_cacheable(message, history):
+            self.metrics["skipped"] += 1
+            return None, None
+
+        normalized = normalize_message(message)
+        entries = self._live_entries(boutique_id, prompt_version, catalog_version)
+
+        entry = entries.get(normalized)
+        if entry is not None:
+            entries.move_to_end(normalized)
+            entry.hits += 1
+            self.metrics["exact_hits"] += 1
+            return entry.response, entry.embedding
+
+        embedding = None
+        if self.semantic:
+            embedding = await self._embed(normalized)
+            candidates = [(key, e) for key, e in entries.items() if e.embedding is not None]
+            if embedding is not None and candidates:
+                matrix = np.vstack([e.embedding for _, e in candidates])
+                similarities = matrix @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    entries.move_to_end(key)
+                    entry.hits += 1
+                    self.metrics["semantic_hits"] += 1
+                    logger.info(f"♻️ Semantic cache hit ({similarities[best]:.3f}): '{message[:40]}' ~ '{key[:40]}'")
+                    return entry.response, embedding
+
+        self.metrics["misses"] += 1
+        return None, embedding
+
+    def store(
+        self,
+        boutique_id: str,
+        message: str,
+        prompt_version: Any,
+        catalog_version: Any,
+        response: Dict[str, Any],
+        embedding: Optional[np.ndarray] = None,
+        history: Optional[List[Dict[str, Any]]] = None
+    ):
+        """
+        Cache a reply. Replies that trigger actions (cart, payment, ...) are
+        specific to one customer and are never cached, nor are replies to
+        follow-ups in a conversation the agent has already answered.
+        """
+        if not self.enabled or not self.is_cacheable(message, history):
+            return
+        if response.get("actions") or response.get("intent") == "error" or not response.get("reply_text"):
+            return
+
+        entries = self._boutiques.setdefault(boutique_id, OrderedDict())
+        normalized = normalize_message(message)
+        entries[normalized] = _Entry(
+            response,
+            embedding,
+            prompt_version,
+            catalog_version,
+            time.monotonic() + self.ttl
+        )
+        entries.move_to_end(normalized)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.metrics["evictions"] += 1
+        self.metrics["stores"] += 1
+
+    def invalidate(self, boutique_id: str):
+        """Drop all cached replies for a boutique"""
+        if self._boutiques.pop(boutique_id, None) is not None:
+            self.metrics["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache metrics, including Gemini calls saved"""
+        hits = self.metrics["exact_hits"] + self.metrics["semantic_hits"]
+        lookups = hits + self.metrics["misses"]
+        return {
+            "enabled": self.enabled,
+            "boutiques": len(self._boutiques),
+            "entries": sum(len(entries) for entries in self._boutiques.values()),
+            "llm_calls_saved": hits,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            **self.metrics,
+        }
+
+
+# Global instance
+response_cache = ResponseCache()
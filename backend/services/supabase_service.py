@@ -2,15 +2,44 @@
 Supabase client service for database operations
 """
 
-from supabase import create_client, Client
+from supabase import AsyncClient, AsyncClientOptions
 from typing import Optional, List, Dict, Any
+import asyncio
+import httpx
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def cart_totals(customer_id: Optional[str], items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Cart in the cart_summary RPC's shape, computed from cart_items rows"""
+    lines = [
+        {**item, "line_total": float(item.get("price") or 0) * int(item.get("quantity") or 0)}
+        for item in items
+    ]
+    return {
+        "customer_id": customer_id,
+        "items": lines,
+        "item_count": sum(int(item.get("quantity") or 0) for item in lines),
+        "subtotal": sum(item["line_total"] for item in lines)
+    }
+
+
 class SupabaseService:
-    """Service for interacting with Supabase database"""
+    """
+    Service for interacting with Supabase database
+    
+    Uses the async PostgREST client over a single pooled httpx client (keep-alive,
+    HTTP/2), so database round trips never block the event loop. One instance is
+    shared by the orchestrator, the tool registry and the API routes.
+    
+    Configuration (environment):
+        SUPABASE_MAX_CONNECTIONS: Upper bound on open connections in the pool
+        SUPABASE_MAX_KEEPALIVE: Idle connections kept alive for reuse
+        SUPABASE_KEEPALIVE_EXPIRY: Seconds an idle connection is kept
+        SUPABASE_TIMEOUT_SECONDS: Default per-call timeout
+    """
     
     def __init__(self):
         self.url = os.getenv("SUPABASE_URL")
@@ -19,21 +48,60 @@ class SupabaseService:
         if not self.url or not self.service_key:
             raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in environment variables")
         
-        self.client: Client = create_client(self.url, self.service_key)
+        self.timeout = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10"))
+        self.http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("SUPABASE_MAX_CONNECTIONS", "50")),
+                max_keepalive_connections=int(os.getenv("SUPABASE_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=5.0),
+            follow_redirects=True
+        )
+        
+        self.client: AsyncClient = AsyncClient(
+            self.url,
+            self.service_key,
+            AsyncClientOptions(httpx_client=self.http_client)
+        )
+        
+        # Set to False once the database reports search_products_fts is not deployed
+        self.fts_available = True
+        # Set to False once the database reports the cart RPCs are not deployed
+        self.cart_rpc_available = True
+    
+    async def execute(self, query, timeout: Optional[float] = None):
+        """
+        Execute a PostgREST query builder with a per-call deadline
+        
+        Args:
+            query: Async query/RPC builder (e.g. client.table(...).select(...))
+            timeout: Seconds before the call is abandoned (defaults to SUPABASE_TIMEOUT_SECONDS)
+        
+        Returns:
+            PostgREST API response
+        """
+        return await asyncio.wait_for(query.execute(), timeout=timeout or self.timeout)
+    
+    async def close(self):
+        """Close pooled HTTP connections (call on shutdown)"""
+        await self.http_client.aclose()
     
     async def get_boutique(self, boutique_id: str) -> Optional[Dict[str, Any]]:
         """Get boutique by ID"""
-        response = self.client.table("boutiques").select("*").eq("id", boutique_id).execute()
+        query = self.client.table("boutiques").select("*").eq("id", boutique_id)
+        response = await self.execute(query)
         return response.data[0] if response.data else None
     
     async def get_products(self, boutique_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get products for a boutique"""
-        response = self.client.table("products")\
+        query = self.client.table("products")\
             .select("*")\
             .eq("boutique_id", boutique_id)\
             .eq("is_active", True)\
-            .limit(limit)\
-            .execute()
+            .limit(limit)
+        response = await self.execute(query)
         return response.data
     
     async def get_or_create_customer(
@@ -44,11 +112,11 @@ class SupabaseService:
     ) -> Dict[str, Any]:
         """Get existing customer or create new one"""
         # Try to get existing customer
-        response = self.client.table("customers")\
+        query = self.client.table("customers")\
             .select("*")\
             .eq("boutique_id", boutique_id)\
-            .eq("whatsapp_number", whatsapp_number)\
-            .execute()
+            .eq("whatsapp_number", whatsapp_number)
+        response = await self.execute(query)
         
         if response.data:
             return response.data[0]
@@ -59,12 +127,14 @@ class SupabaseService:
             "whatsapp_number": whatsapp_number,
             "name": name
         }
-        response = self.client.table("customers").insert(new_customer).execute()
+        query = self.client.table("customers").insert(new_customer)
+        response = await self.execute(query)
         return response.data[0]
     
     async def create_order(self, order_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new order"""
-        response = self.client.table("orders").insert(order_data).execute()
+        query = self.client.table("orders").insert(order_data)
+        response = await self.execute(query)
         return response.data[0]
     
     async def update_order_payment(
@@ -78,12 +148,45 @@ class SupabaseService:
         if mpesa_receipt:
             update_data["mpesa_receipt"] = mpesa_receipt
         
-        response = self.client.table("orders")\
+        query = self.client.table("orders")\
             .update(update_data)\
-            .eq("id", order_id)\
-            .execute()
+            .eq("id", order_id)
+        response = await self.execute(query)
         return response.data[0]
     
+    # =====================================================
+    # CONVERSATION BOOTSTRAP
+    # =====================================================
+    
+    async def bootstrap_conversation(
+        self,
+        boutique_id: str,
+        customer_phone: str,
+        messages: List[Dict[str, Any]],
+        history_limit: int = 8
+    ) -> Dict[str, Any]:
+        """
+        Get-or-create customer and conversation, save inbound messages and load
+        context in a single round trip (bootstrap_conversation RPC)
+        
+        Args:
+            boutique_id: UUID of the boutique
+            customer_phone: Normalized customer WhatsApp number
+            messages: Inbound messages, oldest first: [{"content": str, "attachments": [str]}]
+            history_limit: Number of recent messages to return
+        
+        Returns:
+            Dict with customer, conversation, history (chronological) and ai_settings (or None)
+        """
+        query = self.client.rpc("bootstrap_conversation", {
+            "p_boutique_id": boutique_id,
+            "p_customer_phone": customer_phone,
+            "p_messages": messages,
+            "p_history_limit": history_limit
+        })
+        response = await self.execute(query)
+        return response.data
+    
     # =====================================================
     # CART MANAGEMENT
     # =====================================================
@@ -92,100 +195,174 @@ class SupabaseService:
         self,
         customer_id: str,
         product_id: str,
-        size: str,
-        quantity: int = 1
+        size: Optional[str] = None,
+        quantity: int = 1,
+        color: Optional[str] = None,
+        boutique_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Add item to customer's cart or update quantity if exists"""
+        """
+        Add item to customer's cart, or add to its quantity if the same
+        product, size and colour is already there (cart_add_item RPC: one
+        INSERT ... ON CONFLICT DO UPDATE, safe under concurrent adds)
         
-        # Check if item already in cart
-        response = self.client.table("cart_items")\
+        Args:
+            customer_id: UUID of the customer
+            product_id: UUID of the product
+            size: Chosen size, if any
+            quantity: Number of items to add
+            color: Chosen colour, if any
+            boutique_id: Only add products of this boutique
+        
+        Returns:
+            Updated cart: {"customer_id", "items", "item_count", "subtotal"}
+        """
+        if self.cart_rpc_available:
+            try:
+                rpc = self.client.rpc("cart_add_item", {
+                    "p_customer_id": customer_id,
+                    "p_product_id": product_id,
+                    "p_quantity": quantity,
+                    "p_size": size,
+                    "p_color": color,
+                    "p_boutique_id": boutique_id
+                })
+                response = await self.execute(rpc)
+                return response.data
+            except Exception as e:
+                if getattr(e, "code", None) != "PGRST202":
+                    raise
+                # Migration not applied yet
+                self.cart_rpc_available = False
+        
+        await self._add_to_cart_rows(customer_id, product_id, size or "", quantity, color or "")
+        return await self.get_customer_cart(customer_id)
+    
+    async def _add_to_cart_rows(
+        self,
+        customer_id: str,
+        product_id: str,
+        size: str,
+        quantity: int,
+        color: str
+    ):
+        """Legacy select-then-write add, used until the cart migration is deployed"""
+        query = self.client.table("cart_items")\
             .select("*")\
             .eq("customer_id", customer_id)\
             .eq("product_id", product_id)\
-            .eq("size", size)\
-            .execute()
+            .eq("size", size)
+        response = await self.execute(query)
         
         if response.data:
-            # Update existing cart item
             existing_item = response.data[0]
-            new_quantity = existing_item["quantity"] + quantity
-            
-            update_response = self.client.table("cart_items")\
-                .update({"quantity": new_quantity})\
-                .eq("id", existing_item["id"])\
-                .execute()
-            return update_response.data[0]
-        else:
-            # Get product details
-            product = self.client.table("products")\
-                .select("*")\
-                .eq("id", product_id)\
-                .execute()
-            
-            if not product.data:
-                raise ValueError(f"Product {product_id} not found")
-            
-            product_data = product.data[0]
-            
-            # Create new cart item
-            cart_item = {
+            query = self.client.table("cart_items")\
+                .update({"quantity": existing_item["quantity"] + quantity})\
+                .eq("id", existing_item["id"])
+            await self.execute(query)
+            return
+        
+        query = self.client.table("products")\
+            .select("*")\
+            .eq("id", product_id)
+        product = await self.execute(query)
+        
+        if not product.data:
+            raise ValueError(f"Product {product_id} not found")
+        
+        product_data = product.data[0]
+        query = self.client.table("cart_items")\
+            .insert({
                 "customer_id": customer_id,
                 "product_id": product_id,
                 "product_name": product_data["name"],
                 "size": size,
                 "quantity": quantity,
                 "price": product_data["price"],
-                "image_url": product_data.get("image_urls", [None])[0]
-            }
-            
-            insert_response = self.client.table("cart_items")\
-                .insert(cart_item)\
-                .execute()
-            return insert_response.data[0]
+                "image_url": (product_data.get("image_urls") or [None])[0]
+            })
+        await self.execute(query)
     
     async def remove_from_cart(
         self,
         customer_id: str,
         item_id: str
-    ) -> bool:
-        """Remove item from cart"""
-        self.client.table("cart_items")\
-            .delete()\
-            .eq("id", item_id)\
-            .eq("customer_id", customer_id)\
-            .execute()
-        return True
+    ) -> Dict[str, Any]:
+        """Remove item from cart, returning the updated cart"""
+        return await self.update_cart_quantity(item_id, 0, customer_id=customer_id)
     
     async def get_customer_cart(self, customer_id: str) -> Dict[str, Any]:
-        """Get customer's current cart"""
-        response = self.client.table("cart_items")\
+        """
+        Get customer's current cart with totals (cart_summary RPC)
+        
+        Returns:
+            {"customer_id", "items", "item_count", "subtotal"}
+        """
+        if self.cart_rpc_available:
+            try:
+                rpc = self.client.rpc("cart_summary", {"p_customer_id": customer_id})
+                response = await self.execute(rpc)
+                return response.data
+            except Exception as e:
+                if getattr(e, "code", None) != "PGRST202":
+                    raise
+                self.cart_rpc_available = False
+        
+        query = self.client.table("cart_items")\
             .select("*")\
             .eq("customer_id", customer_id)\
-            .execute()
-        
-        return {
-            "items": response.data,
-            "customer_id": customer_id
-        }
+            .order("created_at")
+        response = await self.execute(query)
+        return cart_totals(customer_id, response.data or [])
     
     async def update_cart_quantity(
         self,
         item_id: str,
-        quantity: int
+        quantity: int,
+        customer_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Update quantity of cart item"""
-        response = self.client.table("cart_items")\
-            .update({"quantity": quantity})\
-            .eq("id", item_id)\
-            .execute()
-        return response.data[0]
+        """
+        Set the quantity of a cart item; zero or less removes it
+        (cart_set_quantity RPC)
+        
+        Args:
+            item_id: UUID of the cart item
+            quantity: New quantity
+            customer_id: Only change the item if it belongs to this customer
+        
+        Returns:
+            Updated cart: {"customer_id", "items", "item_count", "subtotal"}
+        """
+        if self.cart_rpc_available:
+            try:
+                rpc = self.client.rpc("cart_set_quantity", {
+                    "p_item_id": item_id,
+                    "p_quantity": quantity,
+                    "p_customer_id": customer_id
+                })
+                response = await self.execute(rpc)
+                return response.data
+            except Exception as e:
+                if getattr(e, "code", None) != "PGRST202":
+                    raise
+                self.cart_rpc_available = False
+        
+        table = self.client.table("cart_items")
+        query = table.delete() if quantity <= 0 else table.update({"quantity": quantity})
+        query = query.eq("id", item_id)
+        if customer_id:
+            query = query.eq("customer_id", customer_id)
+        response = await self.execute(query)
+        owner = customer_id or (response.data[0]["customer_id"] if response.data else None)
+        if owner is None:
+            return cart_totals(None, [])
+        return await self.get_customer_cart(owner)
     
     async def clear_cart(self, customer_id: str) -> bool:
         """Clear all items from customer's cart"""
-        self.client.table("cart_items")\
+        query = self.client.table("cart_items")\
             .delete()\
-            .eq("customer_id", customer_id)\
-            .execute()
+            .eq("customer_id", customer_id)
+        await self.execute(query)
         return True
     
     # =====================================================
@@ -195,56 +372,61 @@ class SupabaseService:
     async def check_inventory(
         self,
         product_id: str,
-        size: str
+        size: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Check inventory for a product and size"""
-        response = self.client.table("inventory")\
-            .select("*")\
-            .eq("product_id", product_id)\
-            .eq("size", size)\
-            .execute()
+        """
+        Check available stock for a product (one primary-key read of
+        products.stock_quantity; stock held by unpaid checkouts is already
+        taken out)
         
-        if response.data:
-            return response.data[0]
-        else:
-            # No inventory record means out of stock
-            return {
-                "product_id": product_id,
-                "size": size,
-                "quantity": 0
-            }
+        Args:
+            product_id: UUID of the product
+            size: Requested size, echoed back (stock is kept per product)
+        
+        Returns:
+            {"product_id", "size", "quantity"}; quantity 0 for unknown products
+        """
+        query = self.client.table("products")\
+            .select("id, stock_quantity")\
+            .eq("id", product_id)\
+            .limit(1)
+        response = await self.execute(query)
+        
+        return {
+            "product_id": product_id,
+            "size": size,
+            "quantity": (response.data[0].get("stock_quantity") or 0) if response.data else 0
+        }
     
     async def update_inventory(
         self,
         product_id: str,
-        size: str,
+        size: Optional[str],
         quantity_change: int
     ) -> Dict[str, Any]:
-        """Update inventory quantity (positive to add, negative to subtract)"""
-        
-        # Get current inventory
-        current = await self.check_inventory(product_id, size)
-        new_quantity = current.get("quantity", 0) + quantity_change
-        
-        if new_quantity < 0:
-            raise ValueError("Insufficient inventory")
-        
-        # Update or insert
-        if current.get("id"):
-            response = self.client.table("inventory")\
-                .update({"quantity": new_quantity})\
-                .eq("id", current["id"])\
-                .execute()
-        else:
-            response = self.client.table("inventory")\
-                .insert({
-                    "product_id": product_id,
-                    "size": size,
-                    "quantity": new_quantity
-                })\
-                .execute()
+        """
+        Update inventory quantity (positive to add, negative to subtract)
+        in a single conditional UPDATE (adjust_inventory RPC)
         
-        return response.data[0]
+        Raises:
+            ValueError: If the change would take stock below zero
+        """
+        rpc = self.client.rpc("adjust_inventory", {
+            "p_product_id": product_id,
+            "p_change": quantity_change
+        })
+        try:
+            response = await self.execute(rpc)
+        except Exception as e:
+            if getattr(e, "code", None) == "P0001":
+                raise ValueError("Insufficient inventory") from e
+            raise
+        
+        return {
+            "product_id": product_id,
+            "size": size,
+            "quantity": response.data
+        }
     
     # =====================================================
     # ORDER MANAGEMENT
@@ -256,11 +438,11 @@ class SupabaseService:
         customer_id: str
     ) -> Optional[Dict[str, Any]]:
         """Get order by ID for a specific customer"""
-        response = self.client.table("orders")\
+        query = self.client.table("orders")\
             .select("*")\
             .eq("id", order_id)\
-            .eq("customer_id", customer_id)\
-            .execute()
+            .eq("customer_id", customer_id)
+        response = await self.execute(query)
         
         return response.data[0] if response.data else None
     
@@ -280,17 +462,19 @@ class SupabaseService:
         if status_filter:
             query = query.eq("order_status", status_filter)
         
-        response = query.execute()
+        response = await self.execute(query)
         return response.data
     
     async def get_order_by_transaction_id(self, transaction_id: str) -> Optional[Dict[str, Any]]:
         """Get order by transaction ID"""
-        response = self.client.table("orders").select("*").eq("transaction_id", transaction_id).single().execute()
-        return response.data if response.data else None
+        query = self.client.table("orders").select("*").eq("transaction_id", transaction_id).limit(1)
+        response = await self.execute(query)
+        return response.data[0] if response.data else None
 
     async def get_customer_by_id(self, customer_id: str) -> Optional[Dict[str, Any]]:
         """Get customer by ID"""
-        response = self.client.table("customers").select("*").eq("id", customer_id).single().execute()
+        query = self.client.table("customers").select("*").eq("id", customer_id).single()
+        response = await self.execute(query)
         return response.data if response.data else None
 
     async def update_order_status(
@@ -299,10 +483,10 @@ class SupabaseService:
         order_status: str
     ) -> Dict[str, Any]:
         """Update order status"""
-        response = self.client.table("orders")\
+        query = self.client.table("orders")\
             .update({"order_status": order_status})\
-            .eq("id", order_id)\
-            .execute()
+            .eq("id", order_id)
+        response = await self.execute(query)
         return response.data[0]
     
     # =====================================================
@@ -318,7 +502,50 @@ class SupabaseService:
         max_price: Optional[float] = None,
         limit: int = 10
     ) -> List[Dict[str, Any]]:
-        """Search products by text with filters"""
+        """
+        Full-text product search (search_products_fts RPC, GIN-indexed tsvector)
+        
+        Args:
+            boutique_id: UUID of the boutique
+            query: Customer search text
+            category: Optional category filter
+            min_price: Optional minimum price
+            max_price: Optional maximum price
+            limit: Maximum results
+        
+        Returns:
+            Products ordered by ts_rank (each with a "rank")
+        """
+        if self.fts_available:
+            try:
+                rpc = self.client.rpc("search_products_fts", {
+                    "p_boutique_id": boutique_id,
+                    "p_query": query,
+                    "p_category": category,
+                    "p_min_price": min_price,
+                    "p_max_price": max_price,
+                    "p_limit": limit
+                })
+                response = await self.execute(rpc)
+                return response.data or []
+            except Exception as e:
+                if getattr(e, "code", None) != "PGRST202":
+                    raise
+                # Migration not applied yet
+                self.fts_available = False
+        
+        return await self._search_products_ilike(boutique_id, query, category, min_price, max_price, limit)
+    
+    async def _search_products_ilike(
+        self,
+        boutique_id: str,
+        query: str,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Legacy ilike search, used until the full-text migration is deployed"""
         
         # Extract keywords from query (simple approach)
         keywords = query.lower().split()
@@ -362,19 +589,72 @@ class SupabaseService:
         if max_price is not None:
             query_builder = query_builder.lte("price", max_price)
         
-        response = query_builder.limit(limit).execute()
+        response = await self.execute(query_builder.limit(limit))
         return response.data
-    
+
+    async def match_products(
+        self,
+        boutique_id: str,
+        query_embedding: List[float],
+        match_threshold: float = 0.5,
+        match_count: int = 10
+    ) -> List[Dict[str, Any]]:
+        """
+        Vector similarity search over product embeddings (match_products RPC)
+
+        Args:
+            boutique_id: UUID of the boutique
+            query_embedding: 768-dim query embedding
+            match_threshold: Minimum cosine similarity
+            match_count: Maximum matches returned
+
+        Returns:
+            Products ordered by similarity (id, name, description, price, image_urls, similarity)
+        """
+        query = self.client.rpc("match_products", {
+            "query_embedding": query_embedding,
+            "match_threshold": match_threshold,
+            "match_count": match_count,
+            "boutique_id_filter": boutique_id
+        })
+        response = await self.execute(query)
+        return response.data or []
+
+    async def get_products_missing_embeddings(
+        self,
+        boutique_id: Optional[str] = None,
+        after_id: Optional[str] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Get active products that have no embedding yet, in id order (keyset paginated)"""
+        query = self.client.table("products")\
+            .select("id, boutique_id, name, description, category, colors, tags")\
+            .is_("embedding", "null")\
+            .eq("is_active", True)
+        if boutique_id:
+            query = query.eq("boutique_id", boutique_id)
+        if after_id:
+            query = query.gt("id", after_id)
+        response = await self.execute(query.order("id").limit(limit))
+        return response.data or []
+
+    async def update_product_embedding(self, product_id: str, embedding: List[float]) -> None:
+        """Store a product's embedding"""
+        query = self.client.table("products")\
+            .update({"embedding": embedding})\
+            .eq("id", product_id)
+        await self.execute(query)
+
     # =====================================================
     # GENERAL KNOWLEDGE
     # =====================================================
     
     async def get_boutique_info(self, boutique_id: str) -> List[Dict[str, Any]]:
         """Get general information for a boutique"""
-        response = self.client.table("boutique_info")\
+        query = self.client.table("boutique_info")\
             .select("*")\
-            .eq("boutique_id", boutique_id)\
-            .execute()
+            .eq("boutique_id", boutique_id)
+        response = await self.execute(query)
         return response.data
 
 # Global instance
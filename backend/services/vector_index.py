@@ -0,0 +1,391 @@
+"""
+Vector Index - In-process product embedding index
+For boutiques with up to a few thousand SKUs, a NumPy matrix product over
+normalized embeddings answers similarity queries in microseconds, without the
+pgvector round trip. Similarity semantics match the match_products RPC:
+cosine similarity, strictly greater than the threshold, best first.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from backend.services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 768
+
+# Rows dequantized at a time when searching an int8 index
+_SEARCH_BLOCK_ROWS = 1024
+
+
+def parse_embedding(value: Any) -> Optional[np.ndarray]:
+    """Parse a pgvector value (PostgREST returns "[0.1,0.2,...]") into float32"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    vector = np.asarray(value, dtype=np.float32)
+    if vector.ndim != 1 or vector.size == 0:
+        return None
+    return vector
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize rows (zero rows stay zero)"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class BoutiqueVectorIndex:
+    """
+    Normalized embedding matrix for one boutique.
+
+    With quantize=True rows are stored as int8 with a per-row scale (4x less
+    memory, ~1e-3 similarity error, dequantized one block of rows at a time
+    during the matrix product), otherwise as float32.
+    """
+
+    def __init__(self, boutique_id: str, dim: int = EMBEDDING_DIM, quantize: bool = False):
+        self.boutique_id = boutique_id
+        self.dim = dim
+        self.quantize = quantize
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self._matrix = np.zeros((0, dim), dtype=np.int8 if quantize else np.float32)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self.watermark: Optional[str] = None
+        self.refreshed_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Normalize (and optionally quantize) a (n, dim) block"""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        if not self.quantize:
+            return vectors, np.ones(len(vectors), dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    def build(self, product_ids: Sequence[str], vectors: Sequence[np.ndarray]):
+        """Replace the index contents"""
+        self.ids = list(product_ids)
+        self.rows = {product_id: row for row, product_id in enumerate(self.ids)}
+        if self.ids:
+            self._matrix, self._scales = self._encode(np.vstack(vectors))
+        else:
+            self._matrix = self._matrix[:0]
+            self._scales = self._scales[:0]
+
+    def upsert(self, product_id: str, vector: np.ndarray):
+        """Insert or replace one product's embedding"""
+        encoded, scale = self._encode(vector)
+        row = self.rows.get(product_id)
+        if row is None:
+            self.rows[product_id] = len(self.ids)
+            self.ids.append(product_id)
+            self._matrix = np.vstack([self._matrix, encoded])
+            self._scales = np.concatenate([self._scales, scale])
+        else:
+            self._matrix[row] = encoded[0]
+            self._scales[row] = scale[0]
+
+    def remove(self, product_id: str):
+        """Drop a product (swap-with-last, O(dim))"""
+        row = self.rows.pop(product_id, None)
+        if row is None:
+            return
+        last = len(self.ids) - 1
+        if row != last:
+            moved_id = self.ids[last]
+            self.ids[row] = moved_id
+            self.rows[moved_id] = row
+            self._matrix[row] = self._matrix[last]
+            self._scales[row] = self._scales[last]
+        self.ids.pop()
+        self._matrix = self._matrix[:last]
+        self._scales = self._scales[:last]
+
+    def search_batch(
+        self,
+        queries: np.ndarray,
+        match_threshold: float,
+        match_count: int
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Top-k cosine matches for several query embeddings at once
+
+        Args:
+            queries: (q, dim) query embeddings (need not be normalized)
+            match_threshold: Only matches with similarity > threshold are returned
+            match_count: Maximum matches per query
+
+        Returns:
+            Per query, a list of (product_id, similarity), best first
+        """
+        queries = _normalize(np.asarray(queries, dtype=np.float32).reshape(-1, self.dim))
+        if not self.ids or match_count <= 0:
+            return [[] for _ in range(len(queries))]
+
+        if self.quantize:
+            similarities = np.empty((len(queries), len(self.ids)), dtype=np.float32)
+            for start in range(0, len(self.ids), _SEARCH_BLOCK_ROWS):
+                end = start + _SEARCH_BLOCK_ROWS
+                block = self._matrix[start:end].astype(np.float32)
+                similarities[:, start:end] = (queries @ block.T) * self._scales[start:end]
+        else:
+            similarities = queries @ self._matrix.T
+
+        k = min(match_count, len(self.ids))
+        if k < len(self.ids):
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(len(self.ids)), similarities.shape)
+
+        results = []
+        for query_row, candidates in enumerate(top):
+            scores = similarities[query_row, candidates]
+            order = np.argsort(-scores, kind="stable")
+            results.append([
+                (self.ids[candidates[i]], float(scores[i]))
+                for i in order
+                if scores[i] > match_threshold
+            ])
+        return results
+
+    def search(self, query: np.ndarray, match_threshold: float, match_count: int) -> List[Tuple[str, float]]:
+        """Top-k cosine matches for a single query embedding"""
+        return self.search_batch(query, match_threshold, match_count)[0]
+
+    def memory_bytes(self) -> int:
+        return int(self._matrix.nbytes + self._scales.nbytes)
+
+
+class VectorIndexService:
+    """
+    Lazily loaded per-boutique vector indexes, kept in sync by incremental
+    refresh (updated_at watermark) and explicit upserts.
+
+    search() returns None when the local index cannot answer (disabled, or the
+    boutique is too large), in which case callers use the match_products RPC.
+
+    Configuration (environment):
+        VECTOR_INDEX_ENABLED: "true" to answer similarity queries in-process
+        VECTOR_INDEX_QUANTIZE: "true" to store embeddings as int8
+        VECTOR_INDEX_MAX_PRODUCTS: Boutiques with more embedded products use pgvector
+        VECTOR_INDEX_OVERSIZED_RECHECK_SECONDS: Age after which an oversized boutique is
+            loaded again (its catalog may have shrunk)
+        VECTOR_INDEX_MAX_BOUTIQUES: Maximum indexes kept in memory
+        VECTOR_INDEX_REFRESH_SECONDS: Age after which an index is refreshed in the background
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("VECTOR_INDEX_ENABLED", "false").lower() == "true"
+        self.quantize = os.getenv("VECTOR_INDEX_QUANTIZE", "false").lower() == "true"
+        self.max_products = int(os.getenv("VECTOR_INDEX_MAX_PRODUCTS", "20000"))
+        self.max_boutiques = int(os.getenv("VECTOR_INDEX_MAX_BOUTIQUES", "200"))
+        self.refresh_interval = float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", "60"))
+        self.oversized_recheck = float(os.getenv("VECTOR_INDEX_OVERSIZED_RECHECK_SECONDS", "900"))
+
+        self._indexes: "OrderedDict[str, BoutiqueVectorIndex]" = OrderedDict()
+        # Boutique -> when it was found to have too many products
+        self._oversized: Dict[str, float] = {}
+        self._loading: Dict[str, asyncio.Lock] = {}
+        self._background: Set[asyncio.Task] = set()
+
+        self.metrics: Dict[str, Any] = {
+            "searches": 0,
+            "fallbacks": 0,
+            "loads": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "total_search_us": 0.0,
+        }
+
+    async def get_index(self, boutique_id: str) -> Optional[BoutiqueVectorIndex]:
+        """Return the boutique's index, loading it on first use (None if not eligible)"""
+        if not self.enabled or self._is_oversized(boutique_id):
+            return None
+
+        index = self._indexes.get(boutique_id)
+        if index is None:
+            lock = self._loading.setdefault(boutique_id, asyncio.Lock())
+            async with lock:
+                index = self._indexes.get(boutique_id)
+                if index is None and not self._is_oversized(boutique_id):
+                    index = await self._load(boutique_id)
+            self._loading.pop(boutique_id, None)
+            if index is None:
+                return None
+        else:
+            self._indexes.move_to_end(boutique_id)
+            if time.monotonic() - index.refreshed_at > self.refresh_interval and not index.lock.locked():
+                task = asyncio.create_task(self._refresh_in_background(index))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+
+        return index
+
+    def _is_oversized(self, boutique_id: str) -> bool:
+        """Whether the boutique was recently found too large for a local index"""
+        found_at = self._oversized.get(boutique_id)
+        if found_at is None:
+            return False
+        if time.monotonic() - found_at > self.oversized_recheck:
+            del self._oversized[boutique_id]
+            return False
+        return True
+
+    async def search(
+        self,
+        boutique_id: str,
+        embedding: Sequence[float],
+        match_threshold: float,
+        match_count: int
+    ) -> Optional[List[Tuple[str, float]]]:
+        """
+        Local equivalent of match_products
+
+        Returns:
+            (product_id, similarity) pairs, best first, or None if the caller
+            should fall back to pgvector
+        """
+        try:
+            index = await self.get_index(boutique_id)
+        except Exception as e:
+            logger.warning(f"Vector index unavailable for {boutique_id}: {e}")
+            index = None
+
+        if index is None:
+            self.metrics["fallbacks"] += 1
+            return None
+
+        started = time.perf_counter()
+        matches = index.search(np.asarray(embedding, dtype=np.float32), match_threshold, match_count)
+        self.metrics["searches"] += 1
+        self.metrics["total_search_us"] += (time.perf_counter() - started) * 1e6
+        return matches
+
+    def upsert(self, boutique_id: str, product_id: str, embedding: Any):
+        """Apply an embedding change to a loaded index (no-op if not loaded)"""
+        index = self._indexes.get(boutique_id)
+        vector = parse_embedding(embedding)
+        if index is not None and vector is not None:
+            index.upsert(product_id, vector)
+
+    def remove(self, boutique_id: str, product_id: str):
+        """Drop a product from a loaded index"""
+        index = self._indexes.get(boutique_id)
+        if index is not None:
+            index.remove(product_id)
+
+    async def _load(self, boutique_id: str, page_size: int = 500) -> Optional[BoutiqueVectorIndex]:
+        """Full load of a boutique's active, embedded products"""
+        ids: List[str] = []
+        vectors: List[np.ndarray] = []
+        watermark = None
+        start = 0
+        while True:
+            query = supabase_service.client.table("products")\
+                .select("id, embedding, updated_at")\
+                .eq("boutique_id", boutique_id)\
+                .eq("is_active", True)\
+                .not_.is_("embedding", "null")\
+                .order("id")\
+                .range(start, start + page_size - 1)
+            response = await supabase_service.execute(query)
+            page = response.data or []
+
+            for row in page:
+                vector = parse_embedding(row.get("embedding"))
+                if vector is None:
+                    continue
+                ids.append(row["id"])
+                vectors.append(vector)
+                if row.get("updated_at") and (watermark is None or row["updated_at"] > watermark):
+                    watermark = row["updated_at"]
+
+            if len(ids) > self.max_products:
+                self._oversized[boutique_id] = time.monotonic()
+                logger.info(f"📐 {boutique_id} has over {self.max_products} embedded products, using pgvector")
+                return None
+            if len(page) < page_size:
+                break
+            start += page_size
+
+        index = BoutiqueVectorIndex(
+            boutique_id,
+            dim=len(vectors[0]) if vectors else EMBEDDING_DIM,
+            quantize=self.quantize
+        )
+        index.build(ids, vectors)
+        index.watermark = watermark
+        index.refreshed_at = time.monotonic()
+
+        self._indexes[boutique_id] = index
+        while len(self._indexes) > self.max_boutiques:
+            self._indexes.popitem(last=False)
+
+        self.metrics["loads"] += 1
+        logger.info(f"📐 Vector index loaded for {boutique_id} ({len(index)} products, {index.memory_bytes()} bytes)")
+        return index
+
+    async def _refresh(self, index: BoutiqueVectorIndex):
+        """Apply products changed since the index watermark"""
+        query = supabase_service.client.table("products")\
+            .select("id, embedding, is_active, updated_at")\
+            .eq("boutique_id", index.boutique_id)
+        if index.watermark:
+            query = query.gte("updated_at", index.watermark)
+        response = await supabase_service.execute(query)
+
+        for row in response.data or []:
+            vector = parse_embedding(row.get("embedding"))
+            if row.get("is_active") is False or vector is None:
+                index.remove(row["id"])
+            else:
+                index.upsert(row["id"], vector)
+            if row.get("updated_at") and (index.watermark is None or row["updated_at"] > index.watermark):
+                index.watermark = row["updated_at"]
+
+        index.refreshed_at = time.monotonic()
+        self.metrics["refreshes"] += 1
+
+    async def _refresh_in_background(self, index: BoutiqueVectorIndex):
+        async with index.lock:
+            try:
+                await self._refresh(index)
+            except Exception as e:
+                index.refreshed_at = time.monotonic()
+                self.metrics["refresh_failures"] += 1
+                logger.error(f"Vector index refresh failed for {index.boutique_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Index metrics"""
+        searches = self.metrics["searches"]
+        return {
+            "enabled": self.enabled,
+            "quantize": self.quantize,
+            "boutiques": len(self._indexes),
+            "vectors": sum(len(index) for index in self._indexes.values()),
+            "memory_bytes": sum(index.memory_bytes() for index in self._indexes.values()),
+            "oversized_boutiques": len(self._oversized),
+            "avg_search_us": round(self.metrics["total_search_us"] / searches, 1) if searches else 0.0,
+            **self.metrics,
+        }
+
+
+# Global instance
+vector_index_service = VectorIndexService()
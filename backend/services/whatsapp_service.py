@@ -2,6 +2,7 @@
 Twilio WhatsApp service for sending and receiving messages
 """
 
+import asyncio
 from twilio.rest import Client
 from typing import List, Optional
 import os
@@ -80,7 +81,8 @@ class WhatsAppService:
                         
                 message_params["media_url"] = processed_urls
             
-            message_instance = self.client.messages.create(**message_params)
+            # Twilio's client is blocking; keep the event loop free while it sends
+            message_instance = await asyncio.to_thread(self.client.messages.create, **message_params)
             
             # Log success
             with open("webhook_debug.log", "a", encoding="utf-8") as f:
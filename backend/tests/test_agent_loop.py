@@ -0,0 +1,96 @@
+import asyncio
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock, patch
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.orchestrator.agent_loop import AgentLoop, compact
+from backend.orchestrator.tool_executor import ToolExecutor
+from backend.orchestrator.tool_registry import ToolRegistry
+
+SCOPE = {"conversation_id": "c1", "boutique_id": "b1", "customer_id": "cust1"}
+
+
+def reply(text, actions=()):
+    return {"reply_text": text, "actions": list(actions), "intent": "product_inquiry", "entities": {}}
+
+
+class TestAgentLoop(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.registry = ToolRegistry()
+        self.inventory = AsyncMock(return_value={
+            "name": "Red Maxi Dress", "stock_quantity": 2, "embedding": [0.1] * 768, "boutique_id": "b1"
+        })
+        self.add_to_cart = AsyncMock(return_value={"status": "success"})
+        self.registry.tools["get_inventory"] = self.inventory
+        self.registry.tools["add_to_cart"] = self.add_to_cart
+        self.loop = AgentLoop(ToolExecutor(self.registry))
+
+    async def test_lookup_results_are_fed_back_for_the_final_reply(self):
+        first = reply("Let me check.", [{"tool": "get_inventory", "params": {"product_name": "red maxi"}}])
+        follow_up = AsyncMock(return_value=reply("Yes, 2 left in stock!"))
+        with patch("backend.orchestrator.agent_loop.generate_response", new=follow_up):
+            final, results, replaced = await self.loop.run("PROMPT", first, SCOPE, model="m")
+
+        self.assertTrue(replaced)
+        self.assertEqual(final["reply_text"], "Yes, 2 left in stock!")
+        self.assertEqual(final["actions"], first["actions"])
+        self.assertEqual(results[0]["stock_quantity"], 2)
+        self.inventory.assert_awaited_once_with(
+            product_name="red maxi", conversation_id="c1", boutique_id="b1", customer_id="cust1"
+        )
+
+        prompt = follow_up.await_args.args[0]
+        self.assertTrue(prompt.startswith("PROMPT\nTOOL RESULTS:\n- get_inventory"))
+        self.assertIn('"stock_quantity": 2', prompt)
+        self.assertNotIn("embedding", prompt)
+
+    async def test_identical_calls_run_once_per_turn_and_steps_are_capped(self):
+        self.loop.max_steps = 1
+        action = {"tool": "get_inventory", "params": {"product_name": "red maxi"}}
+        follow_up = AsyncMock(return_value=reply("Still checking", [action, {"tool": "get_inventory", "params": {"product_id": "p2"}}]))
+        with patch("backend.orchestrator.agent_loop.generate_response", new=follow_up):
+            final, results, _ = await self.loop.run("PROMPT", reply("Checking", [action, action]), SCOPE)
+
+        self.assertEqual(follow_up.await_count, 1)
+        self.assertEqual(self.inventory.await_count, 2)
+        self.assertEqual(self.loop.metrics["cached_tool_calls"], 2)
+        self.assertEqual(self.loop.metrics["step_cap_reached"], 1)
+        self.assertEqual(len(final["actions"]), 2)
+
+    async def test_mutation_only_reply_is_final(self):
+        first = reply("Added to your cart! 🛍️", [{"tool": "add_to_cart", "params": {"product_id": "p1"}}])
+        follow_up = AsyncMock()
+        with patch("backend.orchestrator.agent_loop.generate_response", new=follow_up):
+            final, results, replaced = await self.loop.run("PROMPT", first, SCOPE)
+        self.assertFalse(replaced)
+        self.assertEqual(final["reply_text"], "Added to your cart! 🛍️")
+        self.assertEqual(results, [{"status": "success"}])
+        follow_up.assert_not_awaited()
+
+    async def test_budget_keeps_the_first_reply(self):
+        self.loop.budget_ms = 20
+
+        async def slow(*args, **kwargs):
+            await asyncio.sleep(1)
+
+        first = reply("Let me check.", [{"tool": "get_inventory", "params": {"product_id": "p1"}}])
+        with patch("backend.orchestrator.agent_loop.generate_response", new=slow):
+            final, _, replaced = await self.loop.run("PROMPT", first, SCOPE)
+        self.assertFalse(replaced)
+        self.assertEqual(final["reply_text"], "Let me check.")
+        self.assertEqual(self.loop.metrics["budget_exhausted"], 1)
+
+    def test_compact(self):
+        result = compact([{"name": "x" * 300, "created_at": "2025", "price": 100}] * 8)
+        self.assertEqual(len(result), 5)
+        self.assertEqual(result[0], {"name": "x" * 200 + "…", "price": 100})
+
+
+if __name__ == '__main__':
+    unittest.main()
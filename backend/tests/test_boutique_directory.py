@@ -0,0 +1,76 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.services.boutique_directory import BoutiqueDirectory
+
+BOUTIQUES = [
+    {"id": "b1", "whatsapp_number": "+254700000001", "updated_at": "2025-01-01T00:00:00"},
+    {"id": "b2", "whatsapp_number": "254700000002", "updated_at": "2025-01-02T00:00:00"},
+]
+
+class TestBoutiqueDirectory(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = BoutiqueDirectory()
+        self.execute = AsyncMock(return_value=SimpleNamespace(data=[]))
+        patcher = patch("backend.services.boutique_directory.supabase_service")
+        service = patcher.start()
+        self.addCleanup(patcher.stop)
+        service.client = MagicMock()
+        service.execute = self.execute
+
+    def test_normalize_strips_formatting(self):
+        self.assertEqual(BoutiqueDirectory.normalize("whatsapp:+254 700-000-001"), "254700000001")
+        self.assertEqual(BoutiqueDirectory.normalize(None), "")
+
+    async def test_loaded_numbers_resolve_without_queries(self):
+        self.execute.return_value = SimpleNamespace(data=BOUTIQUES)
+        await self.directory.load()
+        self.execute.reset_mock()
+
+        self.assertEqual(await self.directory.resolve("whatsapp:+254700000001"), "b1")
+        self.assertEqual(await self.directory.resolve("whatsapp:+254700000002"), "b2")
+        self.execute.assert_not_called()
+        self.assertEqual(self.directory.stats()["watermark"], "2025-01-02T00:00:00")
+
+    async def test_unknown_numbers_are_negative_cached(self):
+        await self.directory.load()
+        self.execute.reset_mock()
+
+        self.assertIsNone(await self.directory.resolve("whatsapp:+254799999999"))
+        self.assertIsNone(await self.directory.resolve("whatsapp:+254799999999"))
+        self.assertEqual(self.execute.await_count, 1)
+        self.assertEqual(self.directory.metrics["negative_hits"], 1)
+
+    async def test_refresh_moves_changed_number(self):
+        self.execute.return_value = SimpleNamespace(data=BOUTIQUES)
+        await self.directory.load()
+
+        self.execute.return_value = SimpleNamespace(data=[
+            {"id": "b1", "whatsapp_number": "+254700000009", "updated_at": "2025-01-03T00:00:00"},
+        ])
+        await self.directory.refresh()
+
+        self.assertIsNone(self.directory.get("254700000001"))
+        self.assertEqual(self.directory.get("whatsapp:+254700000009"), "b1")
+        self.assertEqual(self.directory.stats()["watermark"], "2025-01-03T00:00:00")
+
+    async def test_lookup_miss_does_not_advance_watermark(self):
+        self.execute.return_value = SimpleNamespace(data=BOUTIQUES)
+        await self.directory.load()
+
+        self.execute.return_value = SimpleNamespace(data=[
+            {"id": "b3", "whatsapp_number": "+254700000003", "updated_at": "2025-01-05T00:00:00"},
+        ])
+        self.assertEqual(await self.directory.resolve("whatsapp:+254700000003"), "b3")
+        self.assertEqual(self.directory.stats()["watermark"], "2025-01-02T00:00:00")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import sys
+import asyncio
+import unittest
+from unittest import mock
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.utils.cache import TTLCache
+
+class TestTTLCache(unittest.IsolatedAsyncioTestCase):
+    def test_entries_expire(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        with mock.patch('backend.utils.cache.time.monotonic', return_value=100.0):
+            cache.set("a", 1)
+        with mock.patch('backend.utils.cache.time.monotonic', return_value=159.0):
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch('backend.utils.cache.time.monotonic', return_value=161.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.metrics["evictions"], 1)
+
+    async def test_get_or_load_is_single_flight(self):
+        cache = TTLCache()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"prompt_version": 1}
+
+        results = await asyncio.gather(*[cache.get_or_load("boutique", loader) for _ in range(5)])
+
+        self.assertEqual(calls, 1)
+        self.assertTrue(all(r == {"prompt_version": 1} for r in results))
+        self.assertEqual(await cache.get_or_load("boutique", loader), {"prompt_version": 1})
+        self.assertEqual(calls, 1)
+
+    async def test_failed_loads_are_not_cached(self):
+        cache = TTLCache()
+
+        async def failing():
+            raise RuntimeError("db down")
+
+        with self.assertRaises(RuntimeError):
+            await cache.get_or_load("boutique", failing)
+
+        async def loader():
+            return "ok"
+
+        self.assertEqual(await cache.get_or_load("boutique", loader), "ok")
+
+    async def test_invalidate_during_load_discards_result(self):
+        cache = TTLCache()
+
+        async def loader():
+            await asyncio.sleep(0.01)
+            return "stale"
+
+        task = asyncio.create_task(cache.get_or_load("boutique", loader))
+        await asyncio.sleep(0)
+        cache.invalidate("boutique")
+
+        self.assertEqual(await task, "stale")
+        self.assertNotIn("boutique", cache)
+
+    async def test_none_values_are_cached(self):
+        cache = TTLCache()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            return None
+
+        await cache.get_or_load("missing", loader)
+        await cache.get_or_load("missing", loader)
+        self.assertEqual(calls, 1)
+
+if __name__ == '__main__':
+    unittest.main()
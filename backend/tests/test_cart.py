@@ -0,0 +1,92 @@
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.orchestrator.tool_registry import ToolRegistry
+from backend.services.supabase_service import SupabaseService, cart_totals
+
+CART = {
+    "customer_id": "cust1",
+    "items": [{"id": "i1", "product_id": "p1", "quantity": 3, "price": 2500, "line_total": 7500}],
+    "item_count": 3,
+    "subtotal": 7500,
+}
+
+
+class MissingRpc(Exception):
+    code = "PGRST202"
+
+
+class TestCartService(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.service = SupabaseService()
+        self.service.client = MagicMock()
+
+    async def test_add_is_one_rpc_returning_the_cart(self):
+        self.service.execute = AsyncMock(return_value=MagicMock(data=CART))
+        cart = await self.service.add_to_cart("cust1", "p1", size="M", quantity=2, boutique_id="b1")
+
+        self.assertEqual(cart, CART)
+        self.service.client.rpc.assert_called_once_with("cart_add_item", {
+            "p_customer_id": "cust1", "p_product_id": "p1", "p_quantity": 2,
+            "p_size": "M", "p_color": None, "p_boutique_id": "b1"
+        })
+        self.service.client.table.assert_not_called()
+        self.assertEqual(self.service.execute.await_count, 1)
+
+    async def test_remove_sets_quantity_to_zero(self):
+        self.service.execute = AsyncMock(return_value=MagicMock(data={**CART, "items": []}))
+        await self.service.remove_from_cart("cust1", "i1")
+        self.service.client.rpc.assert_called_once_with("cart_set_quantity", {
+            "p_item_id": "i1", "p_quantity": 0, "p_customer_id": "cust1"
+        })
+
+    async def test_missing_rpc_falls_back_to_table_queries(self):
+        rows = [{"id": "i1", "product_id": "p1", "quantity": 1, "price": "2500.00"}]
+        self.service.execute = AsyncMock(side_effect=[MissingRpc(), MagicMock(data=rows)])
+        cart = await self.service.get_customer_cart("cust1")
+
+        self.assertFalse(self.service.cart_rpc_available)
+        self.assertEqual(cart["subtotal"], 2500.0)
+        self.assertEqual(cart["item_count"], 1)
+        self.service.client.table.assert_called_with("cart_items")
+
+    def test_cart_totals(self):
+        cart = cart_totals("cust1", [
+            {"product_id": "p1", "quantity": 2, "price": 1200},
+            {"product_id": "p2", "quantity": 1, "price": "3500.50"},
+        ])
+        self.assertEqual(cart["item_count"], 3)
+        self.assertEqual(cart["subtotal"], 5900.5)
+        self.assertEqual(cart["items"][0]["line_total"], 2400.0)
+
+
+class TestCartTools(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.registry = ToolRegistry()
+
+    async def test_add_to_cart_uses_the_customer_cart(self):
+        add = AsyncMock(return_value=CART)
+        with patch("backend.orchestrator.tool_registry.supabase_service.add_to_cart", new=add):
+            result = await self.registry.execute("add_to_cart", {
+                "product_id": "p1", "quantity": "2", "size": "M",
+                "conversation_id": "c1", "boutique_id": "b1", "customer_id": "cust1"
+            })
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["cart"]["subtotal"], 7500)
+        add.assert_awaited_once_with("cust1", "p1", size="M", quantity=2, color=None, boutique_id="b1")
+
+    async def test_cart_tools_need_a_customer(self):
+        result = await self.registry.execute("add_to_cart", {"product_id": "p1", "conversation_id": "c1"})
+        self.assertIn("error", result)
+        self.assertEqual((await self.registry.execute("get_cart", {"conversation_id": "c1"}))["items"], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.services.catalog_service import CatalogService, CatalogSnapshot
+
+PRODUCTS = [
+    {"id": "p1", "name": "Blue Denim Jacket", "price": 3500, "stock_quantity": 4,
+     "colors": ["blue"], "category": "jackets", "updated_at": "2025-01-03T00:00:00"},
+    {"id": "p2", "name": "Red Maxi Dress", "price": 2500, "stock_quantity": 2,
+     "colors": ["red"], "sizes": ["M", "L"], "category": "dresses", "updated_at": "2025-01-01T00:00:00"},
+    {"id": "p3", "name": "Red Sandals", "price": 1200, "stock_quantity": 0,
+     "colors": ["red"], "category": "shoes", "updated_at": "2025-01-02T00:00:00"},
+]
+
+class TestCatalogSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.snapshot = CatalogSnapshot("b1")
+        self.snapshot.apply(PRODUCTS, replace=True)
+
+    def test_rank_prefers_relevant_in_stock_products(self):
+        ranked = [p.id for p in self.snapshot.rank("do you have a red dress?")]
+        self.assertEqual(ranked, ["p2", "p1"])
+
+    def test_rank_without_message_uses_recency(self):
+        ranked = [p.id for p in self.snapshot.rank(None)]
+        self.assertEqual(ranked, ["p1", "p2"])
+
+    def test_incremental_apply_bumps_version_only_on_change(self):
+        version = self.snapshot.version
+        self.assertFalse(self.snapshot.apply([PRODUCTS[0]]))
+        self.assertEqual(self.snapshot.version, version)
+
+        restocked = dict(PRODUCTS[2], stock_quantity=5, updated_at="2025-01-04T00:00:00")
+        self.assertTrue(self.snapshot.apply([restocked]))
+        self.assertGreater(self.snapshot.version, version)
+        self.assertEqual(self.snapshot.watermark, "2025-01-04T00:00:00")
+        self.assertEqual(self.snapshot.rank("red sandals")[0].id, "p3")
+
+    def test_full_apply_drops_deleted_products(self):
+        self.snapshot.apply(PRODUCTS[:1], replace=True)
+        self.assertEqual(list(self.snapshot.products.keys()), ["p1"])
+
+    def test_reloaded_snapshot_never_repeats_a_version(self):
+        reloaded = CatalogSnapshot("b1")
+        reloaded.apply(PRODUCTS, replace=True)
+        self.assertNotEqual(reloaded.version, self.snapshot.version)
+
+class TestCatalogService(unittest.IsolatedAsyncioTestCase):
+    async def test_products_are_served_from_memory_after_first_load(self):
+        execute = AsyncMock(return_value=SimpleNamespace(data=PRODUCTS))
+        with patch("backend.services.catalog_service.supabase_service") as service:
+            service.client = MagicMock()
+            service.execute = execute
+
+            catalog = CatalogService()
+            first = await catalog.get_products("b1", "red dress")
+            second = await catalog.get_products("b1", "jacket")
+
+        self.assertEqual(execute.await_count, 1)
+        self.assertEqual(first[0]["id"], "p2")
+        self.assertEqual(second[0]["id"], "p1")
+
+if __name__ == '__main__':
+    unittest.main()
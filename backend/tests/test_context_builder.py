@@ -0,0 +1,161 @@
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.orchestrator import context_builder, message_handler
+from backend.orchestrator.context_builder import build_prompt, estimate_tokens
+from backend.services.conversation_summary import ConversationSummaryService
+
+SETTINGS = {"system_prompt": "You sell dresses.", "tone": "friendly", "prompt_version": 3}
+
+
+def message(role, content, minute):
+    return {"role": role, "content": content, "created_at": f"2025-02-05T10:{minute:02d}:00+00:00"}
+
+
+class TestBuildPrompt(unittest.IsolatedAsyncioTestCase):
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("hi there!"), 4)
+        self.assertEqual(estimate_tokens("unbelievable"), 3)
+
+    async def test_sections_and_current_message_not_repeated(self):
+        prompt = await build_prompt({
+            "ai_settings": SETTINGS,
+            "history": [message("agent", "Hello! How can I help?", 1), message("customer", "red dress", 2)],
+            "inventory": [{"name": "Red Maxi Dress", "price": 2500}],
+            "current_message": "red dress",
+        })
+        self.assertTrue(prompt.startswith("You sell dresses."))
+        self.assertIn("TONE: FRIENDLY", prompt)
+        self.assertIn("AGENT: Hello! How can I help?", prompt)
+        self.assertNotIn("CUSTOMER: red dress", prompt)
+        self.assertIn("- Red Maxi Dress (KES 2500)", prompt)
+        self.assertIn('Return JSON: {"reply_text": "...", "actions": [], "intent": "..."}', prompt)
+
+    async def test_summary_replaces_older_turns(self):
+        history = [message("customer", "I'm Wanjiru, size M", 1), message("agent", "Noted!", 2),
+                   message("customer", "any blue tops?", 3)]
+        prompt = await build_prompt({
+            "ai_settings": SETTINGS,
+            "conversation": {"summary": "Customer Wanjiru wears size M.", "summary_through": history[1]["created_at"]},
+            "history": history,
+            "current_message": "and jeans?",
+        })
+        self.assertIn("CONVERSATION SO FAR:\nCustomer Wanjiru wears size M.", prompt)
+        self.assertNotIn("I'm Wanjiru", prompt)
+        self.assertIn("CUSTOMER: any blue tops?", prompt)
+
+    async def test_budget_keeps_newest_turns_and_truncates_long_ones(self):
+        history = [message("customer", f"question number {i} " + "blah " * 40, i) for i in range(8)]
+        history.append(message("agent", "word " * 1000, 9))
+        with patch.object(context_builder, "PROMPT_TOKEN_BUDGET", 700):
+            prompt = await build_prompt({"ai_settings": SETTINGS, "history": history, "current_message": "ok"})
+        self.assertIn("AGENT: word", prompt)
+        self.assertIn("…", prompt)
+        self.assertNotIn("question number 0 ", prompt)
+        self.assertLessEqual(estimate_tokens(prompt), 700 + 10)
+        self.assertGreater(context_builder.prompt_stats()["history_turns_dropped"], 0)
+
+
+class TestConversationSummary(unittest.IsolatedAsyncioTestCase):
+    async def test_summarizes_aged_out_batch_once(self):
+        service = ConversationSummaryService()
+        service.enabled, service.keep_recent, service.batch_size = True, 2, 2
+        history = [message("customer" if i % 2 else "agent", f"m{i}", i) for i in range(5)]
+        conversation = {"id": "c1", "summary": "Earlier stuff.", "summary_through": history[0]["created_at"]}
+
+        query = MagicMock()
+        query.update.return_value.eq.return_value = "query"
+        with patch("backend.services.conversation_summary.llm_gateway.generate_text",
+                   new=AsyncMock(return_value=" Wants a blue top. ")) as generate, \
+                patch("backend.services.conversation_summary.supabase_service") as supabase:
+            supabase.client.table.return_value = query
+            supabase.execute = AsyncMock(return_value=MagicMock(data=history[1:3]))
+            service.schedule(conversation, history)
+            service.schedule(conversation, history)  # already in flight
+            await service.drain()
+
+        generate.assert_awaited_once()
+        prompt = generate.await_args.args[0]
+        self.assertIn("Earlier stuff.", prompt)
+        self.assertIn("CUSTOMER: m1\nAGENT: m2", prompt)
+        self.assertNotIn("m3", prompt)
+        query.update.assert_called_once_with({"summary": "Wants a blue top.", "summary_through": history[2]["created_at"]})
+        self.assertEqual(service.metrics["messages_summarized"], 2)
+        select = query.select.return_value.eq.return_value
+        select.gt.assert_called_once_with("created_at", history[0]["created_at"])
+        select.gt.return_value.lt.assert_called_once_with("created_at", history[3]["created_at"])
+
+    async def test_messages_that_slid_out_of_the_window_are_summarized(self):
+        service = ConversationSummaryService()
+        service.enabled, service.keep_recent, service.batch_size = True, 2, 2
+        backlog = [message("customer", f"old{i}", i) for i in range(6)]
+        history = [message("customer", f"m{i}", 10 + i) for i in range(4)]
+        conversation = {"id": "c1", "summary": None, "summary_through": None}
+
+        query = MagicMock()
+        with patch("backend.services.conversation_summary.llm_gateway.generate_text",
+                   new=AsyncMock(return_value="Summary")) as generate, \
+                patch("backend.services.conversation_summary.supabase_service") as supabase:
+            supabase.client.table.return_value = query
+            supabase.execute = AsyncMock(return_value=MagicMock(data=backlog + history[:2]))
+            service.schedule(conversation, history)
+            await service.drain()
+
+        self.assertIn("CUSTOMER: old0", generate.await_args.args[0])
+        query.update.assert_called_once_with({"summary": "Summary", "summary_through": history[1]["created_at"]})
+        self.assertEqual(service.metrics["messages_summarized"], 8)
+
+    def test_history_window_fits_keep_and_batch(self):
+        service = ConversationSummaryService()
+        service.keep_recent, service.batch_size = 6, 6
+        self.assertEqual(service.history_window, 12)
+        service.keep_recent, service.batch_size = 2, 2
+        self.assertEqual(service.history_window, 8)
+
+    def test_waits_for_a_full_batch(self):
+        service = ConversationSummaryService()
+        service.enabled, service.keep_recent, service.batch_size = True, 4, 4
+        history = [message("customer", f"m{i}", i) for i in range(6)]
+        service.schedule({"id": "c1"}, history)
+        self.assertEqual(service.stats()["in_flight"], 0)
+
+
+class TestBootstrapConversation(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch.object(message_handler, "_bootstrap_rpc_available", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_rpc_timeout_does_not_save_the_batch_again(self):
+        with patch.object(message_handler.supabase_service, "bootstrap_conversation",
+                          new=AsyncMock(side_effect=TimeoutError())), \
+             patch.object(message_handler, "save_message", new=AsyncMock()) as save:
+            with self.assertRaises(TimeoutError):
+                await message_handler.bootstrap_conversation("b1", "+254712345678", [{"Body": "hi"}])
+        save.assert_not_awaited()
+
+    async def test_missing_rpc_falls_back_to_per_query_bootstrap(self):
+        missing = Exception("Could not find the function")
+        missing.code = "PGRST202"
+        with patch.object(message_handler.supabase_service, "bootstrap_conversation",
+                          new=AsyncMock(side_effect=missing)), \
+             patch.object(message_handler, "get_or_create_conversation", new=AsyncMock(return_value={"id": "conv1"})), \
+             patch.object(message_handler, "save_message", new=AsyncMock()) as save, \
+             patch.object(message_handler, "get_recent_messages", new=AsyncMock(return_value=[])), \
+             patch.object(message_handler.ai_settings_service, "get_ai_settings", new=AsyncMock(return_value=None)):
+            conversation, _, _ = await message_handler.bootstrap_conversation("b1", "+254712345678", [{"Body": "hi"}])
+        self.assertEqual(conversation["id"], "conv1")
+        save.assert_awaited_once()
+        self.assertFalse(message_handler._bootstrap_rpc_available)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import os
+import sys
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, mock_open, patch
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.api import webhooks
+from backend.orchestrator.dispatcher import WebhookDispatcher
+
+class TestWebhookDispatcher(unittest.IsolatedAsyncioTestCase):
+    async def test_processes_queued_messages(self):
+        processed = []
+
+        async def handler(batch):
+            processed.extend(payload["Body"] for payload in batch)
+
+        dispatcher = WebhookDispatcher(queue_depth=10, concurrency=2, enabled=True)
+        await dispatcher.start(handler)
+
+        for body in ("hi", "do you have", "red dresses"):
+            self.assertTrue(dispatcher.submit({"From": "whatsapp:+254700000000", "Body": body}))
+
+        await dispatcher.stop()
+
+        self.assertEqual(sorted(processed), sorted(["hi", "do you have", "red dresses"]))
+        self.assertEqual(dispatcher.metrics["processed"], 3)
+        self.assertEqual(dispatcher.metrics["failed"], 0)
+
+    async def test_rejects_when_queue_full(self):
+        release = asyncio.Event()
+
+        async def handler(batch):
+            await release.wait()
+
+        dispatcher = WebhookDispatcher(queue_depth=1, concurrency=1, enabled=True)
+        await dispatcher.start(handler)
+
+        self.assertTrue(dispatcher.submit({"Body": "1"}))
+        await asyncio.sleep(0.01)  # worker picks up the first message
+        self.assertTrue(dispatcher.submit({"Body": "2"}))
+        self.assertFalse(dispatcher.submit({"Body": "3"}))
+
+        stats = dispatcher.stats()
+        self.assertEqual(stats["rejected"], 1)
+        self.assertEqual(stats["in_flight"], 1)
+        self.assertEqual(stats["queue_size"], 1)
+
+        release.set()
+        await dispatcher.stop()
+        self.assertEqual(dispatcher.metrics["processed"], 2)
+
+    async def test_handler_errors_are_counted(self):
+        async def handler(batch):
+            raise RuntimeError("boom")
+
+        dispatcher = WebhookDispatcher(queue_depth=5, concurrency=1, enabled=True)
+        await dispatcher.start(handler)
+        dispatcher.submit({"Body": "x"})
+        await dispatcher.stop()
+
+        self.assertEqual(dispatcher.metrics["failed"], 1)
+        self.assertFalse(dispatcher.running)
+
+    async def test_same_conversation_runs_in_order(self):
+        events = []
+
+        async def handler(batch):
+            body = batch[0]["Body"]
+            events.append(("start", body))
+            await asyncio.sleep(0.01 if body == "1" else 0)
+            events.append(("end", body))
+
+        dispatcher = WebhookDispatcher(queue_depth=10, concurrency=4, enabled=True)
+        await dispatcher.start(handler)
+        for body in ("1", "2", "3"):
+            dispatcher.submit({"Body": body}, key=("boutique", "254700000000"))
+        await dispatcher.stop()
+
+        self.assertEqual(events, [
+            ("start", "1"), ("end", "1"),
+            ("start", "2"), ("end", "2"),
+            ("start", "3"), ("end", "3"),
+        ])
+
+    async def test_different_conversations_run_in_parallel(self):
+        running = 0
+        peak = 0
+
+        async def handler(batch):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        dispatcher = WebhookDispatcher(queue_depth=10, concurrency=3, enabled=True)
+        await dispatcher.start(handler)
+        for phone in ("254700000001", "254700000002", "254700000003"):
+            dispatcher.submit({"Body": "hi"}, key=("boutique", phone))
+        await dispatcher.stop()
+
+        self.assertEqual(peak, 3)
+
+    async def test_idle_shards_are_evicted(self):
+        async def handler(batch):
+            pass
+
+        dispatcher = WebhookDispatcher(queue_depth=10, concurrency=2, enabled=True, idle_timeout=0.01)
+        await dispatcher.start(handler)
+        dispatcher.submit({"Body": "hi"}, key=("boutique", "254700000001"))
+        dispatcher.submit({"Body": "hi"}, key=("boutique", "254700000002"))
+        self.assertEqual(dispatcher.stats()["active_shards"], 2)
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(dispatcher.stats()["active_shards"], 0)
+        self.assertEqual(dispatcher.metrics["shards_evicted"], 2)
+        await dispatcher.stop()
+
+    async def test_max_shards_evicts_least_recently_used_idle_shard(self):
+        async def handler(batch):
+            pass
+
+        dispatcher = WebhookDispatcher(queue_depth=10, concurrency=2, enabled=True, max_shards=2)
+        await dispatcher.start(handler)
+        dispatcher.submit({"Body": "hi"}, key="a")
+        dispatcher.submit({"Body": "hi"}, key="b")
+        await asyncio.sleep(0.01)
+        dispatcher.submit({"Body": "hi"}, key="c")
+
+        self.assertEqual(list(dispatcher._shards.keys()), ["b", "c"])
+        await dispatcher.stop()
+
+    async def test_coalesces_burst_messages_into_one_batch(self):
+        batches = []
+
+        async def handler(batch):
+            batches.append([payload["Body"] for payload in batch])
+
+        dispatcher = WebhookDispatcher(queue_depth=10, concurrency=2, enabled=True, coalesce_window=0.05)
+        await dispatcher.start(handler)
+        key = ("boutique", "254700000000")
+        for body in ("hi", "do you have", "red dresses size M"):
+            dispatcher.submit({"Body": body}, key=key)
+            await asyncio.sleep(0.01)
+        dispatcher.submit({"Body": "other"}, key=("boutique", "254700000001"))
+        await dispatcher.stop()
+
+        self.assertIn(["hi", "do you have", "red dresses size M"], batches)
+        self.assertIn(["other"], batches)
+        self.assertEqual(dispatcher.metrics["batches"], 2)
+        self.assertEqual(dispatcher.metrics["coalesced_messages"], 2)
+        self.assertEqual(dispatcher.metrics["processed"], 4)
+
+    async def test_coalescing_respects_max_messages(self):
+        batches = []
+
+        async def handler(batch):
+            batches.append(len(batch))
+
+        dispatcher = WebhookDispatcher(
+            queue_depth=10, concurrency=1, enabled=True,
+            coalesce_window=0.05, coalesce_max_messages=2
+        )
+        await dispatcher.start(handler)
+        for body in ("1", "2", "3"):
+            dispatcher.submit({"Body": body}, key="conv")
+        await dispatcher.stop()
+
+        self.assertEqual(batches, [2, 1])
+
+    def test_submit_before_start_is_refused(self):
+        dispatcher = WebhookDispatcher(enabled=True)
+        self.assertFalse(dispatcher.submit({"Body": "x"}))
+
+
+class TestWebhookQueueFull(unittest.IsolatedAsyncioTestCase):
+    async def test_full_queue_acks_twilio_and_asks_customer_to_resend(self):
+        request = MagicMock()
+        request.form = AsyncMock(return_value={"From": "whatsapp:+254700000000", "To": "whatsapp:+14155238886", "Body": "hi"})
+        dispatcher = MagicMock(enabled=True, running=True)
+        dispatcher.submit.return_value = False
+        send = AsyncMock(return_value=True)
+        with patch.object(webhooks, "webhook_dispatcher", dispatcher), \
+             patch.object(webhooks.whatsapp_service, "send_message", new=send), \
+             patch("backend.api.webhooks.open", mock_open(), create=True):
+            response = await webhooks.whatsapp_webhook(request)
+        self.assertEqual(response.status_code, 200)
+        send.assert_awaited_once_with(to_number="whatsapp:+254700000000", message=webhooks.BUSY_REPLY)
+
+if __name__ == '__main__':
+    unittest.main()
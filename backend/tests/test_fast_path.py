@@ -0,0 +1,162 @@
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock, patch
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.orchestrator.fast_path import FastPath
+from backend.orchestrator.tool_registry import ToolRegistry
+from backend.services.catalog_service import CatalogSnapshot
+
+PRODUCTS = [
+    {"id": "p1", "name": "Blue Denim Jacket", "price": 3500, "stock_quantity": 4,
+     "colors": ["blue"], "sizes": ["M", "L"]},
+    {"id": "p2", "name": "Red Maxi Dress", "price": 2500, "stock_quantity": 2,
+     "colors": ["red"], "sizes": ["S", "M"]},
+    {"id": "p3", "name": "Red Sandals", "price": 1200, "stock_quantity": 0},
+]
+
+
+class TestFastPath(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.fast_path = FastPath()
+        self.fast_path.enabled = True
+        self.fast_path.tools = ToolRegistry()
+        self.snapshot = CatalogSnapshot("b1")
+        self.snapshot.apply(PRODUCTS, replace=True)
+        patcher = patch(
+            "backend.orchestrator.fast_path.catalog_service.get_snapshot",
+            new=AsyncMock(return_value=self.snapshot)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.context = {
+            "boutique_id": "b1",
+            "conversation_id": "c1",
+            "customer_id": "cust1",
+            "customer_phone": "254700000000",
+            "history": [],
+            "ai_settings": {"tone": "friendly", "do_not_say": []},
+        }
+
+    async def test_unknown_messages_fall_through(self):
+        self.assertIsNone(await self.fast_path.handle("do you have red dresses in size M?", self.context))
+        self.assertEqual(self.fast_path.metrics["misses"], 1)
+
+    async def test_greeting_follows_tone_and_overrides(self):
+        reply = await self.fast_path.handle("Hi!", self.context)
+        self.assertEqual(reply["intent"], "greeting")
+        self.assertEqual(reply["actions"], [])
+
+        self.context["ai_settings"] = {"tone": "casual"}
+        self.assertEqual((await self.fast_path.handle("hi", self.context))["reply_text"],
+                         "Hey! 👋 What are we shopping for today?")
+
+        self.context["ai_settings"] = {"tone": "casual", "reply_templates": {"greeting": "Karibu Amani Boutique!"}}
+        self.assertEqual((await self.fast_path.handle("hi", self.context))["reply_text"], "Karibu Amani Boutique!")
+
+    async def test_do_not_say_sends_message_to_llm(self):
+        self.context["ai_settings"] = {"tone": "friendly", "do_not_say": ["welcome"]}
+        self.assertIsNone(await self.fast_path.handle("hello", self.context))
+        self.assertEqual(self.fast_path.metrics["declined"], 1)
+
+    async def test_broken_override_sends_message_to_llm(self):
+        self.context["ai_settings"] = {"reply_templates": {"cart_empty": "Empty {oops}"}}
+        self.fast_path.tools.get_cart = AsyncMock(return_value={"items": []})
+        self.assertIsNone(await self.fast_path.handle("cart", self.context))
+
+    async def test_cart_lists_items_with_total(self):
+        self.fast_path.tools.get_cart = AsyncMock(return_value={"items": [
+            {"product_id": "p1", "product_name": "Blue Denim Jacket", "quantity": 1, "line_total": 3500},
+            {"product_id": "gone", "product_name": "Silk Scarf", "quantity": 2, "line_total": 5000},
+        ], "subtotal": 8500})
+        reply = await self.fast_path.handle("show my cart", self.context)
+        self.assertEqual(reply["intent"], "view_cart")
+        self.assertIn("1. Blue Denim Jacket x1 - KES 3,500", reply["reply_text"])
+        self.assertIn("2. Silk Scarf x2 - KES 5,000", reply["reply_text"])
+        self.assertIn("Total: KES 8,500", reply["reply_text"])
+        self.fast_path.tools.get_cart.assert_awaited_once_with(customer_id="cust1")
+
+    async def test_pay_sends_stk_push_for_cart_total(self):
+        self.fast_path.tools.get_cart = AsyncMock(return_value={
+            "items": [{"product_id": "p2", "product_name": "Red Maxi Dress", "quantity": 1, "line_total": 2500}],
+            "subtotal": 2500
+        })
+        self.fast_path.tools.initiate_mpesa_stk = AsyncMock(return_value={"status": "pending"})
+        reply = await self.fast_path.handle("Pay", self.context)
+        self.fast_path.tools.initiate_mpesa_stk.assert_awaited_once_with(
+            phone="254700000000", amount=2500.0, customer_id="cust1", boutique_id="b1"
+        )
+        self.assertIn("KES 2,500", reply["reply_text"])
+
+    async def test_pay_with_sold_out_item_names_it_instead_of_asking_to_retry(self):
+        self.fast_path.tools.get_cart = AsyncMock(return_value={
+            "items": [{"product_id": "p2", "product_name": "Red Maxi Dress", "quantity": 1, "line_total": 2500}],
+            "subtotal": 2500
+        })
+        self.fast_path.tools.initiate_mpesa_stk = AsyncMock(return_value={
+            "status": "failed", "reason": "stock", "message": "Insufficient inventory: Red Maxi Dress"
+        })
+        reply = await self.fast_path.handle("pay", self.context)
+        self.assertIn("Red Maxi Dress just sold out", reply["reply_text"])
+        self.assertNotIn("try again", reply["reply_text"])
+
+    async def test_pay_with_empty_cart_does_not_charge(self):
+        self.fast_path.tools.get_cart = AsyncMock(return_value={"items": []})
+        self.fast_path.tools.initiate_mpesa_stk = AsyncMock()
+        reply = await self.fast_path.handle("checkout", self.context)
+        self.assertIn("cart is empty", reply["reply_text"])
+        self.fast_path.tools.initiate_mpesa_stk.assert_not_awaited()
+
+    async def test_unreadable_cart_sends_message_to_llm(self):
+        self.fast_path.tools.get_cart = AsyncMock(return_value={"error": "timeout", "items": []})
+        self.fast_path.tools.initiate_mpesa_stk = AsyncMock()
+        self.assertIsNone(await self.fast_path.handle("checkout", self.context))
+        self.fast_path.tools.initiate_mpesa_stk.assert_not_awaited()
+
+    async def test_product_questions_are_not_commands(self):
+        self.fast_path.tools.get_cart = AsyncMock(return_value={"items": []})
+        self.fast_path.tools.get_order_status = AsyncMock()
+        for text in ("track pants", "track suits?", "track suit in black", "bag", "bag?", "show me bag"):
+            self.assertIsNone(await self.fast_path.handle(text, self.context), text)
+        self.fast_path.tools.get_cart.assert_not_awaited()
+        self.fast_path.tools.get_order_status.assert_not_awaited()
+
+    async def test_my_bag_is_the_cart(self):
+        self.fast_path.tools.get_cart = AsyncMock(return_value={"items": []})
+        reply = await self.fast_path.handle("show me my bag", self.context)
+        self.assertEqual(reply["intent"], "view_cart")
+
+    async def test_track_order(self):
+        self.fast_path.tools.get_order_status = AsyncMock(return_value={
+            "status": "found", "order_number": "ORD-1042", "order_status": "shipped",
+            "payment_status": "paid", "total_amount": 4700
+        })
+        reply = await self.fast_path.handle("where is my order ORD-1042?", self.context)
+        self.assertIn("ORD-1042", reply["reply_text"])
+        self.assertIn("shipped", reply["reply_text"])
+        self.fast_path.tools.get_order_status.assert_awaited_once_with(
+            customer_id="cust1", boutique_id="b1", order_number="ord-1042"
+        )
+
+    async def test_number_picks_item_from_last_list(self):
+        self.context["history"] = [
+            {"role": "agent", "content": "We have:\n1. *Blue Denim Jacket* - KES 3,500\n2. Red Maxi Dress (KES 2,500)\n3. Red Sandals - KES 1,200"},
+        ]
+        reply = await self.fast_path.handle("2", self.context)
+        self.assertEqual(reply["intent"], "product_selection")
+        self.assertIn("Red Maxi Dress", reply["reply_text"])
+        self.assertIn("Sizes: S, M", reply["reply_text"])
+
+        # Out of stock items and numbers without a list are left to the LLM
+        self.assertIsNone(await self.fast_path.handle("3", self.context))
+        self.context["history"] = []
+        self.assertIsNone(await self.fast_path.handle("2", self.context))
+
+
+if __name__ == '__main__':
+    unittest.main()
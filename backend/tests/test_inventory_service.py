@@ -0,0 +1,158 @@
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from fastapi import HTTPException
+
+from backend.api.payments import paylink_payment_callback
+from backend.orchestrator.tool_registry import ToolRegistry
+from backend.services.inventory_service import InventoryReservationService
+
+HOLD = {"reference": "ORD-1", "expires_at": "2025-02-07T10:10:00+00:00", "cart": {"subtotal": 2500}}
+
+
+class RpcError(Exception):
+    def __init__(self, code, message=""):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def rpc_results(*results):
+    """Patch supabase_service.execute to return (or raise) each result in turn"""
+    side_effect = [r if isinstance(r, Exception) else MagicMock(data=r) for r in results]
+    return patch("backend.services.inventory_service.supabase_service.execute", new=AsyncMock(side_effect=side_effect))
+
+
+class TestInventoryReservations(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.service = InventoryReservationService()
+        self.service.enabled = True
+
+    async def test_reserve_returns_the_hold(self):
+        with rpc_results(HOLD):
+            self.assertEqual(await self.service.reserve_cart("cust1", "ORD-1", boutique_id="b1"), HOLD)
+        self.assertEqual(self.service.metrics["reserved"], 1)
+
+    async def test_short_stock_raises_value_error(self):
+        with rpc_results(RpcError("P0001", "Insufficient inventory: Red Maxi Dress")):
+            with self.assertRaisesRegex(ValueError, "Red Maxi Dress"):
+                await self.service.reserve_cart("cust1", "ORD-1")
+        self.assertEqual(self.service.metrics["rejected"], 1)
+
+    async def test_missing_migration_disables_holds(self):
+        with rpc_results(RpcError("PGRST202")):
+            self.assertIsNone(await self.service.reserve_cart("cust1", "ORD-1"))
+        self.assertFalse(self.service.enabled)
+        self.assertEqual(await self.service.settle("TX1", paid=True), 0)
+
+    async def test_sweep_runs_batches_until_a_short_one(self):
+        self.service.sweep_batch = 2
+        with rpc_results(2, 2, 1) as execute:
+            self.assertEqual(await self.service.sweep(), 5)
+        self.assertEqual(execute.await_count, 3)
+        self.assertEqual(self.service.metrics["expired"], 5)
+
+
+class TestCheckoutHolds(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.registry = ToolRegistry()
+        self.push = AsyncMock(return_value={"success": True, "transaction_id": "TX1", "reference": "ORD-1"})
+        patches = [
+            patch("backend.orchestrator.tool_registry.paylink_service.initiate_stk_push", new=self.push),
+            patch("backend.orchestrator.tool_registry.inventory_service.attach_checkout", new=AsyncMock()),
+            patch("backend.orchestrator.tool_registry.inventory_service.settle", new=AsyncMock(return_value=1)),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_stock_is_held_before_the_push(self):
+        from backend.orchestrator.tool_registry import inventory_service
+        with patch.object(inventory_service, "reserve_cart", new=AsyncMock(return_value=HOLD)) as reserve:
+            result = await self.registry.initiate_mpesa_stk(
+                phone="254712345678", amount=2500, customer_id="cust1", boutique_id="b1"
+            )
+        reference = reserve.await_args.args[1]
+        reserve.assert_awaited_once_with("cust1", reference, boutique_id="b1")
+        inventory_service.attach_checkout.assert_awaited_once_with(reference, "TX1", "cust1")
+        self.assertEqual(result["status"], "pending")
+        self.assertEqual(result["reserved_until"], HOLD["expires_at"])
+
+    async def test_push_charges_the_held_subtotal(self):
+        from backend.orchestrator.tool_registry import inventory_service
+        with patch.object(inventory_service, "reserve_cart", new=AsyncMock(return_value=HOLD)):
+            result = await self.registry.initiate_mpesa_stk(phone="254712345678", amount=1, customer_id="cust1")
+        self.assertEqual(self.push.await_args.kwargs["amount"], 2500)
+        self.assertEqual(result["amount"], 2500)
+
+    async def test_references_are_unique(self):
+        from backend.orchestrator.tool_registry import inventory_service
+        reserve = AsyncMock(return_value=HOLD)
+        with patch.object(inventory_service, "reserve_cart", new=reserve):
+            await self.registry.initiate_mpesa_stk(phone="254712345678", amount=2500, customer_id="cust1")
+            await self.registry.initiate_mpesa_stk(phone="254712345678", amount=2500, customer_id="cust2")
+        first, second = (call.args[1] for call in reserve.await_args_list)
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(first), 12)
+
+    async def test_model_order_id_is_not_used_as_the_reference(self):
+        from backend.orchestrator.tool_registry import inventory_service
+        reserve = AsyncMock(return_value=HOLD)
+        with patch.object(inventory_service, "reserve_cart", new=reserve):
+            await self.registry.initiate_mpesa_stk(
+                phone="254712345678", amount=2500, order_id="ORD-1", customer_id="cust1"
+            )
+        self.assertNotEqual(reserve.await_args.args[1], "ORD-1")
+        self.assertEqual(self.push.await_args.kwargs["account_reference"], reserve.await_args.args[1])
+
+    async def test_out_of_stock_sends_no_push(self):
+        from backend.orchestrator.tool_registry import inventory_service
+        short = AsyncMock(side_effect=ValueError("Insufficient inventory: Red Maxi Dress"))
+        with patch.object(inventory_service, "reserve_cart", new=short):
+            result = await self.registry.initiate_mpesa_stk(phone="254712345678", amount=2500, customer_id="cust1")
+        self.assertEqual(result["status"], "failed")
+        self.assertEqual(result["reason"], "stock")
+        self.assertIn("Red Maxi Dress", result["message"])
+        self.push.assert_not_awaited()
+
+    async def test_failed_push_releases_the_hold(self):
+        from backend.orchestrator.tool_registry import inventory_service
+        self.push.return_value = {"success": False, "error": "PayLink down"}
+        reserve = AsyncMock(return_value=HOLD)
+        with patch.object(inventory_service, "reserve_cart", new=reserve):
+            result = await self.registry.initiate_mpesa_stk(phone="254712345678", amount=2500, customer_id="cust1")
+        self.assertEqual(result["status"], "failed")
+        inventory_service.settle.assert_awaited_once_with(reserve.await_args.args[1], paid=False, customer_id="cust1")
+
+
+class TestPaymentCallback(unittest.IsolatedAsyncioTestCase):
+    def request(self, body):
+        request = MagicMock()
+        request.json = AsyncMock(return_value=body)
+        return request
+
+    async def test_hold_is_settled_without_an_order_row(self):
+        settle = AsyncMock(return_value=2)
+        with patch("backend.api.payments.inventory_service.settle", new=settle), \
+             patch("backend.api.payments.supabase_service.get_order_by_transaction_id", new=AsyncMock(return_value=None)):
+            result = await paylink_payment_callback(self.request({"status": "success", "transaction_id": "TX1"}))
+        self.assertEqual(result, {"status": "received"})
+        settle.assert_awaited_once_with("TX1", paid=True)
+
+    async def test_unknown_transaction_is_404(self):
+        with patch("backend.api.payments.inventory_service.settle", new=AsyncMock(return_value=0)), \
+             patch("backend.api.payments.supabase_service.get_order_by_transaction_id", new=AsyncMock(return_value=None)):
+            with self.assertRaises(HTTPException) as raised:
+                await paylink_payment_callback(self.request({"status": "failed", "transaction_id": "TX9"}))
+        self.assertEqual(raised.exception.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
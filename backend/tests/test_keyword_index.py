@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.services.catalog_service import CatalogSnapshot
+from backend.services.keyword_index import KeywordIndex, analyze, edit_distance, stem
+
+PRODUCTS = [
+    {"id": "p1", "name": "Red Maxi Dress", "price": 2500, "stock_quantity": 2,
+     "category": "Dresses", "description": "Flowing summer dress"},
+    {"id": "p2", "name": "Denim Jacket", "price": 4000, "stock_quantity": 1,
+     "category": "Jackets", "tags": ["denim", "casual"]},
+    {"id": "p3", "name": "Leather Handbags", "price": 3000, "stock_quantity": 5, "category": "Bags"},
+    {"id": "p4", "name": "Blue Dress", "price": 1500, "stock_quantity": 0, "category": "Dresses"},
+]
+
+class TestKeywordIndex(unittest.TestCase):
+    def setUp(self):
+        snapshot = CatalogSnapshot("b1")
+        snapshot.apply(PRODUCTS, replace=True)
+        self.index = KeywordIndex(snapshot)
+
+    def ids(self, *args, **kwargs):
+        return [product_id for product_id, _ in self.index.search(*args, **kwargs)]
+
+    def test_analyze_drops_english_and_swahili_stop_words(self):
+        self.assertEqual(analyze("Je, mna dresses za harusi?"), ["dress", "harusi"])
+        self.assertEqual(analyze("I am looking for jackets please"), ["jacket"])
+
+    def test_stemming(self):
+        self.assertEqual(stem("dresses"), "dress")
+        self.assertEqual(stem("accessories"), "accessory")
+        self.assertEqual(stem("dres"), "dres")
+
+    def test_misspellings_are_matched(self):
+        self.assertEqual(self.ids("nataka dres nyekundu"), ["p1"])
+        self.assertEqual(self.ids("jaket"), ["p2"])
+        self.assertEqual(edit_distance("jaket", "jacket", 1), 1)
+
+    def test_name_hits_rank_above_description_hits(self):
+        results = self.index.search("red dress", in_stock_only=False)
+        self.assertEqual(results[0][0], "p1")
+
+    def test_filters_apply_to_postings(self):
+        self.assertEqual(self.ids("dress"), ["p1"])
+        self.assertEqual(self.ids("dress", in_stock_only=False, max_price=2000), ["p4"])
+        self.assertEqual(self.ids("dress", category="jackets"), [])
+        self.assertEqual(self.ids("denim", category="JACKETS", min_price=3000), ["p2"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,12 +20,11 @@ class TestLLMClient(unittest.IsolatedAsyncioTestCase):
         # Clean up
         del os.environ['USE_MOCK_LLM']
 
-    @mock.patch('backend.orchestrator.llm_client.genai')
-    async def test_real_call_returns_parsed_json(self, mock_genai):
+    @mock.patch('backend.orchestrator.llm_client.llm_gateway')
+    async def test_real_call_returns_parsed_json(self, mock_gateway):
         # Disable mock flag
         os.environ['USE_MOCK_LLM'] = 'false'
-        # Mock Gemini model and response
-        mock_model = mock.Mock()
+        # Mock the shared gateway and Gemini response
         mock_response = mock.Mock()
         mock_response.text = json.dumps({
             "reply_text": "Real response",
@@ -33,15 +32,54 @@ class TestLLMClient(unittest.IsolatedAsyncioTestCase):
             "intent": "greeting",
             "entities": {}
         })
-        mock_model.generate_content.return_value = mock_response
-        mock_genai.GenerativeModel.return_value = mock_model
-        mock_genai.GenerationConfig.return_value = None
+        mock_gateway.generate = mock.AsyncMock(return_value=mock_response)
         # Call generate_response
         result = await generate_response('test prompt')
         self.assertEqual(result['reply_text'], 'Real response')
         self.assertEqual(result['intent'], 'greeting')
+        mock_gateway.generate.assert_awaited_once()
         # Clean up
         del os.environ['USE_MOCK_LLM']
 
+    @mock.patch('backend.orchestrator.llm_client.llm_gateway')
+    async def test_truncated_json_is_repaired_without_extra_call(self, mock_gateway):
+        os.environ['USE_MOCK_LLM'] = 'false'
+        mock_response = mock.Mock()
+        mock_response.text = '```json\n{"reply_text": "We have red dresses", "actions": [{"tool": "get_cart", "params": {}}, {"tool": "add_to'
+        mock_gateway.generate = mock.AsyncMock(return_value=mock_response)
+        result = await generate_response('test prompt')
+        self.assertEqual(result['reply_text'], 'We have red dresses')
+        self.assertEqual(result['actions'], [{"tool": "get_cart", "params": {}}])
+        self.assertEqual(result['intent'], 'unknown')
+        mock_gateway.generate.assert_awaited_once()
+        del os.environ['USE_MOCK_LLM']
+
+    @mock.patch('backend.orchestrator.llm_client.llm_gateway')
+    async def test_unusable_output_gets_one_repair_call(self, mock_gateway):
+        os.environ['USE_MOCK_LLM'] = 'false'
+        broken = mock.Mock(text="Sure, the red dress is KES 2,500.")
+        repaired = mock.Mock(text=json.dumps({
+            "reply_text": "Sure, the red dress is KES 2,500.",
+            "actions": [],
+            "intent": "product_inquiry",
+            "entities": {}
+        }))
+        mock_gateway.generate = mock.AsyncMock(side_effect=[broken, repaired])
+        result = await generate_response('test prompt')
+        self.assertEqual(result['reply_text'], 'Sure, the red dress is KES 2,500.')
+        self.assertEqual(result['intent'], 'product_inquiry')
+        self.assertEqual(mock_gateway.generate.await_count, 2)
+        self.assertEqual(mock_gateway.generate.await_args.kwargs['model'], 'gemini-2.0-flash-lite')
+        del os.environ['USE_MOCK_LLM']
+
+    @mock.patch('backend.orchestrator.llm_client.llm_gateway')
+    async def test_failed_repair_falls_back(self, mock_gateway):
+        os.environ['USE_MOCK_LLM'] = 'false'
+        mock_gateway.generate = mock.AsyncMock(return_value=mock.Mock(text="not json at all"))
+        result = await generate_response('test prompt')
+        self.assertEqual(result['intent'], 'error')
+        self.assertEqual(mock_gateway.generate.await_count, 2)
+        del os.environ['USE_MOCK_LLM']
+
 if __name__ == '__main__':
     asyncio.run(unittest.main())
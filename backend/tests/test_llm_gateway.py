@@ -0,0 +1,98 @@
+import os
+import sys
+import asyncio
+import unittest
+from unittest import mock
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.services.llm_gateway import LLMGateway
+
+class TestLLMGateway(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.gateway = LLMGateway()
+        self.gateway._configured = True
+
+    @mock.patch('backend.services.llm_gateway.genai')
+    async def test_models_are_built_once(self, mock_genai):
+        first = self.gateway.model("gemini-2.0-flash")
+        second = self.gateway.model("gemini-2.0-flash")
+        self.assertIs(first, second)
+        mock_genai.GenerativeModel.assert_called_once_with(model_name="gemini-2.0-flash")
+
+    @mock.patch('backend.services.llm_gateway.genai')
+    async def test_concurrency_is_bounded(self, mock_genai):
+        running = 0
+        peak = 0
+
+        async def generate_content_async(contents, generation_config=None):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return mock.Mock(text="ok")
+
+        mock_genai.GenerativeModel.return_value.generate_content_async = generate_content_async
+        self.gateway._semaphore = asyncio.Semaphore(2)
+
+        results = await asyncio.gather(*(self.gateway.generate_text("hi") for _ in range(5)))
+        self.assertEqual(results, ["ok"] * 5)
+        self.assertEqual(peak, 2)
+        self.assertEqual(self.gateway.metrics["calls"], 5)
+
+    @mock.patch('backend.services.llm_gateway.genai')
+    async def test_timeouts_are_counted(self, mock_genai):
+        async def slow(contents, generation_config=None):
+            await asyncio.sleep(1)
+
+        mock_genai.GenerativeModel.return_value.generate_content_async = slow
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.gateway.generate("hi", timeout=0.01)
+        self.assertEqual(self.gateway.metrics["timeouts"], 1)
+        self.assertEqual(self.gateway.metrics["in_flight"], 0)
+
+    @mock.patch('backend.services.llm_gateway.genai')
+    async def test_usage_is_recorded_per_model(self, mock_genai):
+        usage = mock.Mock(prompt_token_count=120, candidates_token_count=30)
+        mock_genai.GenerativeModel.return_value.generate_content_async = mock.AsyncMock(
+            return_value=mock.Mock(text="ok", usage_metadata=usage)
+        )
+        await self.gateway.generate("hi", model="gemini-2.5-pro")
+        await self.gateway.generate("hi", model="gemini-2.5-pro")
+        stats = self.gateway.model_stats("gemini-2.5-pro")
+        self.assertEqual(stats["calls"], 2)
+        self.assertEqual(stats["input_tokens"], 240)
+        self.assertEqual(stats["output_tokens"], 60)
+        self.assertEqual(self.gateway.model_stats("gemini-2.0-flash")["calls"], 0)
+
+    @mock.patch('backend.services.llm_gateway.genai')
+    async def test_tracked_usage_covers_only_calls_in_the_block(self, mock_genai):
+        usage = mock.Mock(prompt_token_count=120, candidates_token_count=30)
+        mock_genai.GenerativeModel.return_value.generate_content_async = mock.AsyncMock(
+            return_value=mock.Mock(text="ok", usage_metadata=usage)
+        )
+        await self.gateway.generate("hi")
+        with self.gateway.track_usage() as tracked:
+            await self.gateway.generate("hi")
+        await self.gateway.generate("hi")
+        self.assertEqual(tracked["calls"], 1)
+        self.assertEqual(tracked["input_tokens"], 120)
+        self.assertEqual(tracked["output_tokens"], 30)
+
+    @mock.patch('backend.services.llm_gateway.genai')
+    async def test_context_cached_prefix_uses_cached_model(self, mock_genai):
+        cached = mock.Mock()
+        cached.name = "cachedContents/abc"
+        handle = mock_genai.GenerativeModel.from_cached_content.return_value
+        handle.generate_content_async = mock.AsyncMock(return_value=mock.Mock(text="ok"))
+
+        await self.gateway.generate("suffix", model="gemini-2.0-flash", cached_content=cached)
+        await self.gateway.generate("suffix", model="gemini-2.0-flash", cached_content=cached)
+        mock_genai.GenerativeModel.from_cached_content.assert_called_once_with(cached)
+        mock_genai.GenerativeModel.assert_not_called()
+        self.assertEqual(handle.generate_content_async.await_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
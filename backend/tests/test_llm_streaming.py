@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import asyncio
+import unittest
+from unittest import mock
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.orchestrator.llm_client import (
+    ReplyTextExtractor,
+    first_sentence_boundary,
+    generate_response_stream,
+)
+from backend.orchestrator.message_handler import early_reply_delivered, split_streamed_reply
+
+REPLY = {
+    "reply_text": "Habari! We have \"red\" dresses in stock today.\nSize M is KES 2,500 — want one? 😊",
+    "actions": [{"tool": "add_to_cart", "params": {"product_id": "p1"}}],
+    "intent": "product_inquiry",
+    "entities": {}
+}
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestReplyTextExtractor(unittest.TestCase):
+    def test_decodes_across_any_chunk_split(self):
+        for raw in (json.dumps(REPLY), json.dumps(REPLY, ensure_ascii=False)):
+            for size in (1, 2, 5, 13):
+                extractor = ReplyTextExtractor()
+                for chunk in chunked(raw, size):
+                    extractor.feed(chunk)
+                self.assertEqual(extractor.text, REPLY["reply_text"])
+                self.assertTrue(extractor.done)
+                self.assertEqual(extractor.buffer, raw)
+
+    def test_waits_for_the_key(self):
+        extractor = ReplyTextExtractor()
+        self.assertEqual(extractor.feed('{"intent": "greeting", '), "")
+        self.assertEqual(extractor.feed('"reply_text": "Hi'), "Hi")
+        self.assertFalse(extractor.done)
+
+    def test_first_sentence_boundary(self):
+        text = "Habari! We have red dresses in stock today. Size M is KES 2,500"
+        self.assertEqual(first_sentence_boundary(text, 5), len("Habari!"))
+        self.assertEqual(first_sentence_boundary(text, 10), len("Habari! We have red dresses in stock today."))
+        self.assertEqual(first_sentence_boundary("No boundary yet", 5), -1)
+
+
+class TestGenerateResponseStream(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        os.environ['USE_MOCK_LLM'] = 'false'
+
+    def tearDown(self):
+        del os.environ['USE_MOCK_LLM']
+
+    def stream_of(self, raw, size=4):
+        async def stream(*args, **kwargs):
+            for chunk in chunked(raw, size):
+                yield chunk
+        return stream
+
+    @mock.patch('backend.orchestrator.llm_client.llm_gateway')
+    async def test_first_sentence_sent_before_stream_ends(self, mock_gateway):
+        raw = json.dumps(REPLY)
+        progress = {"chunks": 0}
+
+        async def stream(*args, **kwargs):
+            for chunk in chunked(raw, 4):
+                progress["chunks"] += 1
+                yield chunk
+
+        mock_gateway.stream = stream
+        sent = []
+        result = await generate_response_stream(
+            'prompt',
+            on_first_message=lambda text: sent.append((text, progress["chunks"]))
+        )
+
+        self.assertEqual(len(sent), 1)
+        text, chunks_at_send = sent[0]
+        self.assertEqual(text, "Habari! We have \"red\" dresses in stock today.")
+        self.assertLess(chunks_at_send, len(chunked(raw, 4)))
+        self.assertEqual(result["early_text"], text)
+        self.assertEqual(result["reply_text"], REPLY["reply_text"])
+        self.assertEqual(result["actions"], REPLY["actions"])
+
+    @mock.patch('backend.orchestrator.llm_client.llm_gateway')
+    async def test_single_sentence_reply_is_not_split(self, mock_gateway):
+        mock_gateway.stream = self.stream_of(json.dumps({
+            "reply_text": "Karibu! Our shop is open every day from nine to six.",
+            "actions": []
+        }))
+        sent = []
+        result = await generate_response_stream('prompt', on_first_message=sent.append)
+
+        self.assertEqual(sent, [])
+        self.assertNotIn("early_text", result)
+
+    @mock.patch('backend.orchestrator.llm_client.llm_gateway')
+    async def test_stream_failure_after_first_sentence_keeps_decoded_text(self, mock_gateway):
+        raw = json.dumps(REPLY)
+
+        async def stream(*args, **kwargs):
+            for chunk in chunked(raw[:80], 4):
+                yield chunk
+            raise asyncio.TimeoutError()
+
+        mock_gateway.stream = stream
+        sent = []
+        result = await generate_response_stream('prompt', on_first_message=sent.append)
+
+        self.assertEqual(len(sent), 1)
+        self.assertTrue(result["reply_text"].startswith(sent[0]))
+        self.assertEqual(result["actions"], [])
+
+
+class TestSplitStreamedReply(unittest.TestCase):
+    def test_sends_the_rest_after_the_first_sentence(self):
+        reply, saved = split_streamed_reply("Habari! Size M is KES 2,500.", "Habari!", [], False)
+        self.assertEqual(reply, "Size M is KES 2,500.")
+        self.assertEqual(saved, "Habari! Size M is KES 2,500.")
+
+    def test_reply_that_does_not_start_with_the_sent_text_is_sent_in_full(self):
+        reply, saved = split_streamed_reply("Sorry, that dress sold out.", "Habari!", [], False)
+        self.assertEqual(reply, "Sorry, that dress sold out.")
+        self.assertEqual(saved, reply)
+
+    def test_nothing_left_when_the_reply_was_the_first_sentence(self):
+        reply, _ = split_streamed_reply("Habari!", "Habari!", [], False)
+        self.assertEqual(reply, "")
+
+    def test_phrase_spanning_the_split_is_filtered(self):
+        reply, saved = split_streamed_reply("We are the cheapest. Brand in town.", "We are the cheapest.", ["cheapest. Brand"], False)
+        self.assertNotIn("Brand", reply)
+        self.assertIn("[filtered]", reply)
+        self.assertEqual(saved, reply)
+
+    def test_rewritten_reply_is_sent_in_full(self):
+        reply, saved = split_streamed_reply("Habari! Added to your cart.", "Habari!", [], True)
+        self.assertEqual(reply, "Habari! Added to your cart.")
+        self.assertEqual(saved, "Habari! Habari! Added to your cart.")
+
+
+class TestEarlyReplyDelivered(unittest.IsolatedAsyncioTestCase):
+    async def test_sent(self):
+        async def send():
+            return None
+        self.assertTrue(await early_reply_delivered(asyncio.create_task(send())))
+
+    async def test_failed_send_is_reported_not_raised(self):
+        async def send():
+            raise RuntimeError("Twilio unavailable")
+        self.assertFalse(await early_reply_delivered(asyncio.create_task(send())))
+
+
+if __name__ == '__main__':
+    unittest.main()
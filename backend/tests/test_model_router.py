@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.services.model_router import FLASH, PRO, TEMPLATE, ModelRouter
+from backend.services.llm_gateway import llm_gateway
+
+
+class TestModelRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = ModelRouter()
+
+    def test_greetings_and_thanks_use_templates(self):
+        for message in ("hi", "Hello!", "Habari", "good morning 👋", "asante sana", "Thank you!"):
+            route = self.router.route(message)
+            self.assertEqual(route.tier, TEMPLATE, message)
+            self.assertIsNone(route.model)
+
+    def test_greeting_with_a_question_goes_to_a_model(self):
+        self.assertEqual(self.router.route("hi, how much is the red dress?").tier, FLASH)
+
+    def test_lookups_use_flash(self):
+        for message in ("how much is the denim jacket", "do you have size M", "I want to pay", "bei ni ngapi"):
+            route = self.router.route(message)
+            self.assertEqual(route.tier, FLASH, message)
+            self.assertEqual(route.model, self.router.model_for(FLASH))
+
+    def test_images_and_recommendations_use_pro(self):
+        self.assertEqual(self.router.route("this one", has_image=True).tier, PRO)
+        self.assertEqual(self.router.route("what should I wear to a wedding?").tier, PRO)
+        self.assertEqual(self.router.route("I want something elegant for dinner with my in-laws").tier, PRO)
+
+    def test_short_answer_to_agent_question_stays_on_flash(self):
+        history = [{"role": "agent", "content": "Great choice! Which size would you like?"}]
+        self.assertEqual(self.router.route("L", history).tier, FLASH)
+        self.assertEqual(self.router.route("L", history).reason, "follow_up")
+
+    def test_disabled_routing_always_uses_flash(self):
+        self.router.enabled = False
+        self.assertEqual(self.router.route("hi").tier, FLASH)
+        self.assertEqual(self.router.route("recommend an outfit").tier, FLASH)
+
+    def test_stats_report_cost_per_tier(self):
+        pro = self.router.model_for(PRO)
+        response = mock.Mock(usage_metadata=mock.Mock(prompt_token_count=500_000, candidates_token_count=50_000))
+        route = self.router.route("recommend an outfit for a wedding")
+        for _ in range(2):
+            with self.router.track(route):
+                llm_gateway._record(pro, 1500.0, response)
+        # Calls to the same model outside a routed turn (summaries, ...) are not attributed
+        llm_gateway._record(pro, 900.0, response)
+
+        stats = self.router.stats()
+        self.assertEqual(stats["tiers"][PRO]["calls"], 2)
+        self.assertEqual(stats["tiers"][PRO]["avg_latency_ms"], 1500.0)
+        self.assertAlmostEqual(stats["tiers"][PRO]["estimated_cost_usd"], 1.25 + 1.0)
+        self.assertEqual(stats["tiers"][FLASH]["estimated_cost_usd"], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock, patch
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.services.catalog_service import CatalogSnapshot
+from backend.services.product_retrieval_service import ProductRetrievalService
+
+CATALOG = [
+    {"id": "p1", "name": "Floral Summer Dress", "price": 2500, "stock_quantity": 3, "category": "dresses"},
+    {"id": "p2", "name": "Red Maxi Dress", "price": 3000, "stock_quantity": 1, "category": "dresses"},
+    {"id": "p3", "name": "Linen Shirt", "price": 1800, "stock_quantity": 0, "category": "tops"},
+]
+
+class TestProductRetrieval(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.service = ProductRetrievalService()
+        snapshot = CatalogSnapshot("b1")
+        snapshot.apply(CATALOG, replace=True)
+
+        patcher = patch("backend.services.product_retrieval_service.catalog_service")
+        catalog = patcher.start()
+        self.addCleanup(patcher.stop)
+        catalog.get_snapshot = AsyncMock(return_value=snapshot)
+
+    async def test_hybrid_results_are_fused_and_enriched(self):
+        semantic = [{"id": "p1", "name": "Floral Summer Dress", "price": 2500, "similarity": 0.82},
+                    {"id": "p3", "name": "Linen Shirt", "price": 1800, "similarity": 0.7}]
+        keyword = [{"id": "p2", "name": "Red Maxi Dress", "price": 3000},
+                   {"id": "p1", "name": "Floral Summer Dress", "price": 2500}]
+
+        with patch.object(self.service, "semantic_search", AsyncMock(return_value=semantic)), \
+             patch.object(self.service, "keyword_search", AsyncMock(return_value=keyword)):
+            results = await self.service.search("b1", "light dress for a wedding")
+
+        # p1 is found by both retrievers; p3 is out of stock
+        self.assertEqual([p["id"] for p in results], ["p1", "p2"])
+        self.assertEqual(results[0]["stock_quantity"], 3)
+        self.assertEqual(results[0]["similarity"], 0.82)
+
+    async def test_semantic_failure_falls_back_to_keywords(self):
+        with patch.object(self.service, "semantic_search", AsyncMock(side_effect=RuntimeError("no key"))), \
+             patch.object(self.service, "keyword_search", AsyncMock(return_value=[{"id": "p2", "price": 3000}])):
+            results = await self.service.search("b1", "red", max_price=2000)
+
+        self.assertEqual(results, [])
+
+    async def test_backfill_embeds_in_batches(self):
+        self.service.batch_size = 2
+        pages = [[{"id": f"p{i}", "name": f"Item {i}"} for i in range(5)]]
+
+        with patch("backend.services.product_retrieval_service.supabase_service") as supabase:
+            supabase.get_products_missing_embeddings = AsyncMock(side_effect=lambda **kw: pages.pop(0) if pages else [])
+            supabase.update_product_embedding = AsyncMock()
+            embed = AsyncMock(side_effect=lambda texts: [[0.1] * 768 for _ in texts])
+            with patch.object(self.service, "embed_documents", embed):
+                totals = await self.service.backfill_embeddings(page_size=10)
+
+        self.assertEqual(totals, {"embedded": 5, "failed": 0})
+        self.assertEqual(embed.await_count, 3)
+        self.assertEqual(supabase.update_product_embedding.await_count, 5)
+
+if __name__ == '__main__':
+    unittest.main()
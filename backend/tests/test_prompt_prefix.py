@@ -0,0 +1,92 @@
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.orchestrator.context_builder import build_prompt
+from backend.orchestrator.prompt_prefix import PromptPrefixCache
+
+SETTINGS = {"system_prompt": "You sell dresses.", "tone": "casual", "prompt_version": 3}
+MODEL = "gemini-2.0-flash"
+
+
+class TestPromptPrefixCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = PromptPrefixCache()
+        self.cache.remote_enabled = False
+        patcher = patch.dict(os.environ, {"USE_MOCK_LLM": "false"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_compiled_once_per_version(self):
+        first = self.cache.get("b1", SETTINGS, MODEL)
+        self.assertIs(self.cache.get("b1", dict(SETTINGS), MODEL), first)
+        self.assertTrue(first.text.startswith("You sell dresses.\n\nTONE: CASUAL\n\nINSTRUCTIONS:"))
+
+        updated = self.cache.get("b1", {**SETTINGS, "tone": "professional", "prompt_version": 4}, MODEL)
+        self.assertIsNot(updated, first)
+        self.assertIn("TONE: PROFESSIONAL", updated.text)
+        self.assertEqual(self.cache.metrics["compiled"], 2)
+
+    def test_defaults_without_settings(self):
+        prefix = self.cache.get("b1", None, MODEL)
+        self.assertIn("You are a helpful fashion sales assistant.", prefix.text)
+        self.assertIn("TONE: FRIENDLY", prefix.text)
+
+    async def test_small_prefix_stays_local(self):
+        self.cache.remote_enabled = True
+        with patch("backend.orchestrator.prompt_prefix.llm_gateway") as gateway:
+            gateway.api_key = "key"
+            prefix = self.cache.get("b1", SETTINGS, MODEL)
+        self.assertIsNone(prefix.cached_content)
+        gateway.create_context_cache.assert_not_called()
+
+    async def test_large_prefix_registered_as_context_cache(self):
+        self.cache.remote_enabled = True
+        self.cache.min_remote_tokens = 50
+        settings = {**SETTINGS, "system_prompt": "Our policies: " + "returns within seven days. " * 40}
+        remote = Mock(name="cachedContents/abc")
+        with patch("backend.orchestrator.prompt_prefix.llm_gateway") as gateway:
+            gateway.api_key = "key"
+            gateway.create_context_cache = AsyncMock(return_value=remote)
+            prefix = self.cache.get("b1", settings, MODEL)
+            self.assertIsNone(prefix.cached_content)  # registration runs in the background
+            self.cache.get("b1", settings, MODEL)
+            for task in list(self.cache._tasks):
+                await task
+
+        gateway.create_context_cache.assert_awaited_once()
+        self.assertEqual(gateway.create_context_cache.await_args.kwargs["system_instruction"], prefix.text)
+        self.assertIs(prefix.cached_content, remote)
+
+        prompt = await build_prompt({
+            "prefix": prefix, "cached_content": prefix.cached_content, "current_message": "hi there"
+        })
+        self.assertNotIn("Our policies", prompt)
+        self.assertTrue(prompt.startswith("CURRENT CUSTOMER MESSAGE:\nhi there"))
+
+    async def test_failed_registration_falls_back_to_local_prefix(self):
+        self.cache.remote_enabled = True
+        self.cache.min_remote_tokens = 1
+        with patch("backend.orchestrator.prompt_prefix.llm_gateway") as gateway:
+            gateway.api_key = "key"
+            gateway.create_context_cache = AsyncMock(side_effect=RuntimeError("too small"))
+            prefix = self.cache.get("b1", SETTINGS, MODEL)
+            for task in list(self.cache._tasks):
+                await task
+            self.cache.get("b1", SETTINGS, MODEL)  # no immediate retry
+        gateway.create_context_cache.assert_awaited_once()
+        self.assertIsNone(prefix.cached_content)
+
+        prompt = await build_prompt({"prefix": prefix, "current_message": "hi"})
+        self.assertTrue(prompt.startswith("You sell dresses."))
+        self.assertIn("CURRENT CUSTOMER MESSAGE:\nhi", prompt)
+
+
+if __name__ == '__main__':
+    unittest.main()
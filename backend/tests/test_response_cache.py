@@ -0,0 +1,103 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.services.catalog_service import CatalogService
+from backend.services.response_cache import ResponseCache
+
+REPLY = {"reply_text": "We open 9am to 6pm, Monday to Saturday.", "actions": [], "intent": "hours"}
+
+EMBEDDINGS = {
+    "what are your opening hours": [1.0, 0.0, 0.0],
+    "when do you open": [0.97, 0.2, 0.0],
+    "how much is delivery to thika": [0.0, 1.0, 0.0],
+}
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.cache.enabled = True
+        self.cache.similarity_threshold = 0.95
+        patcher = patch(
+            "backend.services.response_cache.product_retrieval_service.embed_query",
+            AsyncMock(side_effect=lambda text: EMBEDDINGS[text])
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def store(self, message, prompt_version=1, catalog_version=1, reply=REPLY):
+        cached, embedding = await self.cache.lookup("b1", message, prompt_version, catalog_version)
+        self.assertIsNone(cached)
+        self.cache.store("b1", message, prompt_version, catalog_version, reply, embedding)
+
+    async def test_exact_hit_ignores_case_and_punctuation(self):
+        await self.store("What are your opening hours?")
+        cached, _ = await self.cache.lookup("b1", "what are your OPENING hours", 1, 1)
+        self.assertEqual(cached, REPLY)
+        self.assertEqual(self.cache.metrics["exact_hits"], 1)
+
+    async def test_semantic_hit_above_threshold_only(self):
+        await self.store("What are your opening hours?")
+        cached, _ = await self.cache.lookup("b1", "When do you open?", 1, 1)
+        self.assertEqual(cached, REPLY)
+        self.assertEqual(self.cache.metrics["semantic_hits"], 1)
+
+        cached, _ = await self.cache.lookup("b1", "How much is delivery to Thika?", 1, 1)
+        self.assertIsNone(cached)
+
+    async def test_version_changes_invalidate(self):
+        await self.store("What are your opening hours?")
+        self.assertIsNone((await self.cache.lookup("b1", "What are your opening hours?", 2, 1))[0])
+
+        await self.store("What are your opening hours?", catalog_version=1)
+        self.assertIsNone((await self.cache.lookup("b1", "What are your opening hours?", 1, 2))[0])
+
+    async def test_reloaded_catalog_does_not_match_replies_from_before_eviction(self):
+        products = [{"id": "p1", "name": "Red Maxi Dress", "price": 2500, "updated_at": "2025-01-01T00:00:00"}]
+        with patch("backend.services.catalog_service.supabase_service") as service:
+            service.client = MagicMock()
+            service.execute = AsyncMock(return_value=SimpleNamespace(data=products))
+            catalog = CatalogService()
+            catalog.max_boutiques = 1
+
+            await self.store("What are your opening hours?", catalog_version=await catalog.version("b1"))
+            await catalog.version("b2")
+            reloaded_version = await catalog.version("b1")
+
+        self.assertEqual(catalog.metrics["evictions"], 2)
+        cached, _ = await self.cache.lookup("b1", "What are your opening hours?", 1, reloaded_version)
+        self.assertIsNone(cached)
+
+    async def test_settings_change_drops_boutique(self):
+        await self.store("What are your opening hours?")
+        self.cache.invalidate("b1")
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    async def test_action_replies_and_short_messages_are_not_cached(self):
+        with_action = dict(REPLY, actions=[{"tool": "add_to_cart", "params": {}}])
+        self.cache.store("b1", "What are your opening hours?", 1, 1, with_action)
+        self.cache.store("b1", "yes", 1, 1, REPLY)
+        self.cache.store("b1", "ok 2", 1, 1, REPLY)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    async def test_follow_ups_in_an_answered_conversation_are_not_cached(self):
+        history = [
+            {"role": "customer", "content": "Do you have the red maxi dress?"},
+            {"role": "agent", "content": "Yes, KES 2,500 in sizes S to L."},
+            {"role": "customer", "content": "How much is delivery to Thika?"},
+        ]
+        await self.store("How much is delivery to Thika?")
+        cached, _ = await self.cache.lookup("b1", "How much is delivery to Thika?", 1, 1, history=history)
+        self.assertIsNone(cached)
+        self.cache.store("b1", "What are your opening hours?", 1, 1, REPLY, history=history)
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import unittest
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.orchestrator.structured_output import JSONRepairParser, parse_reply, repair_json
+
+REPLY = {
+    "reply_text": "Hi \"Amina\" 😊\nThe red dress is KES 2,500.",
+    "actions": [
+        {"tool": "add_to_cart", "params": {"product_id": "p1", "quantity": 12}},
+        {"tool": "get_cart", "params": {}}
+    ],
+    "intent": "cart",
+    "entities": {"budget": 2500.5, "in_stock": True, "size": None}
+}
+
+
+class TestJSONRepairParser(unittest.TestCase):
+    def test_every_prefix_repairs_to_valid_json(self):
+        raw = json.dumps(REPLY)
+        for end in range(1, len(raw) + 1):
+            parser = JSONRepairParser()
+            parser.feed(raw[:end])
+            json.loads(parser.close())
+
+    def test_incremental_feed_matches_whole_input(self):
+        raw = json.dumps(REPLY, ensure_ascii=False)
+        parser = JSONRepairParser()
+        for start in range(0, len(raw), 7):
+            parser.feed(raw[start:start + 7])
+        self.assertTrue(parser.complete)
+        self.assertFalse(parser.repaired)
+        self.assertEqual(json.loads(parser.close()), REPLY)
+
+    def test_unfinished_action_is_dropped(self):
+        raw = json.dumps(REPLY)
+        cut = raw.index('"get_cart"') + 4
+        self.assertEqual(repair_json(raw[:cut])["actions"], REPLY["actions"][:1])
+
+    def test_common_model_mistakes(self):
+        self.assertEqual(
+            repair_json('Here you go:\n```json\n{"reply_text": "a\nb", "actions": [{"tool": "x",},],}\n```'),
+            {"reply_text": "a\nb", "actions": [{"tool": "x"}]}
+        )
+        self.assertEqual(repair_json('{"reply_text": "hi", "ok": tru'), {"reply_text": "hi", "ok": True})
+        self.assertIsNone(repair_json("no json here"))
+
+
+class TestParseReply(unittest.TestCase):
+    def test_validates_and_fills_defaults(self):
+        reply = parse_reply('{"reply_text": "Hello", "actions": null, "intent": null}')
+        self.assertEqual(reply.reply_text, "Hello")
+        self.assertEqual(reply.actions, [])
+        self.assertEqual(reply.intent, "unknown")
+
+    def test_malformed_actions_are_skipped(self):
+        reply = parse_reply(json.dumps({
+            "reply_text": "Done",
+            "actions": [{"tool": "get_cart"}, {"params": {}}, "add_to_cart", {"tool": "x", "params": "size M"}],
+            "intent": "cart"
+        }))
+        self.assertEqual([action.tool for action in reply.actions], ["get_cart"])
+        self.assertEqual(reply.actions[0].params, {})
+
+    def test_missing_reply_text_is_unusable(self):
+        self.assertIsNone(parse_reply('{"actions": [], "intent": "greeting"}'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+import unittest
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.orchestrator.tool_executor import ToolExecutor, scoped_calls
+from backend.orchestrator.tool_registry import ToolRegistry
+
+
+class TestToolExecutor(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.registry = ToolRegistry()
+        self.executor = ToolExecutor(self.registry)
+        self.events = []
+        self.running = 0
+        self.peak = 0
+
+        def fake(name, delay=0.02):
+            async def tool(**params):
+                self.running += 1
+                self.peak = max(self.peak, self.running)
+                self.events.append(f"start {name}")
+                await asyncio.sleep(delay)
+                self.events.append(f"end {name}")
+                self.running -= 1
+                return {"tool": name}
+            return tool
+
+        for name in ("search_products", "get_inventory", "get_cart", "add_to_cart", "initiate_mpesa_stk"):
+            self.registry.tools[name] = fake(name)
+
+    async def test_reads_run_concurrently_and_results_keep_order(self):
+        results = await self.executor.run([
+            ("search_products", {"query": "dress"}), ("get_inventory", {"product_id": "p1"}), ("get_cart", {})
+        ])
+        self.assertEqual([r["tool"] for r in results], ["search_products", "get_inventory", "get_cart"])
+        self.assertEqual(self.peak, 3)
+        self.assertEqual(self.executor.metrics["concurrent_calls"], 3)
+
+    async def test_mutations_are_barriers(self):
+        await self.executor.run([
+            ("get_inventory", {"product_id": "p1"}), ("add_to_cart", {"product_id": "p1"}), ("get_cart", {}),
+            ("initiate_mpesa_stk", {"phone": "254712345678", "amount": 2500})
+        ])
+        self.assertEqual(self.events, [
+            "start get_inventory", "end get_inventory",
+            "start add_to_cart", "end add_to_cart",
+            "start get_cart", "end get_cart",
+            "start initiate_mpesa_stk", "end initiate_mpesa_stk",
+        ])
+
+    async def test_concurrency_limit(self):
+        self.executor.max_concurrency = 2
+        await self.executor.run([("get_cart", {})] * 5)
+        self.assertEqual(self.peak, 2)
+
+    async def test_timeouts_and_unknown_tools_return_errors(self):
+        async def slow(**params):
+            await asyncio.sleep(1)
+        self.registry.tools["get_cart"] = slow
+        self.registry.timeouts["get_cart"] = 0.01
+
+        results = await self.executor.run([("get_cart", {}), ("drop_tables", {})])
+        self.assertIn("timed out", results[0]["error"])
+        self.assertIn("Unknown tool", results[1]["error"])
+        self.assertEqual(self.executor.metrics["timeouts"], 1)
+
+        stats = self.executor.stats()
+        self.assertEqual(stats["tools"]["get_cart"]["errors"], 1)
+        self.assertEqual(stats["tools"]["get_cart"]["latency_ms_le"]["+Inf"], 1)
+        self.assertEqual(stats["tools"]["get_cart"]["latency_ms_le"]["10"], 0)
+
+
+    def test_scope_always_comes_from_the_webhook(self):
+        calls = scoped_calls(
+            [{"tool": "get_cart", "params": {"customer_id": "other", "conversation_id": "c9", "boutique_id": "b9"}}],
+            {"conversation_id": "c1", "boutique_id": "b1", "customer_id": "cust1"}
+        )
+        self.assertEqual(calls, [("get_cart", {"conversation_id": "c1", "boutique_id": "b1", "customer_id": "cust1"})])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import sys
+import unittest
+from unittest.mock import AsyncMock
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.orchestrator.structured_output import RESPONSE_SCHEMA
+from backend.orchestrator.tool_registry import TOOL_SPECS, ToolRegistry
+
+
+class TestToolRegistry(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.registry = ToolRegistry()
+
+    async def test_invalid_arguments_are_rejected_before_running(self):
+        self.registry.tools["initiate_mpesa_stk"] = AsyncMock()
+        result = await self.registry.execute("initiate_mpesa_stk", {
+            "phone": "call me", "amount": -5, "boutique_id": "b1"
+        })
+        self.assertIn("Invalid arguments for initiate_mpesa_stk", result["error"])
+        self.assertIn("phone", result["error"])
+        self.assertIn("amount", result["error"])
+        self.registry.tools["initiate_mpesa_stk"].assert_not_awaited()
+        self.assertEqual(self.registry.rejections, {"initiate_mpesa_stk": 1})
+
+    async def test_valid_arguments_are_coerced_and_scoped(self):
+        self.registry.tools["search_products"] = AsyncMock(return_value=[])
+        await self.registry.execute("search_products", {
+            "query": " red dress ", "max_price": "3000", "made_up": 1,
+            "boutique_id": "b1", "conversation_id": "c1", "customer_id": None
+        })
+        self.registry.tools["search_products"].assert_awaited_once_with(
+            query="red dress", max_price=3000.0, limit=5, boutique_id="b1", conversation_id="c1"
+        )
+
+    def test_function_declarations_are_generated_once(self):
+        declarations = self.registry.function_declarations()
+        self.assertIs(declarations, self.registry.function_declarations())
+        by_name = {d["name"]: d for d in declarations}
+        self.assertEqual(set(by_name), {spec.name for spec in TOOL_SPECS})
+
+        stk = by_name["initiate_mpesa_stk"]["parameters"]
+        self.assertEqual(stk["type"], "OBJECT")
+        self.assertEqual(sorted(stk["required"]), ["amount", "phone"])
+        self.assertEqual(stk["properties"]["amount"]["type"], "NUMBER")
+        self.assertNotIn("order_id", stk["properties"])
+        self.assertTrue(by_name["get_order_status"]["parameters"]["properties"]["order_number"]["nullable"])
+        self.assertNotIn("parameters", by_name["get_cart"])
+
+    def test_manifest_is_compact(self):
+        manifest = self.registry.manifest()
+        self.assertEqual(len(manifest.splitlines()), len(TOOL_SPECS))
+        self.assertIn("- add_to_cart(product_id, quantity?, size?, color?): Add a product", manifest)
+
+    def test_response_schema_covers_every_tool_argument(self):
+        params = RESPONSE_SCHEMA["properties"]["actions"]["items"]["properties"]["params"]["properties"]
+        for spec in TOOL_SPECS:
+            for name in spec.args.model_fields:
+                self.assertIn(name, params, f"{spec.name}.{name} missing from RESPONSE_SCHEMA")
+
+
+if __name__ == '__main__':
+    unittest.main()
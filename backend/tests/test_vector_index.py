@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+# Ensure the backend package is importable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-key")
+
+from backend.services.vector_index import BoutiqueVectorIndex, VectorIndexService, parse_embedding
+
+def cosine(a, b):
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+class TestBoutiqueVectorIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.vectors = rng.normal(size=(50, 768)).astype(np.float32)
+        self.ids = [f"p{i}" for i in range(50)]
+        self.query = self.vectors[3] + 0.1 * rng.normal(size=768).astype(np.float32)
+
+    def expected(self, threshold, count):
+        scored = [(pid, cosine(self.query, v)) for pid, v in zip(self.ids, self.vectors)]
+        scored = [s for s in scored if s[1] > threshold]
+        return sorted(scored, key=lambda s: -s[1])[:count]
+
+    def test_matches_cosine_semantics(self):
+        index = BoutiqueVectorIndex("b1")
+        index.build(self.ids, self.vectors)
+
+        matches = index.search(self.query, match_threshold=-1.0, match_count=5)
+        expected = self.expected(-1.0, 5)
+        self.assertEqual([m[0] for m in matches], [e[0] for e in expected])
+        for (_, got), (_, want) in zip(matches, expected):
+            self.assertAlmostEqual(got, want, places=5)
+
+    def test_threshold_filters_matches(self):
+        index = BoutiqueVectorIndex("b1")
+        index.build(self.ids, self.vectors)
+        matches = index.search(self.query, match_threshold=0.5, match_count=10)
+        self.assertEqual([m[0] for m in matches], ["p3"])
+
+    def test_quantized_index_ranks_like_float(self):
+        index = BoutiqueVectorIndex("b1", quantize=True)
+        index.build(self.ids, self.vectors)
+        matches = index.search(self.query, match_threshold=-1.0, match_count=1)
+        self.assertEqual(matches[0][0], "p3")
+        self.assertAlmostEqual(matches[0][1], cosine(self.query, self.vectors[3]), places=2)
+        self.assertEqual(index._matrix.dtype, np.int8)
+
+    def test_quantized_search_in_blocks_matches_one_pass(self):
+        index = BoutiqueVectorIndex("b1", quantize=True)
+        index.build(self.ids, self.vectors)
+        whole = index.search(self.query, match_threshold=-1.0, match_count=50)
+        with patch("backend.services.vector_index._SEARCH_BLOCK_ROWS", 16):
+            blocked = index.search(self.query, match_threshold=-1.0, match_count=50)
+        self.assertEqual([m[0] for m in blocked], [m[0] for m in whole])
+        for (_, got), (_, want) in zip(blocked, whole):
+            self.assertAlmostEqual(got, want, places=5)
+
+    def test_upsert_and_remove_keep_rows_consistent(self):
+        index = BoutiqueVectorIndex("b1")
+        index.build(self.ids[:3], self.vectors[:3])
+        index.remove("p0")
+        index.upsert("p9", self.vectors[9])
+        index.upsert("p1", self.vectors[9])
+
+        self.assertEqual(len(index), 3)
+        matches = index.search(self.vectors[9], match_threshold=0.99, match_count=5)
+        self.assertEqual(sorted(m[0] for m in matches), ["p1", "p9"])
+
+    def test_batch_search_returns_one_result_list_per_query(self):
+        index = BoutiqueVectorIndex("b1")
+        index.build(self.ids, self.vectors)
+        results = index.search_batch(self.vectors[[4, 7]], match_threshold=0.9, match_count=3)
+        self.assertEqual([r[0][0] for r in results], ["p4", "p7"])
+
+    def test_parse_pgvector_string(self):
+        vector = parse_embedding("[0.5,-1,2]")
+        self.assertEqual(vector.dtype, np.float32)
+        self.assertEqual(vector.tolist(), [0.5, -1.0, 2.0])
+        self.assertIsNone(parse_embedding(None))
+
+class TestVectorIndexService(unittest.TestCase):
+    def test_oversized_boutique_is_checked_again_later(self):
+        service = VectorIndexService()
+        service.oversized_recheck = 900
+        service._oversized["b1"] = time.monotonic()
+        self.assertTrue(service._is_oversized("b1"))
+
+        service._oversized["b1"] = time.monotonic() - 901
+        self.assertFalse(service._is_oversized("b1"))
+        self.assertNotIn("b1", service._oversized)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,15 +5,14 @@ Includes a mock for development to avoid actual API calls.
 """
 
 import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Configure the generative AI client
+from backend.services.llm_gateway import llm_gateway
+from backend.services.model_router import FLASH, model_router
+
 google_api_key = os.getenv("GOOGLE_API_KEY")
-if google_api_key:
-    genai.configure(api_key=google_api_key)
 
 # Environment variable to control mocking
 USE_MOCK_LLM = os.getenv("USE_MOCK_LLM", "false").lower() == "true"
@@ -31,8 +30,7 @@ async def call_ai_model(prompt: str) -> str:
         if not google_api_key:
             raise ValueError("GOOGLE_API_KEY environment variable not set")
 
-        model = genai.GenerativeModel('gemini-pro')
-        response = await model.generate_content_async(prompt)
+        response = await llm_gateway.generate(prompt, model=model_router.model_for(FLASH))
 
         # Accessing the text from the response parts
         if response.parts:
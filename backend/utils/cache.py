@@ -0,0 +1,141 @@
+"""
+In-process Cache Utility
+Bounded LRU cache with per-entry TTL and single-flight loading, used to keep
+hot, rarely-changing rows (AI settings, routing tables, ...) out of the database path.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU cache whose entries expire after a time-to-live.
+
+    get_or_load() is single-flight: concurrent misses for the same key share one
+    loader call instead of stampeding the database.
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._stale_loads: set = set()
+        self.metrics: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, record=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, record: bool = True) -> Any:
+        """
+        Return a live entry or default
+
+        Args:
+            key: Cache key
+            default: Value returned on a miss or expired entry
+            record: Count the lookup in hit/miss metrics
+        """
+        entry = self._data.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                if record:
+                    self.metrics["hits"] += 1
+                return value
+            del self._data[key]
+
+        if record:
+            self.metrics["misses"] += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value, evicting the least recently used entry if full"""
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def invalidate(self, key: Hashable):
+        """Drop a single entry (a load already in flight will not be stored)"""
+        if key in self._inflight:
+            self._stale_loads.add(key)
+        if self._data.pop(key, None) is not None:
+            self.metrics["invalidations"] += 1
+
+    def clear(self):
+        """Drop all entries"""
+        self._stale_loads.update(self._inflight.keys())
+        self._data.clear()
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None
+    ) -> Any:
+        """
+        Return the cached value, loading it once on a miss
+
+        Args:
+            key: Cache key
+            loader: Coroutine factory producing the value; exceptions are not cached
+            ttl: Optional TTL override for the loaded value
+
+        Returns:
+            Cached or freshly loaded value
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            self.metrics["loads"] += 1
+            value = await loader()
+            if key not in self._stale_loads:
+                self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unobserved failure does not log a warning
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+            self._stale_loads.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of cache metrics"""
+        lookups = self.metrics["hits"] + self.metrics["misses"]
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hit_rate": round(self.metrics["hits"] / lookups, 3) if lookups else 0.0,
+            **self.metrics,
+        }
@@ -0,0 +1,91 @@
+-- =====================================================
+-- Conversation Bootstrap RPC
+-- Collapses the per-message setup round trips (customer, conversation,
+-- message insert, history, AI settings) into a single call
+-- =====================================================
+
+-- =====================================================
+-- FUNCTION: bootstrap_conversation
+-- =====================================================
+-- p_messages is a JSON array of inbound customer messages, oldest first:
+--   [{"content": "hi", "attachments": ["https://..."]}, ...]
+-- Returns:
+--   {"customer": {...}, "conversation": {...}, "history": [...], "ai_settings": {...} | null}
+CREATE OR REPLACE FUNCTION bootstrap_conversation(
+    p_boutique_id UUID,
+    p_customer_phone TEXT,
+    p_messages JSONB DEFAULT '[]'::jsonb,
+    p_history_limit INT DEFAULT 8
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_customer customers%ROWTYPE;
+    v_conversation conversations%ROWTYPE;
+    v_history JSONB;
+    v_settings JSONB;
+BEGIN
+    -- Serialize concurrent bootstraps for the same customer so we never
+    -- create two active conversations
+    PERFORM pg_advisory_xact_lock(hashtext(p_boutique_id::text || ':' || p_customer_phone));
+
+    -- 1. Get or create customer
+    INSERT INTO customers (boutique_id, whatsapp_number)
+    VALUES (p_boutique_id, p_customer_phone)
+    ON CONFLICT (boutique_id, whatsapp_number) DO NOTHING;
+
+    SELECT * INTO v_customer
+    FROM customers
+    WHERE boutique_id = p_boutique_id
+      AND whatsapp_number = p_customer_phone;
+
+    -- 2. Get or create active conversation
+    SELECT * INTO v_conversation
+    FROM conversations
+    WHERE boutique_id = p_boutique_id
+      AND customer_id = v_customer.id
+      AND status = 'active'
+    ORDER BY created_at DESC
+    LIMIT 1;
+
+    IF NOT FOUND THEN
+        INSERT INTO conversations (boutique_id, customer_id, customer_phone, status)
+        VALUES (p_boutique_id, v_customer.id, p_customer_phone, 'active')
+        RETURNING * INTO v_conversation;
+    END IF;
+
+    -- 3. Save inbound message(s), keeping arrival order
+    INSERT INTO messages (conversation_id, role, content, attachments, created_at)
+    SELECT
+        v_conversation.id,
+        'customer',
+        COALESCE(m.value->>'content', ''),
+        COALESCE(m.value->'attachments', '[]'::jsonb),
+        clock_timestamp()
+    FROM jsonb_array_elements(p_messages) WITH ORDINALITY AS m(value, ord)
+    ORDER BY m.ord;
+
+    -- 4. Recent history (chronological)
+    SELECT COALESCE(jsonb_agg(to_jsonb(h) ORDER BY h.created_at), '[]'::jsonb) INTO v_history
+    FROM (
+        SELECT *
+        FROM messages
+        WHERE conversation_id = v_conversation.id
+        ORDER BY created_at DESC
+        LIMIT p_history_limit
+    ) h;
+
+    -- 5. AI settings
+    SELECT to_jsonb(s) INTO v_settings
+    FROM boutique_ai_settings s
+    WHERE s.boutique_id = p_boutique_id;
+
+    RETURN jsonb_build_object(
+        'customer', to_jsonb(v_customer),
+        'conversation', to_jsonb(v_conversation),
+        'history', v_history,
+        'ai_settings', v_settings
+    );
+END;
+$$;
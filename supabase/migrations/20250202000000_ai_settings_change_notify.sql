@@ -0,0 +1,38 @@
+-- =====================================================
+-- AI Settings Change Notifications
+-- Lets backend processes invalidate their cached boutique_ai_settings
+-- as soon as a boutique edits its AI configuration
+-- =====================================================
+
+-- =====================================================
+-- FUNCTION: Notify listeners of AI settings changes
+-- =====================================================
+-- Payload: {"boutique_id": "...", "prompt_version": 3} (prompt_version is null on delete)
+CREATE OR REPLACE FUNCTION notify_ai_settings_changed()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_row boutique_ai_settings%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        v_row := OLD;
+    ELSE
+        v_row := NEW;
+    END IF;
+
+    PERFORM pg_notify(
+        'ai_settings_changed',
+        json_build_object(
+            'boutique_id', v_row.boutique_id,
+            'prompt_version', CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE v_row.prompt_version END
+        )::text
+    );
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create trigger (AFTER, so prompt_version reflects the auto-increment)
+CREATE TRIGGER notify_ai_settings_changed
+    AFTER INSERT OR UPDATE OR DELETE ON boutique_ai_settings
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_ai_settings_changed();
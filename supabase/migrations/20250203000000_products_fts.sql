@@ -0,0 +1,95 @@
+-- =====================================================
+-- Product Full-Text Search
+-- Replaces '%keyword%' ilike scans with an indexed tsvector search
+-- =====================================================
+
+-- 'simple' config: catalogs and customer messages mix English and Swahili,
+-- so no language-specific stemming; prefix matching covers plurals
+ALTER TABLE products
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(category, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(tags, '[]'::jsonb)), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED;
+
+-- Composite GIN index so tenant filter and text match are served by one index
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+CREATE INDEX IF NOT EXISTS products_search_vector_idx
+    ON products USING GIN (boutique_id, search_vector);
+
+-- =====================================================
+-- FUNCTION: search_products_fts
+-- =====================================================
+-- Every query word (minus filler words) is matched as a prefix and OR-ed,
+-- so "red dresses" finds "Red Maxi Dress"; results are ordered by ts_rank
+CREATE OR REPLACE FUNCTION search_products_fts(
+    p_boutique_id UUID,
+    p_query TEXT,
+    p_category TEXT DEFAULT NULL,
+    p_min_price DECIMAL DEFAULT NULL,
+    p_max_price DECIMAL DEFAULT NULL,
+    p_limit INT DEFAULT 10
+)
+RETURNS TABLE (
+    id UUID,
+    name VARCHAR,
+    description TEXT,
+    category VARCHAR,
+    price DECIMAL,
+    stock_quantity INTEGER,
+    sizes JSONB,
+    colors JSONB,
+    tags JSONB,
+    image_urls JSONB,
+    rank REAL
+)
+LANGUAGE plpgsql STABLE
+AS $$
+DECLARE
+    v_terms TEXT;
+    v_query tsquery;
+BEGIN
+    SELECT string_agg(term || ':*', ' | ')
+    INTO v_terms
+    FROM unnest(regexp_split_to_array(lower(coalesce(p_query, '')), '[^[:alnum:]]+')) AS term
+    WHERE length(term) > 1
+      AND term <> ALL (ARRAY[
+          'am', 'an', 'and', 'any', 'are', 'can', 'do', 'for', 'have', 'hi', 'hello',
+          'is', 'it', 'like', 'looking', 'me', 'my', 'need', 'of', 'please', 'show',
+          'the', 'to', 'want', 'with', 'you', 'je', 'kwa', 'mna', 'na', 'nataka',
+          'nina', 'ni', 'tafadhali', 'una', 'wa', 'ya', 'za'
+      ]);
+
+    IF v_terms IS NULL THEN
+        RETURN;
+    END IF;
+
+    v_query := to_tsquery('simple', v_terms);
+
+    RETURN QUERY
+    SELECT
+        p.id,
+        p.name,
+        p.description,
+        p.category,
+        p.price,
+        p.stock_quantity,
+        p.sizes,
+        p.colors,
+        p.tags,
+        p.image_urls,
+        ts_rank(p.search_vector, v_query) AS rank
+    FROM products p
+    WHERE p.boutique_id = p_boutique_id
+      AND p.is_active = true
+      AND p.search_vector @@ v_query
+      AND (p_category IS NULL OR lower(p.category) = lower(p_category))
+      AND (p_min_price IS NULL OR p.price >= p_min_price)
+      AND (p_max_price IS NULL OR p.price <= p_max_price)
+    ORDER BY ts_rank(p.search_vector, v_query) DESC, p.name
+    LIMIT p_limit;
+END;
+$$;
@@ -0,0 +1,52 @@
+-- =====================================================
+-- Reply Templates
+-- Per-boutique overrides for the deterministic fast-path replies
+-- =====================================================
+
+-- Keys: greeting, thanks, cart, cart_empty, payment_sent, payment_failed,
+-- order_status, order_not_found, product. Values are text with {placeholders}
+-- (see backend/orchestrator/fast_path.py); missing keys use the built-in
+-- template for the boutique's tone.
+ALTER TABLE boutique_ai_settings
+    ADD COLUMN IF NOT EXISTS reply_templates JSONB DEFAULT '{}'::jsonb;
+
+ALTER TABLE prompt_version_history
+    ADD COLUMN IF NOT EXISTS reply_templates JSONB;
+
+-- Template edits are versioned like the rest of the AI settings
+CREATE OR REPLACE FUNCTION increment_prompt_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Save old version to history
+    IF TG_OP = 'UPDATE' THEN
+        INSERT INTO prompt_version_history (
+            boutique_id, version, system_prompt, tone, 
+            language_style, upsell_rules, do_not_say, reply_templates
+        ) VALUES (
+            OLD.boutique_id, OLD.prompt_version, OLD.system_prompt, 
+            OLD.tone, OLD.language_style, OLD.upsell_rules, OLD.do_not_say,
+            OLD.reply_templates
+        );
+        
+        -- Increment version
+        NEW.prompt_version = OLD.prompt_version + 1;
+    END IF;
+    
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS auto_increment_prompt_version ON boutique_ai_settings;
+
+CREATE TRIGGER auto_increment_prompt_version
+    BEFORE UPDATE ON boutique_ai_settings
+    FOR EACH ROW
+    WHEN (
+        OLD.system_prompt IS DISTINCT FROM NEW.system_prompt OR
+        OLD.tone IS DISTINCT FROM NEW.tone OR
+        OLD.language_style IS DISTINCT FROM NEW.language_style OR
+        OLD.upsell_rules IS DISTINCT FROM NEW.upsell_rules OR
+        OLD.do_not_say IS DISTINCT FROM NEW.do_not_say OR
+        OLD.reply_templates IS DISTINCT FROM NEW.reply_templates
+    )
+    EXECUTE FUNCTION increment_prompt_version();
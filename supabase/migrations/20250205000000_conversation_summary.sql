@@ -0,0 +1,10 @@
+-- =====================================================
+-- Conversation Summary
+-- Rolling summary of turns that have aged out of the prompt
+-- =====================================================
+
+-- summary covers every message up to and including summary_through; newer
+-- messages are sent to the LLM verbatim (see backend/services/conversation_summary.py)
+ALTER TABLE conversations
+    ADD COLUMN IF NOT EXISTS summary TEXT,
+    ADD COLUMN IF NOT EXISTS summary_through TIMESTAMPTZ;
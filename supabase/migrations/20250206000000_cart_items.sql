@@ -0,0 +1,174 @@
+-- =====================================================
+-- Cart Items
+-- One cart per customer, changed only through atomic RPCs that return the
+-- whole cart with totals (no select-then-update from the application)
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS cart_items (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    customer_id UUID NOT NULL REFERENCES customers(id) ON DELETE CASCADE,
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    product_name VARCHAR(255),
+    size VARCHAR(50) NOT NULL DEFAULT '',
+    color VARCHAR(50) NOT NULL DEFAULT '',
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    price DECIMAL(10, 2) NOT NULL,
+    image_url TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Databases that created cart_items by hand: bring them to the same shape
+ALTER TABLE cart_items ADD COLUMN IF NOT EXISTS color VARCHAR(50) NOT NULL DEFAULT '';
+ALTER TABLE cart_items ADD COLUMN IF NOT EXISTS image_url TEXT;
+ALTER TABLE cart_items ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE cart_items ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+
+UPDATE cart_items SET size = '' WHERE size IS NULL;
+ALTER TABLE cart_items ALTER COLUMN size SET DEFAULT '';
+ALTER TABLE cart_items ALTER COLUMN size SET NOT NULL;
+
+-- Merge duplicate lines left by the old select-then-insert path
+WITH merged AS (
+    SELECT
+        (array_agg(id ORDER BY created_at, id))[1] AS keep_id,
+        sum(quantity) AS quantity
+    FROM cart_items
+    GROUP BY customer_id, product_id, size, color
+    HAVING count(*) > 1
+)
+UPDATE cart_items c
+SET quantity = m.quantity
+FROM merged m
+WHERE c.id = m.keep_id;
+
+DELETE FROM cart_items c
+USING cart_items other
+WHERE c.customer_id = other.customer_id
+  AND c.product_id = other.product_id
+  AND c.size = other.size
+  AND c.color = other.color
+  AND (other.created_at, other.id) < (c.created_at, c.id);
+
+-- One line per product variant: the conflict target of cart_add_item
+CREATE UNIQUE INDEX IF NOT EXISTS cart_items_line_idx
+    ON cart_items (customer_id, product_id, size, color);
+
+ALTER TABLE cart_items ENABLE ROW LEVEL SECURITY;
+
+-- =====================================================
+-- FUNCTION: cart_summary
+-- =====================================================
+-- {"customer_id", "items": [...oldest first], "item_count", "subtotal"}
+CREATE OR REPLACE FUNCTION cart_summary(p_customer_id UUID)
+RETURNS JSONB
+LANGUAGE sql STABLE
+AS $$
+    SELECT jsonb_build_object(
+        'customer_id', p_customer_id,
+        'items', coalesce(
+            jsonb_agg(
+                jsonb_build_object(
+                    'id', c.id,
+                    'product_id', c.product_id,
+                    'product_name', c.product_name,
+                    'size', nullif(c.size, ''),
+                    'color', nullif(c.color, ''),
+                    'quantity', c.quantity,
+                    'price', c.price,
+                    'line_total', c.price * c.quantity,
+                    'image_url', c.image_url
+                )
+                ORDER BY c.created_at, c.id
+            ),
+            '[]'::jsonb
+        ),
+        'item_count', coalesce(sum(c.quantity), 0),
+        'subtotal', coalesce(sum(c.price * c.quantity), 0)
+    )
+    FROM cart_items c
+    WHERE c.customer_id = p_customer_id;
+$$;
+
+-- =====================================================
+-- FUNCTION: cart_add_item
+-- =====================================================
+-- Adds to the line's quantity in one statement, so concurrent adds of the
+-- same product never lose an update; name, price and image come from the
+-- product row at the time of the add
+CREATE OR REPLACE FUNCTION cart_add_item(
+    p_customer_id UUID,
+    p_product_id UUID,
+    p_quantity INT DEFAULT 1,
+    p_size TEXT DEFAULT NULL,
+    p_color TEXT DEFAULT NULL,
+    p_boutique_id UUID DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_quantity IS NULL OR p_quantity < 1 THEN
+        RAISE EXCEPTION 'Quantity must be at least 1' USING ERRCODE = '22023';
+    END IF;
+
+    INSERT INTO cart_items (customer_id, product_id, product_name, size, color, quantity, price, image_url)
+    SELECT
+        p_customer_id,
+        p.id,
+        p.name,
+        coalesce(p_size, ''),
+        coalesce(p_color, ''),
+        p_quantity,
+        p.price,
+        p.image_urls->>0
+    FROM products p
+    WHERE p.id = p_product_id
+      AND p.is_active = true
+      AND (p_boutique_id IS NULL OR p.boutique_id = p_boutique_id)
+    ON CONFLICT (customer_id, product_id, size, color) DO UPDATE
+    SET quantity = cart_items.quantity + EXCLUDED.quantity,
+        product_name = EXCLUDED.product_name,
+        price = EXCLUDED.price,
+        image_url = EXCLUDED.image_url,
+        updated_at = NOW();
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Product % not found', p_product_id USING ERRCODE = 'P0002';
+    END IF;
+
+    RETURN cart_summary(p_customer_id);
+END;
+$$;
+
+-- =====================================================
+-- FUNCTION: cart_set_quantity
+-- =====================================================
+-- Sets a line's quantity; zero or less removes the line
+CREATE OR REPLACE FUNCTION cart_set_quantity(
+    p_item_id UUID,
+    p_quantity INT,
+    p_customer_id UUID DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_customer_id UUID;
+BEGIN
+    IF p_quantity <= 0 THEN
+        DELETE FROM cart_items
+        WHERE id = p_item_id
+          AND (p_customer_id IS NULL OR customer_id = p_customer_id)
+        RETURNING customer_id INTO v_customer_id;
+    ELSE
+        UPDATE cart_items
+        SET quantity = p_quantity, updated_at = NOW()
+        WHERE id = p_item_id
+          AND (p_customer_id IS NULL OR customer_id = p_customer_id)
+        RETURNING customer_id INTO v_customer_id;
+    END IF;
+
+    RETURN cart_summary(coalesce(v_customer_id, p_customer_id));
+END;
+$$;
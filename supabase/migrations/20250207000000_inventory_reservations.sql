@@ -0,0 +1,242 @@
+-- =====================================================
+-- Inventory Reservations
+-- Stock is taken from products.stock_quantity with conditional UPDATEs
+-- (never read-then-write from the application) and held against an STK
+-- push until the payment callback confirms or releases it, or the hold
+-- expires and the sweeper puts the stock back
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS inventory_reservations (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    boutique_id UUID REFERENCES boutiques(id) ON DELETE CASCADE,
+    customer_id UUID REFERENCES customers(id) ON DELETE CASCADE,
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    size VARCHAR(50) NOT NULL DEFAULT '',
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    reference VARCHAR(100) NOT NULL,           -- STK account reference / order number
+    checkout_request_id VARCHAR(100),          -- PayLink transaction ID, set after the push
+    status VARCHAR(20) NOT NULL DEFAULT 'held'
+        CHECK (status IN ('held', 'confirmed', 'released', 'expired')),
+    expires_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    settled_at TIMESTAMPTZ
+);
+
+-- Sweeper: only live holds, oldest expiry first
+CREATE INDEX IF NOT EXISTS inventory_reservations_held_expiry_idx
+    ON inventory_reservations (expires_at)
+    WHERE status = 'held';
+
+-- Payment callback lookups
+CREATE INDEX IF NOT EXISTS inventory_reservations_reference_idx
+    ON inventory_reservations (reference);
+CREATE INDEX IF NOT EXISTS inventory_reservations_checkout_idx
+    ON inventory_reservations (checkout_request_id)
+    WHERE checkout_request_id IS NOT NULL;
+
+ALTER TABLE inventory_reservations ENABLE ROW LEVEL SECURITY;
+
+-- =====================================================
+-- FUNCTION: adjust_inventory
+-- =====================================================
+-- Adds (positive) or removes (negative) stock in one statement; never
+-- lets stock go below zero
+CREATE OR REPLACE FUNCTION adjust_inventory(
+    p_product_id UUID,
+    p_change INT
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_stock INTEGER;
+BEGIN
+    UPDATE products
+    SET stock_quantity = stock_quantity + p_change,
+        updated_at = NOW()
+    WHERE id = p_product_id
+      AND stock_quantity + p_change >= 0
+    RETURNING stock_quantity INTO v_stock;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Insufficient inventory for product %', p_product_id USING ERRCODE = 'P0001';
+    END IF;
+
+    RETURN v_stock;
+END;
+$$;
+
+-- =====================================================
+-- FUNCTION: reserve_cart
+-- =====================================================
+-- Holds every line of the customer's cart for p_ttl_seconds, all or
+-- nothing: if any product is short the whole call fails and no stock is
+-- taken. Product rows are locked in id order so concurrent checkouts of
+-- overlapping carts cannot deadlock. Holds the customer still has from an
+-- earlier checkout are released first.
+CREATE OR REPLACE FUNCTION reserve_cart(
+    p_customer_id UUID,
+    p_reference TEXT,
+    p_ttl_seconds INT DEFAULT 600,
+    p_boutique_id UUID DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_wanted INTEGER;
+    v_taken UUID[];
+    v_short TEXT;
+    v_expires_at TIMESTAMPTZ := NOW() + make_interval(secs => p_ttl_seconds);
+BEGIN
+    SELECT count(DISTINCT product_id) INTO v_wanted
+    FROM cart_items
+    WHERE customer_id = p_customer_id;
+
+    IF v_wanted = 0 THEN
+        RAISE EXCEPTION 'Cart is empty' USING ERRCODE = 'P0002';
+    END IF;
+
+    PERFORM 1
+    FROM products
+    WHERE id IN (SELECT product_id FROM cart_items WHERE customer_id = p_customer_id)
+       OR id IN (SELECT product_id FROM inventory_reservations WHERE customer_id = p_customer_id AND status = 'held')
+    ORDER BY id
+    FOR UPDATE;
+
+    -- A new checkout supersedes the customer's earlier, unpaid one
+    PERFORM settle_reservation(NULL, false, p_customer_id);
+
+    WITH wanted AS (
+        SELECT product_id, sum(quantity) AS quantity
+        FROM cart_items
+        WHERE customer_id = p_customer_id
+        GROUP BY product_id
+    ),
+    taken AS (
+        UPDATE products p
+        SET stock_quantity = p.stock_quantity - w.quantity,
+            updated_at = NOW()
+        FROM wanted w
+        WHERE p.id = w.product_id
+          AND p.is_active = true
+          AND p.stock_quantity >= w.quantity
+          AND (p_boutique_id IS NULL OR p.boutique_id = p_boutique_id)
+        RETURNING p.id
+    )
+    SELECT coalesce(array_agg(id), '{}') INTO v_taken FROM taken;
+
+    IF cardinality(v_taken) < v_wanted THEN
+        -- Name the short products; raising rolls back the stock already taken
+        SELECT string_agg(DISTINCT coalesce(c.product_name, c.product_id::text), ', ') INTO v_short
+        FROM cart_items c
+        WHERE c.customer_id = p_customer_id
+          AND c.product_id <> ALL (v_taken);
+        RAISE EXCEPTION 'Insufficient inventory: %', coalesce(v_short, 'cart items') USING ERRCODE = 'P0001';
+    END IF;
+
+    INSERT INTO inventory_reservations (boutique_id, customer_id, product_id, size, quantity, reference, expires_at)
+    SELECT p_boutique_id, p_customer_id, c.product_id, c.size, c.quantity, p_reference, v_expires_at
+    FROM cart_items c
+    WHERE c.customer_id = p_customer_id;
+
+    RETURN jsonb_build_object(
+        'reference', p_reference,
+        'expires_at', v_expires_at,
+        'cart', cart_summary(p_customer_id)
+    );
+END;
+$$;
+
+-- =====================================================
+-- FUNCTION: settle_reservation
+-- =====================================================
+-- Payment callback: confirms the holds of a paid checkout (they are never
+-- returned to stock) or releases the holds of a failed one. p_key is the
+-- PayLink transaction ID or the STK account reference; NULL settles every
+-- hold of p_customer_id.
+CREATE OR REPLACE FUNCTION settle_reservation(
+    p_key TEXT,
+    p_paid BOOLEAN,
+    p_customer_id UUID DEFAULT NULL
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    IF p_key IS NULL AND p_customer_id IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    IF p_paid THEN
+        UPDATE inventory_reservations
+        SET status = 'confirmed', settled_at = NOW()
+        WHERE status = 'held'
+          AND (p_key IS NULL OR checkout_request_id = p_key OR reference = p_key)
+          AND (p_customer_id IS NULL OR customer_id = p_customer_id);
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        RETURN v_count;
+    END IF;
+
+    WITH released AS (
+        UPDATE inventory_reservations
+        SET status = 'released', settled_at = NOW()
+        WHERE status = 'held'
+          AND (p_key IS NULL OR checkout_request_id = p_key OR reference = p_key)
+          AND (p_customer_id IS NULL OR customer_id = p_customer_id)
+        RETURNING product_id, quantity
+    ),
+    restocked AS (
+        UPDATE products p
+        SET stock_quantity = p.stock_quantity + r.quantity,
+            updated_at = NOW()
+        FROM (SELECT product_id, sum(quantity) AS quantity FROM released GROUP BY product_id) r
+        WHERE p.id = r.product_id
+    )
+    SELECT count(*) INTO v_count FROM released;
+    RETURN v_count;
+END;
+$$;
+
+-- =====================================================
+-- FUNCTION: release_expired_reservations
+-- =====================================================
+-- One sweeper batch: expires up to p_limit overdue holds and puts their
+-- stock back. SKIP LOCKED lets several instances sweep at once without
+-- waiting on each other or on a callback settling the same rows.
+CREATE OR REPLACE FUNCTION release_expired_reservations(p_limit INT DEFAULT 200)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    WITH overdue AS (
+        SELECT id
+        FROM inventory_reservations
+        WHERE status = 'held'
+          AND expires_at < NOW()
+        ORDER BY expires_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ),
+    expired AS (
+        UPDATE inventory_reservations r
+        SET status = 'expired', settled_at = NOW()
+        FROM overdue o
+        WHERE r.id = o.id
+        RETURNING r.product_id, r.quantity
+    ),
+    restocked AS (
+        UPDATE products p
+        SET stock_quantity = p.stock_quantity + e.quantity,
+            updated_at = NOW()
+        FROM (SELECT product_id, sum(quantity) AS quantity FROM expired GROUP BY product_id) e
+        WHERE p.id = e.product_id
+    )
+    SELECT count(*) INTO v_count FROM expired;
+    RETURN v_count;
+END;
+$$;